@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+    #-------------------------------------------------------------------------------
+    # Name:        BULK WRITER
+    # Purpose:     Shared streaming writer of the indexers: takes the documents one at a
+    #              time (e.g. from a generator), and posts them to a Solr collection in
+    #              json batches of at most BATCH_SIZE documents and MAX_BATCH_BYTES bytes,
+    #              over the pooled session of solr_client. The batches are sent with
+    #              commitWithin instead of a commit per batch (by default, there is also 1
+    #              hard commit at the end), and up to MAX_IN_FLIGHT of them are sent at the
+    #              same time: when they are all in flight, adding a document waits
+    #              (backpressure), so the memory used stays flat however many documents are
+    #              written. The progress is reported in docs/sec.
+    #              The indexers must put scientificpaperoperations on sys.path first.
+    #-------------------------------------------------------------------------------
+
+"""
+import json
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from time import time
+from papersearchengine.solr_client import post_update, SolrError
+
+# Max. no. of documents in 1 batch
+BATCH_SIZE = 1000
+# Max. size of the json of 1 batch (a bigger document is sent alone)
+MAX_BATCH_BYTES = 8 * 1024 * 1024
+# Solr makes the documents searchable at most this many milliseconds after a batch is received
+COMMIT_WITHIN = 30000
+# Max. no. of batches sent to Solr at the same time
+MAX_IN_FLIGHT = 4
+# Seconds between 2 progress reports
+REPORT_INTERVAL = 10
+
+class BulkWriter:
+    """ Writes documents to a Solr collection in batches (see the module docstring). Use it as a context
+    manager, or call close() at the end: it sends the last batch, waits for all the batches and, if
+    commit is True, commits, so that the documents are searchable when it returns (else they are
+    searchable after commit_within). """
+
+    def __init__(self, collection, batch_size=BATCH_SIZE, max_batch_bytes=MAX_BATCH_BYTES,
+                 commit_within=COMMIT_WITHIN, max_in_flight=MAX_IN_FLIGHT, commit=True):
+        self.collection = collection
+        self.batch_size = batch_size
+        self.max_batch_bytes = max_batch_bytes
+        self.commit_within = commit_within
+        self.commit = commit
+        # Serialized documents of the next batch, and their size in bytes
+        self.batch = []
+        self.batch_bytes = 0
+        self.executor = ThreadPoolExecutor(max_workers=max_in_flight)
+        # Released when a batch is done: limits the no. of batches in flight (and in memory)
+        self.slots = threading.BoundedSemaphore(max_in_flight)
+        self.in_flight = deque()
+        self.num_docs = 0
+        self.start_time = time()
+        self.last_report = self.start_time
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            # Don't send the last batch or commit, and let the error of the indexing run through
+            self.abort()
+
+    def add(self, document):
+        """ Adds a document (a dict) to the next batch, and sends the batch if it is full. """
+        serialized = json.dumps(document).encode('utf-8')
+        if self.batch and self.batch_bytes + len(serialized) + 1 > self.max_batch_bytes:
+            self.flush()
+        self.batch.append(serialized)
+        self.batch_bytes += len(serialized) + 1
+        self.num_docs += 1
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def add_all(self, documents):
+        """ Adds the documents of an iterable (e.g. a generator, which is consumed as the batches are sent). """
+        for document in documents:
+            self.add(document)
+
+    def flush(self):
+        """ Sends the next batch in the background, waiting first if MAX_IN_FLIGHT batches are in flight. """
+        if not self.batch:
+            return
+        body = b'[' + b','.join(self.batch) + b']'
+        num_docs = len(self.batch)
+        self.batch = []
+        self.batch_bytes = 0
+        self.slots.acquire()
+        # Forget the batches which are done, raising the error of a batch which failed as soon as possible
+        for done_future in [future for future in self.in_flight if future.done()]:
+            self.in_flight.remove(done_future)
+            done_future.result()
+        future = self.executor.submit(self.post_batch, body, num_docs)
+        future.add_done_callback(lambda future: self.slots.release())
+        self.in_flight.append(future)
+        self.report()
+
+    def post_batch(self, body, num_docs):
+        """ Posts 1 batch to Solr. Raises SolrError if Solr rejects it. """
+        response = post_update(self.collection, body, {'commitWithin': self.commit_within, 'wt': 'json'})
+        if not response.ok:
+            raise SolrError("Solr returned {} for a batch of {} documents for {}: {}".format(
+                response.status_code, num_docs, self.collection, response.text[:500]))
+
+    def report(self, force=False):
+        """ Prints the no. of documents written and the rate, every REPORT_INTERVAL seconds. """
+        now = time()
+        if force or now - self.last_report >= REPORT_INTERVAL:
+            self.last_report = now
+            print("{}: {} docs, {:.0f} docs/sec".format(self.collection, self.num_docs,
+                                                       self.num_docs / max(now - self.start_time, 1e-9)))
+
+    def close(self, commit=None):
+        """ Sends the last batch, waits for all the batches (raising the first error) and commits if
+        commit (by default the commit of the constructor) is True. Returns the no. of documents. """
+        commit = self.commit if commit is None else commit
+        try:
+            self.flush()
+            while self.in_flight:
+                self.in_flight.popleft().result()
+        finally:
+            self.executor.shutdown(wait=True)
+        if commit:
+            response = post_update(self.collection, b'[]', {'commit': 'true', 'wt': 'json'})
+            if not response.ok:
+                raise SolrError("Solr returned {} for the commit of {}".format(response.status_code, self.collection))
+        self.report(force=True)
+        return self.num_docs
+
+    def abort(self):
+        """ Ends a failed run: drops the next batch, waits for the batches in flight (ignoring their
+        errors) and doesn't commit. The batches which were already sent stay in the collection (Solr
+        can't roll them back), and are searchable after commit_within, like in a run which succeeds. """
+        self.batch = []
+        self.batch_bytes = 0
+        try:
+            while self.in_flight:
+                self.in_flight.popleft().exception()
+        finally:
+            self.executor.shutdown(wait=True)
+
+def write_documents(collection, documents, **kwargs):
+    """ Writes the documents of an iterable to the collection with a BulkWriter (kwargs are passed to
+    it), and returns the no. of documents. """
+    with BulkWriter(collection, **kwargs) as writer:
+        writer.add_all(documents)
+    return writer.num_docs
+
+def map_bounded(executor, function, iterable, max_pending):
+    """ Like executor.map, but submits at most max_pending tasks ahead of the results which were
+    consumed, so that the results of the worker processes don't pile up in memory when they are
+    produced faster than they are written. Yields the results in order. """
+    pending = deque()
+    for item in iterable:
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+        pending.append(executor.submit(function, item))
+    while pending:
+        yield pending.popleft().result()
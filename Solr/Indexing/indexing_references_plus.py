@@ -4,7 +4,14 @@
     # Name:        CREATE REFERENCES PLUS
     # Purpose:     Uses indices for references, papers, metadata and arxiv-metadata
     #              and inserts data into a new index 'references_plus' which adds
-    #              data from the other indices to the references index
+    #              data from the other indices to the references index.
+    #              2 build modes: single-pass (default) scans the sentences of the
+    #              txt files once, extracts their annotations and joins them with a
+    #              dictionary of all the refs files, without any search in papers.
+    #              per-annotation searches the papers index for the sentences of
+    #              each annotation of the refs files.
+    #
+    #              Usage: python indexing_references_plus.py [--mode single-pass|per-annotation]
     #
     # Author:      Ashwath Sampath
     #
@@ -13,27 +20,53 @@
     #-------------------------------------------------------------------------------
 
 """
+import argparse
+import hashlib
 import os
 import csv
+import re
 from collections import defaultdict
-import requests
-import datetime
-import pysolr
+import sys
 from glob import iglob, glob
+from itertools import chain
 from time import time
 import concurrent.futures
 
-# Make a connection to Solr
-solr = pysolr.Solr('http://localhost:8983/solr/references_plus')
+# The Solr client module lives in the Django app (it doesn't import Django)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..',
+                                'scientificpaperoperations'))
+from papersearchengine.solr_client import select
+from papersearchengine.records import POLARITY_NAMES
+from papersearchengine.model_registry import get_citation_model
+from metadata_join import add_paper_metadata, CITING_FIELD_NAMES
+from bulk_writer import write_documents, map_bounded
+
+# No. of sentences classified in 1 call to the citation model
+CLASSIFY_BATCH_SIZE = 10000
+# Max. no. of files parsed by the workers ahead of the records written to Solr
+MAX_PENDING_FILES = 64
+# Folder with the txt (sentences) and refs (annotations and cited papers) files
+DATASET_FOLDERPATH = '/home/ashwath/Files/arxiv-cs-dataset-LREC2018/'
+# Annotations which are very bad data: they would match millions of sentences
+BAD_ANNOTATIONS = ('GC', 'GC:', "DBLP", 'DBLP:', 'dblp', 'dblp:')
+# An annotation in a sentence, e.g. <GC:12345> or <DBLP:conf/acl/Smith10>. Tokens which aren't
+# annotations of a refs file (e.g. <formula>) are dropped by the join with the refs dictionary.
+ANNOTATION_PATTERN = re.compile(r'<([^<>\n]+)>')
+
+# Single-pass mode: annotation (without < and >) -> (cited paper details, refs file name), built
+# from all the refs files before the txt files are scanned (inherited by the forked workers)
+references = {}
+# Per-annotation mode: annotations already searched in papers by this process
+searched_annotations = set()
 
 def search_solr(query, collection, search_field, num_rows):
     """ Searches the specified collection on the specified search_field (and a
     specified no. of rows) and fetches and retuens results using parse_json"""
-    solr_url = 'http://localhost:8983/solr/' + collection + '/select'
     # Exact search only
     query = '"' + query + '"'
     url_params = {'q': query, 'rows': num_rows, 'df': search_field}
-    solr_response = requests.get(solr_url, params=url_params)
+    # Pooled keep-alive session with timeouts and retries, shared with the Django app
+    solr_response = select(collection, url_params)
     if solr_response.ok:
         data = solr_response.json()
         return parse_json(data, collection)
@@ -47,10 +80,6 @@ def parse_json(data, collection):
     returns whatever the parser returns, along with the query and
     num_responses, which it gets from the json response. If there
     are no results, it returns ([], query, 0)"""
-    # FIRST (only applies to references_plus index), check if this
-    # annotation is already present
-    if collection == 'references_plus':
-        return parse_references_plus_json(data)
     # query is the actual phrase searched in Solr
     query = data['responseHeader']['params']['q']
     num_responses = data['response']['numFound']
@@ -58,26 +87,10 @@ def parse_json(data, collection):
         return []
     if collection == 'papers':
         results = parse_sentence_json(data)
-    elif collection == 'arxiv_metadata':
-        results = parse_arxiv_metadata_json(data)
-    elif collection == 'metadata':
-        results = parse_metadata_json(data)
     elif collection == 'references':
         results = parse_refs_json(data)
     return results
 
-def parse_references_plus_json(data):
-    """ Function to parse the json response from the references_plus collection
-    in Solr (which is being built using this program). It returns the num_results
-    only. As the same annotation is present in multiple refs files, we want to only
-    search for it once in the papers index (we add everything in this one time). So,
-    searching again will result in duplicate values getting inserted. So this returns 0 if
-    it is indeed a new record, a number greater than 0 (num_responses) otherwise"""
-    # docs contains sentence, fileName, id generated by Solr
-    num_responses = data['response']['numFound']
-    #print("NUMBER OF RESPONSES", num_responses)
-    return num_responses
-
 def parse_sentence_json(data):
     """ Function to parse the json response from the papers collection
     in Solr. It returns the results as a list with the sentence, file name
@@ -90,41 +103,73 @@ def parse_sentence_json(data):
                 for i in range(len(docs))]
     return results
 
-def parse_arxiv_metadata_json(data):
-    """ Function to parse the json response from the metadata or the
-    arxiv_metadata collections in Solr. It returns the results as a
-    list with the sentence, file name and title."""
-    # docs contains authors, title, id generated by Solr, url
-    docs = data['response']['docs']
-    # NOTE: there are records without authors and urls. This is why the
-    # get method is always used to get the value instead of getting the value
-    # by applying the [] operator on the key.
-    results = [[docs[i].get('title'), docs[i].get('authors'),
-                docs[i].get('url'), docs[i].get('published_date')]
-                for i in range(len(docs))]
-    return results
+def classify_citation_polarity(solr_records):
+    """ Adds the citation polarity (positive, neutral or negative) of the citing sentence, predicted by the citation
+    model created by create_ml_model.py, to each of the records. The sentences are vectorized and predicted
+    CLASSIFY_BATCH_SIZE at a time, so the search doesn't have to run the model on every query."""
+    # The pipeline is loaded once per process (see model_registry.py)
+    text_pipeline = get_citation_model()
+    for start in range(0, len(solr_records), CLASSIFY_BATCH_SIZE):
+        batch = solr_records[start:start + CLASSIFY_BATCH_SIZE]
+        polarities = text_pipeline.predict([solr_record['citing_sentence'] for solr_record in batch])
+        for solr_record, polarity in zip(batch, polarities):
+            solr_record['citation_polarity'] = POLARITY_NAMES[polarity]
 
-def parse_metadata_json(data):
-    """ Function to parse the json response from the metadata or the
-    arxiv_metadata collections in Solr. It returns the dblp url.
-    docs is a list of one result, so this is obtained by docs[0].get('url')"""
-    # docs contains authors, title, id generated by Solr, url
-    docs = data['response']['docs']
-    # NOTE: there are records without authors and urls. This is why the
-    # get method is always used to get the value instead of getting the value
-    # by applying the [] operator on the key.
+def normalize_arxiv_identifier(name):
+    """ Returns the arxiv identifier in a file name or path (a txt or refs file, or the fileName of a
+    papers doc), e.g. /dataset/1801.01234.txt -> 1801.01234. An identifier is returned unchanged. """
+    return '.'.join(os.path.basename(name).split('.')[:2])
+
+def citation_record_id(arxiv_identifier, sentence, annotation):
+    """ Returns the primary key of a references_plus record: citing_arxiv_identifier.sentencekey|annotation.
+    The sentence key is a hash of the citing sentence, as the papers index searched by the per-annotation
+    mode has no sentence numbers: both modes give the same id to a citation, so a rebuild in either mode
+    overwrites the records instead of duplicating them (the same sentence twice in a paper is 1 record). """
+    sentence_key = hashlib.sha1(sentence.strip().encode('utf-8')).hexdigest()[:16]
+    return '{}.{}|{}'.format(arxiv_identifier, sentence_key, annotation)
 
-    dblp_url = docs[0].get('url')
-    return dblp_url
+def build_record(annotation, details, reference_filename, sentence, arxiv_identifier, sentencenum):
+    """ Returns the references_plus record of 1 citation: the annotation (without < and >) and cited paper
+    details from a refs file and the citing sentence. sentencenum is None in the per-annotation mode. """
+    arxiv_identifier = normalize_arxiv_identifier(arxiv_identifier)
+    solr_record = {}
+    # NOTE: Annotations in the refs files don't have < and >
+    solr_record['annotation'] = '<{}>'.format(annotation)
+    # Deterministic primary key: adding the same citation again overwrites its record
+    solr_record['id'] = citation_record_id(arxiv_identifier, sentence, solr_record['annotation'])
+    solr_record['cited_paper_details'] = details
+    # Debug field: can be used to find records created from a particular (refs) file
+    solr_record['reference_filename'] = reference_filename
+    if sentencenum is not None:
+        solr_record['citing_sentencenum'] = sentencenum
+    solr_record['citing_sentence'] = sentence
+    solr_record['citing_arxiv_identifier'] = arxiv_identifier
+    # Key used by Solr to group the sentences of a citing paper with the same citation
+    solr_record['citation_group'] = '{}|{}'.format(arxiv_identifier, solr_record['annotation'])
+    # Offsets of the annotation in the sentence, used to highlight it in the results. Plain find, as
+    # the annotation may contain regex metacharacters.
+    annotation_start = sentence.find(solr_record['annotation'])
+    if annotation_start != -1:
+        solr_record['annotation_start'] = annotation_start
+        solr_record['annotation_end'] = annotation_start + len(solr_record['annotation'])
+    # Title, authors, dates and urls of the citing paper from the arxiv_metadata and metadata
+    # indices, looked up once per citing paper (and cached), see metadata_join.py
+    add_paper_metadata(solr_record, arxiv_identifier, CITING_FIELD_NAMES)
+    return solr_record
 
 def parse_file_build_records(filename):
     """ Read 1 refs file, which havs annotations with their associated details (cited papers)
-    Go through each annotation, details pair in this file, check if the  annotation is already in the
-    index. If yes, continue to the next line without doing anything. If no, search the papers index
-    for the annotation. Get the sentence and the citing paper's arxiv identifier. This is then used to
-    query the 2 metadata indices and get the relevant fields, which are added to the new Solr index.
+    Go through each annotation, details pair in this file and, if the annotation wasn't searched yet by
+    this process, search the papers index for the annotation. Get the sentence and the citing paper's
+    arxiv identifier. This is then used to query the 2 metadata indices and get the relevant fields,
+    which are added to the new Solr index. The id of each record is derived from the citation, so
+    adding it again (from another refs file, process or run) overwrites it instead of duplicating it.
+    Returns the records of the file.
     Solr field definition for new Solr index references_plus:
 
+    <!-- Primary key: citing_arxiv_identifier.sentencekey|annotation (computed here, see citation_record_id)-->
+    <field name="id" type="string" indexed="true" stored="true" required="true" multiValued="false"/>
+
     <!-- REFS file fields: cited paper-->
     <field name="annotation" type="string" indexed="true" stored="true" multiValued="false"/>
     <field name="cited_paper_details" type="text_classic" indexed="true" stored="true" multiValued="false"/>
@@ -147,32 +192,39 @@ def parse_file_build_records(filename):
     <!-- meta field: dblp_url-->
     <field name="citing_dblp_url" type="string" indexed="true" stored="true" multiValued="false"/>
 
+    <!-- Display date and offsets of the annotation in citing_sentence (computed here)-->
+    <field name="citing_published_date_display" type="string" indexed="false" stored="true" docValues="false" multiValued="false"/>
+    <field name="annotation_start" type="pint" indexed="false" stored="true" docValues="false" multiValued="false"/>
+    <field name="annotation_end" type="pint" indexed="false" stored="true" docValues="false" multiValued="false"/>
+
+    <!-- Grouping key: citing_arxiv_identifier|annotation-->
+    <field name="citation_group" type="string" indexed="true" stored="false" docValues="true" multiValued="false"/>
+
+    <!-- Citation polarity of citing_sentence, predicted by the citation model (computed here)-->
+    <field name="citation_polarity" type="string" indexed="true" stored="true" docValues="true" multiValued="false"/>
+
 
      """
     with open(filename, 'r') as file:
-        filename_without_extension = '.'.join(filename.split('.')[:2])
-        # Initialize list_for_solr: I insert once into Solr for the results from one file
+        filename_without_extension = normalize_arxiv_identifier(filename)
+        # Initialize list_for_solr: the records of all the results from one file
         list_for_solr = []
         # Create a CSV reader for the current file, the fields are inserted in a list
         # [annotation, details, emtpyfiled] for a line annotation;details;
         csv_reader = csv.reader(file, delimiter=';')
         for record in csv_reader:
         #for annotation, details, dummy in csv_reader:
-            # Go through each annotation, details pair in this file, check if the
-            # annotation is already in the index. If yes, continue to the next line
-            # without doing anything. If no, search the papers index for the annotation.
-            # Get the sentence and the citing paper's arxiv identifier. This is then used
-            # to query the 2 metadata indices and get the relevant fields, which are added to
-            # the final index.
-            # num_results returned for references_plus. If it is >0, don't do anything. If it is
-            # 0, add the solr record. (Note, the num_rows argument is set to a value higher than
-            # 0 : can also be 1)
+            # Go through each annotation, details pair in this file and search the papers index for
+            # the annotation (once per process). Get the sentence and the citing paper's arxiv identifier.
+            # This is then used to get the metadata of the citing paper, which is added to the final index.
+            # The records have deterministic ids, so indexing an annotation again (in another process, or
+            # another run) overwrites its records instead of adding duplicates.
             try:
                 # Lines which do not have 2 semicolons are skipped -- they will not be indexed.
                 annotation = record[0]
                 # There is some very bad data like just GC or DBLP. Do not process this, skip to next
                 # record. This will produce millions of extra rows from papers
-                if annotation in ('GC', 'GC:', "DBLP", 'DBLP:', 'dblp', 'dblp:'):
+                if annotation in BAD_ANNOTATIONS:
                     continue
                 details = record[1]
                 dummy = record[2]
@@ -180,9 +232,11 @@ def parse_file_build_records(filename):
                 # Just go to the next line
                 continue
 
-            if search_solr(annotation, 'references_plus', 'annotation', 1) == 0:
+            if annotation not in searched_annotations:
+                searched_annotations.add(annotation)
                 # papers_result is a list of lists with 3 fields in each sublist: sentence (string),
-                # arxiv_identifier (string), sentencenum (integer).
+                # fileName (string, normalized to the arxiv identifier in build_record), sentencenum
+                # (None: the papers index doesn't have it).
 
                 papers_result = search_solr(annotation, 'papers', 'sentence', 100000)
 
@@ -190,59 +244,88 @@ def parse_file_build_records(filename):
                 for sentence, arxiv_identifier, sentencenum in papers_result:
                     # IF NO RESULTS ARE FOUND, paper_result = [] and this loop is not entered.
                     # It goes to the next line in the outer for loop (annotation, details)
-                    solr_record = {}
-                    # NOTE: Annotations in the refs files don't have < and >
-                    solr_record['annotation'] = '<{}>'.format(annotation)
-                    solr_record['cited_paper_details'] = details
-                    # Debug field: can be used to find records created from a particular (refs) file
-                    solr_record['reference_filename'] = filename_without_extension
-                    solr_record['citing_sentencenum'] = sentencenum
-                    solr_record['citing_sentence'] = sentence
-                    solr_record['citing_arxiv_identifier'] = arxiv_identifier
-                    # arxiv_metadata_result will be a list of lists with each list containing title (string),
-                    # authors (list), arxiv url (string), published_dates (list)
-                    arxiv_metadata_result = search_solr(arxiv_identifier, 'arxiv_metadata', 'arxiv_identifier', 1)
-                    # IMPORTANT!: None is returned if there is no dblp_url. If None, set it to 'unavailable'. This
-                    # is checked in Django and the DBLP URL is deactivated with a message if it is 'unavailable'.
-                    dblp_url = search_solr(arxiv_identifier, 'metadata', 'arxiv_identifier', 1)
-                    dblp_url = dblp_url if dblp_url is not None else 'unavailable'
-                    solr_record['citing_dblp_url'] = dblp_url
-                    for title, authors, arxiv_url, published_dates in arxiv_metadata_result:
-                        # Flatten the published dates into a single string. Not using a DateRange field because
-                        # a grouping is done in django_paper_search which needs the dates to be a single string
-                        if len(published_dates) == 1:
-                            solr_record['citing_published_date'] = published_dates[0]
-                            solr_record['citing_revision_dates'] = 'unavailable'
-                        else:
-                            solr_record['citing_published_date'] = published_dates[0]
-                            revision = ';'.join([datetime.datetime.strptime(pdate[:10], '%Y-%m-%d').strftime('%B %d, %Y') for pdate in published_dates[1:]])
-                            solr_record['citing_revision_dates'] = 'revised on {}'.format(revision)
-                        #published_dates = ';'.join([datetime.datetime.strptime(pdate[:10], '%Y-%m-%d').strftime('%Y-%m-%d') for  pdate in published_dates])
-                        #print(published_dates)
-                        solr_record['citing_paper_title'] = title
-                        solr_record['citing_paper_authors'] = '; '.join(authors)
-                        solr_record['citing_arxiv_url'] = arxiv_url
+                    solr_record = build_record(annotation, details, filename_without_extension,
+                                               sentence, arxiv_identifier, sentencenum)
                     list_for_solr.append(solr_record)
-        # As the refs input data is very low quality, a check is needed to see if the same annotation occurs twice in the same file
-        # All the fields are strings or numbers, there are no lists within the dictionaries. REMOVE all duplicate dictionaries (this will
-        # happen if the same annotation appears twice in the same file)
-        unique_sets = set(frozenset(d.items()) for d in list_for_solr)
-        unique_dicts = [dict(s) for s in unique_sets]
-        # Add to Solr
-        solr.add(unique_dicts)
-        print("Inserted list length =", len(unique_dicts))
+        # Classify all the sentences of the file (in batches)
+        classify_citation_polarity(list_for_solr)
+        return list_for_solr
 
 
+def read_references(folderpath=DATASET_FOLDERPATH):
+    """ Single-pass mode: reads all the refs files (sorted, so that the build is repeatable) into the
+    references dictionary: annotation -> (cited paper details, refs file name). As in the per-annotation
+    mode, where an annotation is indexed once, the details of its first refs file are kept. """
+    for filepath in sorted(glob(os.path.join(folderpath, '*.refs'))):
+        filename_without_extension = normalize_arxiv_identifier(filepath)
+        with open(filepath, 'r') as file:
+            # [annotation, details, emtpyfiled] for a line annotation;details;
+            for record in csv.reader(file, delimiter=';'):
+                # Lines which do not have 2 semicolons are skipped -- they will not be indexed.
+                if len(record) < 3 or record[0] in BAD_ANNOTATIONS:
+                    continue
+                if record[0] not in references:
+                    references[record[0]] = (record[1], filename_without_extension)
+    print("Read {} annotations from the refs files".format(len(references)))
+
+def load_references():
+    """ Initializer of the single-pass workers: the dictionary is inherited from the parent process
+    when the workers are forked, it is only read again where they are spawned. """
+    if not references:
+        read_references()
+
+def parse_sentences_build_records(filepath):
+    """ Single-pass mode: reads 1 txt file (the sentences of a citing paper), extracts the annotations
+    of each sentence and joins them with the references dictionary, and returns a record for each
+    (sentence, annotation). The sentences are numbered as in papers_plus (the lines of ====== are
+    skipped). """
+    arxiv_identifier = normalize_arxiv_identifier(filepath)
+    list_for_solr = []
+    with open(filepath, 'r') as file:
+        sentencenum = 0
+        for line in file:
+            # Many lines have just ======, they are not sentences
+            if line.startswith('=='):
+                continue
+            sentencenum += 1
+            sentence = line.replace('\n', '')
+            # Each annotation once per sentence, like the documents found by a search in papers
+            for annotation in dict.fromkeys(ANNOTATION_PATTERN.findall(sentence)):
+                reference = references.get(annotation)
+                if reference is not None:
+                    details, reference_filename = reference
+                    list_for_solr.append(build_record(annotation, details, reference_filename,
+                                                      sentence, arxiv_identifier, sentencenum))
+    # Classify all the sentences of the file (in batches)
+    classify_citation_polarity(list_for_solr)
+    return list_for_solr
+
+def create_concurrent_futures_single_pass():
+    """ Single-pass mode: reads the refs files into the references dictionary, then uses all the cores
+    to scan the txt files, and inserts their records into Solr in batches (see bulk_writer.py)"""
+    read_references()
+    text_files = glob(os.path.join(DATASET_FOLDERPATH, '*.txt'))
+    with concurrent.futures.ProcessPoolExecutor(initializer=load_references) as executor:
+        file_records = map_bounded(executor, parse_sentences_build_records, text_files, MAX_PENDING_FILES)
+        num_records = write_documents('references_plus', chain.from_iterable(file_records))
+    print("Inserted {} records from {} txt files".format(num_records, len(text_files)))
+
 def create_concurrent_futures():
-    """ Uses all the cores to do the parsing and inserting"""
-    folderpath = '/home/ashwath/Files/arxiv-cs-dataset-LREC2018/'
-    file_no = 0
-    refs_files = glob(os.path.join(folderpath, '*.refs'))
+    """ Uses all the cores to do the parsing, and inserts the records of all the files into Solr
+    in batches (see bulk_writer.py)"""
+    refs_files = glob(os.path.join(DATASET_FOLDERPATH, '*.refs'))
     with concurrent.futures.ProcessPoolExecutor() as executor:
-        executor.map(parse_file_build_records, refs_files, chunksize=10000)
+        file_records = map_bounded(executor, parse_file_build_records, refs_files, MAX_PENDING_FILES)
+        write_documents('references_plus', chain.from_iterable(file_records))
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build the references_plus index')
+    parser.add_argument('--mode', choices=['single-pass', 'per-annotation'], default='single-pass')
+    args = parser.parse_args()
     start_time = time()
-    create_concurrent_futures()
+    if args.mode == 'single-pass':
+        create_concurrent_futures_single_pass()
+    else:
+        create_concurrent_futures()
     print("Completed in {} seconds!".format(time() - start_time))
 
@@ -16,20 +16,31 @@
 import os
 import csv
 from collections import defaultdict
-import requests
-import datetime
-import pysolr
+import sys
 from glob import iglob
 from time import time
 
+# The Solr client module lives in the Django app (it doesn't import Django)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..',
+                                'scientificpaperoperations'))
+from papersearchengine.solr_client import select
+from papersearchengine.records import POLARITY_NAMES
+from papersearchengine.model_registry import get_citation_model
+from bulk_writer import BulkWriter
+# Same records (and ids) as the per-annotation mode of indexing_references_plus.py
+from indexing_references_plus import build_record, normalize_arxiv_identifier
+
+# No. of sentences classified in 1 call to the citation model
+CLASSIFY_BATCH_SIZE = 10000
+
 def search_solr(query, collection, search_field, num_rows):
     """ Searches the specified collection on the specified search_field (and a
     specified no. of rows) and fetches and retuens results using parse_json"""
-    solr_url = 'http://localhost:8983/solr/' + collection + '/select'
     # Exact search only
     query = '"' + query + '"'
     url_params = {'q': query, 'rows': num_rows, 'df': search_field}
-    solr_response = requests.get(solr_url, params=url_params)
+    # Pooled keep-alive session with timeouts and retries, shared with the Django app
+    solr_response = select(collection, url_params)
     if solr_response.ok:
         data = solr_response.json()
         return parse_json(data, collection)
@@ -43,10 +54,6 @@ def parse_json(data, collection):
     returns whatever the parser returns, along with the query and
     num_responses, which it gets from the json response. If there
     are no results, it returns ([], query, 0)"""
-    # FIRST (only applies to references_plus index), check if this
-    # annotation is already present
-    if collection == 'references_plus':
-        return parse_references_plus_json(data)
     # query is the actual phrase searched in Solr
     query = data['responseHeader']['params']['q']
     num_responses = data['response']['numFound']
@@ -54,26 +61,10 @@ def parse_json(data, collection):
         return []
     if collection == 'papers':
         results = parse_sentence_json(data)
-    elif collection == 'arxiv_metadata':
-        results = parse_arxiv_metadata_json(data)
-    elif collection == 'metadata':
-        results = parse_metadata_json(data)
     elif collection == 'references':
         results = parse_refs_json(data)
     return results
 
-def parse_references_plus_json(data):
-    """ Function to parse the json response from the references_plus collection
-    in Solr (which is being built using this program). It returns the num_results
-    only. As the same annotation is present in multiple refs files, we want to only
-    search for it once in the papers index (we add everything in this one time). So,
-    searching again will result in duplicate values getting inserted. So this returns 0 if
-    it is indeed a new record, a number greater than 0 (num_responses) otherwise"""
-    # docs contains sentence, fileName, id generated by Solr
-    num_responses = data['response']['numFound']
-    #print("NUMBER OF RESPONSES", num_responses)
-    return num_responses
-
 def parse_sentence_json(data):
     """ Function to parse the json response from the papers collection
     in Solr. It returns the results as a list with the sentence, file name
@@ -86,41 +77,30 @@ def parse_sentence_json(data):
                 for i in range(len(docs))]
     return results
 
-def parse_arxiv_metadata_json(data):
-    """ Function to parse the json response from the metadata or the
-    arxiv_metadata collections in Solr. It returns the results as a
-    list with the sentence, file name and title."""
-    # docs contains authors, title, id generated by Solr, url
-    docs = data['response']['docs']
-    # NOTE: there are records without authors and urls. This is why the
-    # get method is always used to get the value instead of getting the value
-    # by applying the [] operator on the key.
-    results = [[docs[i].get('title'), docs[i].get('authors'),
-                docs[i].get('url'), docs[i].get('published_date')]
-                for i in range(len(docs))]
-    return results
-    
-def parse_metadata_json(data):
-    """ Function to parse the json response from the metadata or the
-    arxiv_metadata collections in Solr. It returns the dblp url. 
-    docs is a list of one result, so this is obtained by docs[0].get('url')"""
-    # docs contains authors, title, id generated by Solr, url
-    docs = data['response']['docs']
-    # NOTE: there are records without authors and urls. This is why the
-    # get method is always used to get the value instead of getting the value
-    # by applying the [] operator on the key.
-
-    dblp_url = docs[0].get('url') 
-    return dblp_url
+def classify_citation_polarity(solr_records):
+    """ Adds the citation polarity (positive, neutral or negative) of the citing sentence, predicted by the citation
+    model created by create_ml_model.py, to each of the records. The sentences are vectorized and predicted
+    CLASSIFY_BATCH_SIZE at a time, so the search doesn't have to run the model on every query."""
+    # The pipeline is loaded once per process (see model_registry.py)
+    text_pipeline = get_citation_model()
+    for start in range(0, len(solr_records), CLASSIFY_BATCH_SIZE):
+        batch = solr_records[start:start + CLASSIFY_BATCH_SIZE]
+        polarities = text_pipeline.predict([solr_record['citing_sentence'] for solr_record in batch])
+        for solr_record, polarity in zip(batch, polarities):
+            solr_record['citation_polarity'] = POLARITY_NAMES[polarity]
 
 def parse_file_build_records():
     """ Read each of the refs files, which have annotations with their associated details (cited papers)
-    Go through each annotation, details pair in this file, check if the  annotation is already in the
-    index. If yes, continue to the next line without doing anything. If no, search the papers index
-    for the annotation. Get the sentence and the citing paper's arxiv identifier. This is then used to
-    query the 2 metadata indices and get the relevant fields, which are added to the new Solr index.
+    Go through each annotation, details pair in this file and, if the annotation wasn't searched yet by
+    this process, search the papers index for the annotation. Get the sentence and the citing paper's
+    arxiv identifier. This is then used to query the 2 metadata indices and get the relevant fields,
+    which are added to the new Solr index. The id of each record is derived from the citation, so
+    adding it again (from another refs file, process or run) overwrites it instead of duplicating it.
     Solr field definition for new Solr index references_plus:
 
+    <!-- Primary key: citing_arxiv_identifier.sentencekey|annotation (computed in build_record)-->
+    <field name="id" type="string" indexed="true" stored="true" required="true" multiValued="false"/>
+
     <!-- REFS file fields: cited paper-->
     <field name="annotation" type="string" indexed="true" stored="true" multiValued="false"/> 
     <field name="cited_paper_details" type="text_classic" indexed="true" stored="true" multiValued="false"/> 
@@ -143,10 +123,23 @@ def parse_file_build_records():
     <!-- meta field: dblp_url-->
     <field name="citing_dblp_url" type="string" indexed="true" stored="true" multiValued="false"/> 
 
+    <!-- Display date and offsets of the annotation in citing_sentence (computed here)-->
+    <field name="citing_published_date_display" type="string" indexed="false" stored="true" docValues="false" multiValued="false"/>
+    <field name="annotation_start" type="pint" indexed="false" stored="true" docValues="false" multiValued="false"/>
+    <field name="annotation_end" type="pint" indexed="false" stored="true" docValues="false" multiValued="false"/>
+
+    <!-- Grouping key: citing_arxiv_identifier|annotation-->
+    <field name="citation_group" type="string" indexed="true" stored="false" docValues="true" multiValued="false"/>
+
+    <!-- Citation polarity of citing_sentence, predicted by the citation model (computed here)-->
+    <field name="citation_polarity" type="string" indexed="true" stored="true" docValues="true" multiValued="false"/>
+
 
      """
-    # Make a connection to Solr
-    solr = pysolr.Solr('http://localhost:8983/solr/references_plus')
+    # Writer which inserts the records of all the files into Solr in batches (see bulk_writer.py)
+    writer = BulkWriter('references_plus')
+    # Annotations already searched in papers (the same annotation is in many refs files)
+    searched_annotations = set()
     folderpath = '/home/ashwath/Files/arxiv-cs-dataset-LREC2018/'
     file_no = 0
     for filepath in iglob(os.path.join(folderpath, '*.refs')):
@@ -154,23 +147,19 @@ def parse_file_build_records():
             filename = os.path.basename(filepath)
             file_no += 1
             print(filename, file_no)
-            filename_without_extension = '.'.join(filename.split('.')[:2])
-            # Initialize list_for_solr: I insert once into Solr for the results from one file
+            filename_without_extension = normalize_arxiv_identifier(filename)
+            # Initialize list_for_solr: the records of all the results from one file
             list_for_solr = []
             # Create a CSV reader for the current file, the fields are inserted in a list
             # [annotation, details, emtpyfiled] for a line annotation;details;
             csv_reader = csv.reader(file, delimiter=';')
             for record in csv_reader:
             #for annotation, details, dummy in csv_reader:
-                # Go through each annotation, details pair in this file, check if the
-                # annotation is already in the index. If yes, continue to the next line
-                # without doing anything. If no, search the papers index for the annotation.
-                # Get the sentence and the citing paper's arxiv identifier. This is then used
-                # to query the 2 metadata indices and get the relevant fields, which are added to
-                # the final index. 
-                # num_results returned for references_plus. If it is >0, don't do anything. If it is
-                # 0, add the solr record. (Note, the num_rows argument is set to a value higher than
-                # 0 : can also be 1)
+                # Go through each annotation, details pair in this file and search the papers index for
+                # the annotation (once per process). Get the sentence and the citing paper's arxiv identifier.
+                # This is then used to get the metadata of the citing paper, which is added to the final index.
+                # The records have deterministic ids, so indexing an annotation again (in another process, or
+                # another run) overwrites its records instead of adding duplicates.
                 try:
                     # Lines which do not have 2 semicolons are skipped -- they will not be indexed.
                     annotation = record[0]
@@ -184,9 +173,11 @@ def parse_file_build_records():
                     # Just go to the next line
                     continue
 
-                if search_solr(annotation, 'references_plus', 'annotation', 1) == 0:
+                if annotation not in searched_annotations:
+                    searched_annotations.add(annotation)
                     # papers_result is a list of lists with 3 fields in each sublist: sentence (string),
-                    # arxiv_identifier (string), sentencenum (integer).
+                    # fileName (string, normalized to the arxiv identifier in build_record), sentencenum
+                    # (None: the papers index doesn't have it).
 
                     papers_result = search_solr(annotation, 'papers', 'sentence', 100000)
                     
@@ -194,47 +185,15 @@ def parse_file_build_records():
                     for sentence, arxiv_identifier, sentencenum in papers_result:
                         # IF NO RESULTS ARE FOUND, paper_result = [] and this loop is not entered. 
                         # It goes to the next line in the outer for loop (annotation, details)
-                        solr_record = {}
-                        # NOTE: Annotations in the refs files don't have < and >
-                        solr_record['annotation'] = '<{}>'.format(annotation)
-                        solr_record['cited_paper_details'] = details
-                        # Debug field: can be used to find records created from a particular (refs) file
-                        solr_record['reference_filename'] = filename_without_extension
-                        solr_record['citing_sentencenum'] = sentencenum
-                        solr_record['citing_sentence'] = sentence
-                        solr_record['citing_arxiv_identifier'] = arxiv_identifier
-                        # arxiv_metadata_result will be a list of lists with each list containing title (string),
-                        # authors (list), arxiv url (string), published_dates (list)
-                        arxiv_metadata_result = search_solr(arxiv_identifier, 'arxiv_metadata', 'arxiv_identifier', 1)
-                        # IMPORTANT!: None is returned if there is no dblp_url. If None, set it to 'unavailable'. This 
-                        # is checked in Django and the DBLP URL is deactivated with a message if it is 'unavailable'. 
-                        dblp_url = search_solr(arxiv_identifier, 'metadata', 'arxiv_identifier', 1)
-                        dblp_url = dblp_url if dblp_url is not None else 'unavailable'
-                        solr_record['citing_dblp_url'] = dblp_url
-                        for title, authors, arxiv_url, published_dates in arxiv_metadata_result:
-                            # Flatten the published dates into a single string. Not using a DateRange field because
-                            # a grouping is done in django_paper_search which needs the dates to be a single string
-                            if len(published_dates) == 1:
-                                solr_record['citing_published_date'] = published_dates[0]
-                                solr_record['citing_revision_dates'] = 'unavailable'
-                            else:
-                                solr_record['citing_published_date'] = published_dates[0]
-                                revision = ';'.join([datetime.datetime.strptime(pdate[:10], '%Y-%m-%d').strftime('%B %d, %Y') for pdate in published_dates[1:]])
-                                solr_record['citing_revision_dates'] = 'revised on {}'.format(revision)
-                            #published_dates = ';'.join([datetime.datetime.strptime(pdate[:10], '%Y-%m-%d').strftime('%Y-%m-%d') for  pdate in published_dates])
-                            #print(published_dates)
-                            solr_record['citing_paper_title'] = title
-                            solr_record['citing_paper_authors'] = '; '.join(authors)
-                            solr_record['citing_arxiv_url'] = arxiv_url
+                        solr_record = build_record(annotation, details, filename_without_extension,
+                                                   sentence, arxiv_identifier, sentencenum)
                         list_for_solr.append(solr_record)
-            # As the refs input data is very low quality, a check is needed to see if the same annotation occurs twice in the same file
-            # All the fields are strings or numbers, there are no lists within the dictionaries. REMOVE all duplicate dictionaries (this will
-            # happen if the same annotation appears twice in the same file)
-            unique_sets = set(frozenset(d.items()) for d in list_for_solr)
-            unique_dicts = [dict(s) for s in unique_sets]
+            # Classify all the sentences of the file (in batches)
+            classify_citation_polarity(list_for_solr)
             # Add to Solr
-            solr.add(unique_dicts)
+            writer.add_all(list_for_solr)
             #print("Inserted list length =", len(list_for_solr))
+    writer.close()
                 
 
 if __name__ == '__main__':
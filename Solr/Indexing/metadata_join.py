@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+    #-------------------------------------------------------------------------------
+    # Name:        METADATA JOIN
+    # Purpose:     Join of a paper's metadata for the _plus indexers: the title, authors,
+    #              arxiv url and published/revision dates from the arxiv_metadata index
+    #              and the dblp url from the metadata index, looked up by arxiv identifier.
+    #              Every sentence of a paper (papers_plus) and every citation context of a
+    #              citing paper (references_plus) needs the same metadata, so each identifier
+    #              is looked up once per process and the joined fields are cached
+    #              (JOIN_CACHE_SIZE papers), instead of 2 Solr requests per record.
+    #              If the local side table exists (see metadata_store.py), the metadata is
+    #              looked up there instead of in Solr.
+    #              The indexers must put scientificpaperoperations on sys.path first.
+    #-------------------------------------------------------------------------------
+
+"""
+import os
+import sys
+import datetime
+from functools import lru_cache
+from papersearchengine.solr_client import select
+from papersearchengine.records import format_display_date
+from metadata_store import METADATA_STORE_PATH, MetadataStore
+
+# Max. no. of papers whose metadata is cached in a process
+JOIN_CACHE_SIZE = 100000
+
+# Names of the metadata fields of the citing paper in references_plus
+CITING_FIELD_NAMES = {'dblp_url': 'citing_dblp_url', 'title': 'citing_paper_title',
+                      'authors': 'citing_paper_authors', 'arxiv_url': 'citing_arxiv_url',
+                      'published_date': 'citing_published_date', 'revision_dates': 'citing_revision_dates',
+                      'published_date_display': 'citing_published_date_display'}
+
+def search_metadata(arxiv_identifier, collection):
+    """ Returns the docs of the collection (arxiv_metadata or metadata) with the arxiv identifier
+    (exact search, 1 row). """
+    url_params = {'q': '"' + arxiv_identifier + '"', 'rows': 1, 'df': 'arxiv_identifier'}
+    # Pooled keep-alive session with timeouts and retries, shared with the Django app
+    solr_response = select(collection, url_params)
+    if solr_response.ok:
+        return solr_response.json()['response']['docs']
+    else:
+        print("Invalid response returned from Solr")
+        sys.exit(11)
+
+# Side table of this process (each worker process opens its own connection)
+_store = None
+_store_pid = None
+
+def get_store():
+    """ Returns the side table of this process, or None if it hasn't been built (Solr is used). """
+    global _store, _store_pid
+    if _store_pid != os.getpid():
+        _store = MetadataStore(METADATA_STORE_PATH) if os.path.exists(METADATA_STORE_PATH) else None
+        _store_pid = os.getpid()
+    return _store
+
+def join_metadata(arxiv_doc, dblp_url):
+    """ Returns the joined metadata of a paper as a dict with the fields of the papers_plus schema
+    (see CITING_FIELD_NAMES for references_plus) from its arxiv_metadata doc (None if the paper
+    isn't in the arxiv_metadata index) and its dblp url (None if it isn't in the metadata index):
+    dblp_url ('unavailable' if there is none) and, if there is an arxiv_metadata doc, title,
+    authors, arxiv_url and revision_dates, and published_date and published_date_display if the
+    doc has a date. """
+    metadata = {}
+    # IMPORTANT!: 'unavailable' is checked in Django, and the DBLP URL is deactivated with a message
+    metadata['dblp_url'] = dblp_url if dblp_url is not None else 'unavailable'
+    if arxiv_doc is None:
+        return metadata
+    # NOTE: there are records without authors and urls. This is why the
+    # get method is always used to get the value.
+    published_dates = arxiv_doc.get('published_date') or []
+    # Flatten the published dates into a single string. Not using a DateRange field because
+    # a grouping is done in django_paper_search which needs the dates to be a single string
+    if len(published_dates) <= 1:
+        metadata['revision_dates'] = 'unavailable'
+    else:
+        revision = ';'.join([datetime.datetime.strptime(pdate[:10], '%Y-%m-%d').strftime('%B %d, %Y')
+                             for pdate in published_dates[1:]])
+        metadata['revision_dates'] = 'revised on {}'.format(revision)
+    # Records without a date don't get the date fields
+    if published_dates:
+        metadata['published_date'] = published_dates[0]
+        # Date in the format shown in the results (e.g. January 13, 2018), so that it isn't reformatted on every search
+        metadata['published_date_display'] = format_display_date(published_dates[0])
+    metadata['title'] = arxiv_doc.get('title')
+    metadata['authors'] = '; '.join(arxiv_doc.get('authors') or [])
+    metadata['arxiv_url'] = arxiv_doc.get('url')
+    return metadata
+
+def search_dblp_url(arxiv_identifier):
+    """ Returns the dblp url of the paper in the metadata index, or None. """
+    metadata_docs = search_metadata(arxiv_identifier, 'metadata')
+    return metadata_docs[0].get('url') if metadata_docs else None
+
+@lru_cache(maxsize=JOIN_CACHE_SIZE)
+def get_paper_metadata(arxiv_identifier):
+    """ Returns the joined metadata of a paper (see join_metadata), from the side table if there
+    is one, else from Solr. The result is cached: callers must not modify it (see
+    add_paper_metadata). """
+    store = get_store()
+    if store is not None:
+        return store.lookup(arxiv_identifier) or join_metadata(None, None)
+    arxiv_docs = search_metadata(arxiv_identifier, 'arxiv_metadata')
+    return join_metadata(arxiv_docs[0] if arxiv_docs else None, search_dblp_url(arxiv_identifier))
+
+@lru_cache(maxsize=JOIN_CACHE_SIZE)
+def get_dblp_url(arxiv_identifier):
+    """ Returns the dblp url of the paper, or 'unavailable' if it isn't in the metadata index. """
+    if get_store() is not None:
+        return get_paper_metadata(arxiv_identifier)['dblp_url']
+    dblp_url = search_dblp_url(arxiv_identifier)
+    return dblp_url if dblp_url is not None else 'unavailable'
+
+def add_paper_metadata(solr_record, arxiv_identifier, field_names=None):
+    """ Adds the joined metadata of the paper (see get_paper_metadata) to the solr_record.
+    field_names maps the fields to the names in the index, if they differ (CITING_FIELD_NAMES). """
+    for field, value in get_paper_metadata(arxiv_identifier).items():
+        solr_record[field_names[field] if field_names else field] = value
+
+def get_join_stats():
+    """ Returns the hits, misses and size of the metadata cache of this process. """
+    return get_paper_metadata.cache_info()
+
+def get_join_source():
+    """ Returns where the metadata is looked up: the path of the side table, or 'solr'. """
+    return METADATA_STORE_PATH if get_store() is not None else 'solr'
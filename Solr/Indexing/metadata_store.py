@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+    #-------------------------------------------------------------------------------
+    # Name:        METADATA STORE
+    # Purpose:     Builds a local side table with the joined metadata of every arXiv paper
+    #              (the fields which the _plus indexers copy from the arxiv_metadata and
+    #              metadata indices, see metadata_join.py), keyed by arxiv identifier, in a
+    #              read-only SQLite file. The indexers then join with a local lookup instead
+    #              of 2 Solr requests, and don't need the arxiv_metadata and metadata cores
+    #              to be up. The worker processes each open the file read-only and memory
+    #              mapped, so they share its pages through the OS cache.
+    #              The table is built from the 2 Solr cores, or directly from their sources
+    #              (the arXiv XML file and the .meta json files).
+    #
+    #              Usage: python metadata_store.py --source solr
+    #                     python metadata_store.py --source files --xml arxiv.xml --meta-dir dataset/
+    #-------------------------------------------------------------------------------
+
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+from glob import iglob
+from time import time
+from urllib.parse import quote
+
+# The Solr client module lives in the Django app (it doesn't import Django)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..',
+                                'scientificpaperoperations'))
+from papersearchengine.solr_client import select
+
+# Default path of the side table (also used by metadata_join.py)
+METADATA_STORE_PATH = os.environ.get('METADATA_STORE_PATH',
+                                     os.path.join(os.path.dirname(os.path.abspath(__file__)), 'metadata_store.sqlite3'))
+# Page size of the Solr requests which export the cores
+EXPORT_PAGE_SIZE = 10000
+# Bytes of the file which are memory mapped by the readers
+MMAP_SIZE = 1024 * 1024 * 1024
+
+class MetadataStore:
+    """ Read-only access to the side table. Lookups return the joined metadata dict of the paper
+    (see metadata_join.join_metadata), or None if the paper isn't in the table. """
+
+    def __init__(self, path):
+        # immutable: no locking and no change detection, the file is only replaced between builds
+        self.connection = sqlite3.connect('file:{}?mode=ro&immutable=1'.format(quote(os.path.abspath(path))),
+                                          uri=True, check_same_thread=False)
+        self.connection.execute('PRAGMA mmap_size={}'.format(MMAP_SIZE))
+
+    def lookup(self, arxiv_identifier):
+        row = self.connection.execute('SELECT metadata FROM papers WHERE arxiv_identifier = ?',
+                                      (arxiv_identifier,)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def __len__(self):
+        return self.connection.execute('SELECT COUNT(*) FROM papers').fetchone()[0]
+
+def export_core(collection, fields):
+    """ Generator which yields all the docs (with the given comma-separated fields) of a Solr core,
+    paged with cursorMark. """
+    cursor_mark = '*'
+    while True:
+        solr_response = select(collection, {'q': '*:*', 'fl': fields, 'rows': EXPORT_PAGE_SIZE,
+                                            'sort': 'id asc', 'cursorMark': cursor_mark})
+        if not solr_response.ok:
+            print("Invalid response returned from Solr")
+            sys.exit(11)
+        data = solr_response.json()
+        yield from data['response']['docs']
+        # Solr returns the same cursorMark when there are no more results.
+        if data['nextCursorMark'] == cursor_mark:
+            return
+        cursor_mark = data['nextCursorMark']
+
+def read_solr():
+    """ Returns (arxiv identifier -> arxiv_metadata doc, arxiv identifier -> dblp url) from the
+    arxiv_metadata and metadata cores. """
+    arxiv_docs, dblp_urls = {}, {}
+    for doc in export_core('arxiv_metadata', 'arxiv_identifier,title,authors,url,published_date'):
+        arxiv_docs.setdefault(doc.get('arxiv_identifier'), doc)
+    for doc in export_core('metadata', 'arxiv_identifier,url'):
+        if doc.get('url') is not None:
+            dblp_urls.setdefault(doc.get('arxiv_identifier'), doc['url'])
+    return arxiv_docs, dblp_urls
+
+def read_files(xml_filepath, meta_folderpath):
+    """ Returns (arxiv identifier -> arxiv_metadata doc, arxiv identifier -> dblp url) from the
+    sources of the 2 cores: the arXiv XML file (like pysolr_xml_arxiv.py) and the .meta json
+    files, whose file names are the arxiv identifiers (like pysolr_json.py). """
+    from lxml import etree
+    arxiv_docs, dblp_urls = {}, {}
+    namespace = {'dc': 'http://purl.org/dc/elements/1.1/',
+                 'oai_dc': 'http://www.openarchives.org/OAI/2.0/oai_dc/'}
+    root = etree.parse(xml_filepath).getroot()
+    for metadata_element in root.findall('./record/metadata/', namespaces=namespace):
+        doc = {'authors': [], 'published_date': []}
+        for child in metadata_element:
+            # Tag without the namespace, e.g. {http://purl.org/dc/elements/1.1/}title -> title
+            tag = child.tag[child.tag.find('}') + 1:]
+            if tag == 'title':
+                doc['title'] = child.text
+            elif tag == 'creator':
+                doc['authors'].append(child.text)
+            elif tag == 'date':
+                doc['published_date'].append(child.text)
+            elif tag == 'identifier' and child.text.startswith('http://arxiv'):
+                doc['url'] = child.text
+                doc['arxiv_identifier'] = child.text[child.text.rfind('/') + 1:]
+        if 'arxiv_identifier' in doc:
+            arxiv_docs.setdefault(doc['arxiv_identifier'], doc)
+    for filepath in iglob(os.path.join(meta_folderpath, '*.meta')):
+        with open(filepath, 'r') as file:
+            content = json.load(file)
+        arxiv_identifier = '.'.join(os.path.basename(filepath).split('.')[:2])
+        if content.get('url') is not None:
+            dblp_urls.setdefault(arxiv_identifier, content['url'])
+    return arxiv_docs, dblp_urls
+
+def build_store(arxiv_docs, dblp_urls, path=METADATA_STORE_PATH):
+    """ Writes the joined metadata of all the papers to a new side table at path (the old one is
+    replaced once the new one is complete). Returns the no. of papers. """
+    from metadata_join import join_metadata
+    part_path = path + '.part'
+    if os.path.exists(part_path):
+        os.remove(part_path)
+    connection = sqlite3.connect(part_path)
+    connection.execute('CREATE TABLE papers (arxiv_identifier TEXT PRIMARY KEY, metadata TEXT NOT NULL) WITHOUT ROWID')
+    arxiv_identifiers = sorted((set(arxiv_docs) | set(dblp_urls)) - {None})
+    with connection:
+        connection.executemany('INSERT INTO papers VALUES (?, ?)',
+                               ((arxiv_identifier, json.dumps(join_metadata(arxiv_docs.get(arxiv_identifier),
+                                                                            dblp_urls.get(arxiv_identifier))))
+                                for arxiv_identifier in arxiv_identifiers))
+    connection.execute('VACUUM')
+    connection.close()
+    os.replace(part_path, path)
+    return len(arxiv_identifiers)
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the metadata side table of the _plus indexers')
+    parser.add_argument('--source', choices=['solr', 'files'], default='solr')
+    parser.add_argument('--xml', default='/home/ashwath/Files/arxiv-cs-all-until201712031.xml',
+                        help='arXiv XML metadata file (--source files)')
+    parser.add_argument('--meta-dir', default='/home/ashwath/arxiv-cs-dataset-LREC2018',
+                        help='folder with the .meta json files (--source files)')
+    parser.add_argument('--output', default=METADATA_STORE_PATH)
+    args = parser.parse_args()
+    start_time = time()
+    if args.source == 'solr':
+        arxiv_docs, dblp_urls = read_solr()
+    else:
+        arxiv_docs, dblp_urls = read_files(args.xml, args.meta_dir)
+    num_papers = build_store(arxiv_docs, dblp_urls, args.output)
+    print("Wrote {} papers to {} in {} seconds!".format(num_papers, args.output, time() - start_time))
+
+if __name__ == '__main__':
+    main()
@@ -15,14 +15,18 @@
 """
 import json
 import os
-import pysolr
+import sys
 from glob import iglob
 
-def insert_metadata_into_solr():
-    solr = pysolr.Solr('http://localhost:8983/solr/metadata')    
+# The Solr client module lives in the Django app (it doesn't import Django)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..',
+                                'scientificpaperoperations'))
+from bulk_writer import write_documents
+
+def read_metadata_records():
+    """ Generator which reads the metadata files and yields a record for each of them."""
     basepath = '/home/ashwath'
     folderpath = os.path.join(basepath, 'arxiv-cs-dataset-LREC2018')
-    list_for_solr = []
     for filepath in iglob(os.path.join(folderpath, '*.meta')):
         with open(filepath, 'r') as file:
             filename = os.path.basename(filepath)
@@ -34,10 +38,11 @@ def insert_metadata_into_solr():
         solr_content['title'] = content['title']
         solr_content['url'] = content['url']
         solr_content['filename'] = filename_without_extension
-        list_for_solr.append(solr_content)
-        #solr.add([solr_content])
+        yield solr_content
+
+def insert_metadata_into_solr():
+    """ Inserts the metadata records into Solr, in batches (see bulk_writer.py)."""
+    print(write_documents('metadata', read_metadata_records()))
 
-    solr.add(list_for_solr)
-    
 if __name__ == '__main__':
     insert_metadata_into_solr()
\ No newline at end of file
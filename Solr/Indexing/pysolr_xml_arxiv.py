@@ -14,7 +14,14 @@
 """
 from collections import defaultdict
 from lxml import etree
-import pysolr
+import os
+import sys
+
+# The Solr client module lives in the Django app (it doesn't import Django)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..',
+                                'scientificpaperoperations'))
+from bulk_writer import write_documents
+
 # Parse the Arxiv xml file
 def get_xml_root():
     """ Gets the root of the arxiv xml tree and returns it."""
@@ -24,9 +31,9 @@ def get_xml_root():
     root = doc.getroot()
     return root
 
-def parse_xml_insert_into_solr(root):
-    """ Function which parses the arxiv xml, and inserts some of the metadata
-    into an index in Apache Solr."""
+def parse_xml_records(root):
+    """ Generator which parses the arxiv xml, and yields a record with some of the
+    metadata for each paper."""
     # Set the 2 namespaces which are used in the xml file: Open archive,
     # and Dublin Core.
     namespace = {'dc': 'http://purl.org/dc/elements/1.1/',
@@ -50,7 +57,6 @@ def parse_xml_insert_into_solr(root):
     # Get the tag of the first record's title, and run find on that. Ans. 34
     tag_with_prefix = metadata[0][0].tag # for first child
     start_index = tag_with_prefix.find('}') + 1 # 34
-    list_for_solr = []
     for metadata_element in metadata:
         solr_record = defaultdict(list)
         for child in metadata_element:
@@ -65,12 +71,13 @@ def parse_xml_insert_into_solr(root):
                 solr_record['url'] = child.text
                 id_startindex = child.text.rfind('/') + 1
                 solr_record['arxiv_identifier'] = child.text[id_startindex:]    # Return only the first date (1st element in list): the date of version 1.
-        # Append each record in dict form (not defaultdict) to the 
-        # list_for_solr list.
-        list_for_solr.append(dict(solr_record))
-    print(len(list_for_solr))
-    solr = pysolr.Solr('http://localhost:8983/solr/arxiv_metadata')
-    solr.add(list_for_solr)
+        # Yield each record in dict form (not defaultdict)
+        yield dict(solr_record)
+
+def parse_xml_insert_into_solr(root):
+    """ Function which parses the arxiv xml, and inserts some of the metadata
+    into an index in Apache Solr, in batches (see bulk_writer.py)."""
+    print(write_documents('arxiv_metadata', parse_xml_records(root)))
 
 if __name__ == '__main__':
     xml_root = get_xml_root()
@@ -4,7 +4,8 @@
     # Name:        PARSE ARXIV XML and build metadata_plus index
     # Purpose:     Parses the XML metadata file from ArXiv, and inserts some
     #              of the fields into Solr for each record. It also gets the
-    #              dblp url from the metadats index.
+    #              dblp url from the metadats index (or the local side table
+    #              built by metadata_store.py, see metadata_join.py).
     #
     # Author:      Ashwath Sampath
     #
@@ -15,11 +16,18 @@
 """
 from collections import defaultdict
 from lxml import etree
-import pysolr
 import datetime
-import requests
+import os
+import sys
 from time import time
 
+# The Solr client module lives in the Django app (it doesn't import Django)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..',
+                                'scientificpaperoperations'))
+from papersearchengine.records import format_display_date
+from metadata_join import get_dblp_url, get_join_source
+from bulk_writer import write_documents
+
 # Parse the Arxiv xml file
 def get_xml_root():
     """ Gets the root of the arxiv xml tree and returns it."""
@@ -29,62 +37,11 @@ def get_xml_root():
     root = doc.getroot()
     return root
 
-def search_solr(query, collection, search_field, num_rows):
-    """ Searches the specified collection on the specified search_field (and a
-    specified no. of rows) and fetches and retuens results using parse_json"""
-    solr_url = 'http://localhost:8983/solr/' + collection + '/select'
-    # Exact search only
-    query = '"' + query + '"'
-    url_params = {'q': query, 'rows': num_rows, 'df': search_field}
-    solr_response = requests.get(solr_url, params=url_params)
-    if solr_response.ok:
-        data = solr_response.json()
-        return parse_json(data, collection)
-    else:
-        print("Invalid response returned from Solr")
-        sys.exit(11)
-
-
-def parse_json(data, collection):
-    """ Calls the appropriate json parser based on the collection,
-    returns whatever the parser returns, along with the query and
-    num_responses, which it gets from the json response. If there
-    are no results, it returns ([], query, 0)"""
-    # FIRST (only applies to references_plus index), check if this
-    # annotation is already present
-    if collection == 'references_plus':
-        return parse_references_plus_json(data)
-    # query is the actual phrase searched in Solr
-    query = data['responseHeader']['params']['q']
-    num_responses = data['response']['numFound']
-    if num_responses == 0:
-        # Return None if not found.
-        return None
-    results = parse_metadata_json(data)
-    return results
-
-def parse_metadata_json(data):
-    """ Function to parse the json response from the metadata or the
-    arxiv_metadata collections in Solr. It returns the dblp url. 
-    docs is a list of one result, so this is obtained by docs[0].get('url')"""
-    # docs contains authors, title, id generated by Solr, url
-    docs = data['response']['docs']
-    # NOTE: there are records without authors and urls. This is why the
-    # get method is always used to get the value instead of getting the value
-    # by applying the [] operator on the key.
-    if docs == []:
-        # Return None if not found.
-        return None
-    dblp_url = docs[0].get('url') 
-    return dblp_url
-
-
-def parse_xml_insert_into_solr(root):
-    """ Function which parses the arxiv xml, and inserts some of the metadata
-    into an index in Apache Solr."""
+def parse_xml_records(root):
+    """ Generator which parses the arxiv xml, and yields a record with some of the
+    metadata for each paper."""
     # Set the 2 namespaces which are used in the xml file: Open archive,
     # and Dublin Core.
-    solr = pysolr.Solr('http://localhost:8983/solr/metadata_plus')
     namespace = {'dc': 'http://purl.org/dc/elements/1.1/',
                  'oai_dc': 'http://www.openarchives.org/OAI/2.0/oai_dc/'}
     # NOTE: this is the fully qualified version of descending through the ns
@@ -106,7 +63,6 @@ def parse_xml_insert_into_solr(root):
     # Get the tag of the first record's title, and run find on that. Ans. 34
     tag_with_prefix = metadata[0][0].tag # for first child
     start_index = tag_with_prefix.find('}') + 1 # 34
-    list_for_solr = []
     for metadata_element in metadata:
         solr_record = {}
         #solr_record = defaultdict(list)
@@ -137,17 +93,19 @@ def parse_xml_insert_into_solr(root):
             solr_record['published_date'] = published_dates[0]
             revision = ';'.join([datetime.datetime.strptime(pdate[:10], '%Y-%m-%d').strftime('%B %d, %Y') for pdate in published_dates[1:]])
             solr_record['revision_dates'] = 'revised on {}'.format(revision)
+        # Date in the format shown in the results (e.g. January 13, 2018), so that it isn't reformatted on every search
+        solr_record['published_date_display'] = format_display_date(published_dates[0])
         # Add the authors
         solr_record['authors'] = '; '.join(authors)
-        # Get the dblp url from the metadata index
-        dblp_url = search_solr(arxiv_identifier, 'metadata', 'arxiv_identifier', 1)
-        dblp_url = dblp_url if dblp_url is not None else 'unavailable'
-        solr_record['dblp_url'] = dblp_url
-        print(arxiv_identifier)
-        # Append each record in dict to the list_for_solr list.
-        list_for_solr.append(solr_record)
-    print(len(list_for_solr))
-    solr.add(list_for_solr)
+        # Get the dblp url from the metadata index (or the side table)
+        solr_record['dblp_url'] = get_dblp_url(arxiv_identifier)
+        yield solr_record
+
+def parse_xml_insert_into_solr(root):
+    """ Function which parses the arxiv xml, and inserts some of the metadata
+    into an index in Apache Solr, in batches (see bulk_writer.py)."""
+    print(write_documents('metadata_plus', parse_xml_records(root)))
+    print("dblp urls looked up in {}".format(get_join_source()))
 
 if __name__ == '__main__':
     start_time = time()
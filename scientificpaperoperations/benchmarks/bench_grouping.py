@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+    #-------------------------------------------------------------------------------
+    # Name:        BENCHMARK CITATION GROUPING
+    # Purpose:     Compares the two ways of grouping the citation contexts of the cited
+    #              paper/cited author searches on large citation sets: result grouping in
+    #              Solr (citation_group field) and grouping the fetched contexts in Python.
+    #              Needs a running Solr with the references_plus index and the citation
+    #              model. The result cache is disabled while measuring.
+    #
+    #              Usage (from scientificpaperoperations/):
+    #              python benchmarks/bench_grouping.py --search-type authors --numrows 1000
+    #                     "Tim Berners-Lee" "Yoshua Bengio"
+    #-------------------------------------------------------------------------------
+
+"""
+import argparse
+import os
+import statistics
+import sys
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'scientificpaperoperations.settings')
+import django
+django.setup()
+from django.conf import settings
+from papersearchengine import result_cache
+from papersearchengine.django_paper_search_v2 import search_references_plus, search_references_plus_grouped
+
+def run_search(query, num_rows, search_type, grouping):
+    """ Runs one search with the given grouping ('solr' or 'python') and returns the results
+    tuple (or [] if there are no results). """
+    if grouping == 'solr':
+        reslist = search_references_plus_grouped(query, num_rows, search_type)
+        if reslist is None:
+            sys.exit("Solr couldn't group references_plus: was it built with the citation_group field?")
+        return reslist
+    settings.CITATION_GROUPING = 'python'
+    return search_references_plus(query, num_rows, search_type)
+
+def time_search(query, num_rows, search_type, grouping, repeat):
+    """ Returns the timings (seconds) of repeat runs of the search, and the no. of groups and
+    num_results of the last run. """
+    timings = []
+    for _ in range(repeat):
+        start_time = perf_counter()
+        reslist = run_search(query, num_rows, search_type, grouping)
+        timings.append(perf_counter() - start_time)
+    if reslist == []:
+        return timings, 0, 0
+    results, num_results = reslist[0], reslist[1]
+    return timings, len(results), num_results
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark Solr vs. Python citation grouping')
+    parser.add_argument('queries', nargs='+', help='cited titles or cited authors')
+    parser.add_argument('--search-type', choices=['title', 'authors'], default='authors')
+    parser.add_argument('--numrows', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    result_cache.configure(enabled=False)
+    print("{:<30} {:<7} {:>10} {:>10} {:>8} {:>12}".format('query', 'mode', 'median ms', 'min ms',
+                                                          'groups', 'numresults'))
+    for query in args.queries:
+        for grouping in ('solr', 'python'):
+            # One warm-up run (model load, Solr caches), which is not measured
+            run_search(query, args.numrows, args.search_type, grouping)
+            timings, num_groups, num_results = time_search(query, args.numrows, args.search_type,
+                                                           grouping, args.repeat)
+            print("{:<30} {:<7} {:>10.1f} {:>10.1f} {:>8} {:>12}".format(
+                query[:30], grouping, statistics.median(timings) * 1000, min(timings) * 1000,
+                num_groups, num_results))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""
+    #-------------------------------------------------------------------------------
+    # Name:        BENCHMARK SEARCH
+    # Purpose:     End-to-end benchmark of the query path, against the fake Solr server
+    #              (fake_solr.py), so that it runs without a populated Solr. Drives the
+    #              5 search functions (phrase, title, author, cited paper, cited author)
+    #              and their views (through Django's test client, so that the forms,
+    #              the thread pool and the templates are included) at several result
+    #              sizes, cold (result, fragment and prediction caches cleared before each
+    #              run) and warm. Reports p50/p95/p99 latency, throughput and peak allocations
+    #              (tracemalloc, in a separate run), and saves the results as json, so
+    #              that two commits can be compared with --compare.
+    #
+    #              Usage (from scientificpaperoperations/):
+    #              python benchmarks/bench_search.py --rows 10,100,1000,10000 --latency-ms 2
+    #              python benchmarks/bench_search.py --compare benchmarks/results/<commit>.json
+    #-------------------------------------------------------------------------------
+
+"""
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import tracemalloc
+from datetime import datetime
+from time import perf_counter
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.dirname(BENCHMARKS_DIR)
+sys.path.insert(0, PROJECT_DIR)
+sys.path.insert(0, BENCHMARKS_DIR)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'scientificpaperoperations.settings')
+import django
+django.setup()
+from django.conf import settings
+from django.test import Client
+from django.urls import reverse
+from fake_solr import FakeSolr
+from papersearchengine import fragment_cache, prediction_cache, result_cache, solr_client
+from papersearchengine.django_paper_search_v2 import (search_authors, search_meta_titles, search_references_plus,
+                                                      search_sentences_plus)
+
+# name -> (search function, query, extra args) of the searches which are benchmarked
+SEARCHES = {
+    'phrase': (search_sentences_plus, 'searched phrase', ()),
+    'title': (search_meta_titles, 'synthetic paper title', ()),
+    'author': (search_authors, ['Author 1', 'Coauthor 1'], ()),
+    'cited_paper': (search_references_plus, 'cited paper title', ('title',)),
+    'cited_author': (search_references_plus, 'Cited Author', ('authors',)),
+}
+
+# name -> (url name, query) of the views which are benchmarked
+VIEWS = {
+    'phrase_view': ('phrasesearchresults', 'searched phrase'),
+    'title_view': ('metadatatitlesearchresults', 'synthetic paper title'),
+    'author_view': ('authorsearchresults', 'Author 1; Coauthor 1'),
+    'cited_paper_view': ('citedpapersearchresults', 'cited paper title'),
+    'cited_author_view': ('citedauthorsearchresults', 'Cited Author'),
+}
+
+# The forms of the views accept at most 1000 rows
+MAX_VIEW_ROWS = 1000
+
+def percentile(timings, percent):
+    """ Returns the percentile of the timings, interpolated between the closest ranks. """
+    ordered = sorted(timings)
+    rank = (len(ordered) - 1) * percent / 100
+    lower = int(rank)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+def clear_caches():
+    result_cache.clear()
+    fragment_cache.clear()
+    prediction_cache.clear()
+
+def make_runner(name, num_rows, client):
+    """ Returns a function which runs the search (or view) name once with num_rows rows. """
+    if name in SEARCHES:
+        search_function, query, extra_args = SEARCHES[name]
+        return lambda: search_function(query, num_rows, *extra_args)
+    url_name, query = VIEWS[name]
+    url = reverse(url_name)
+
+    def run_view():
+        response = client.get(url, {'query': query, 'numrows': num_rows})
+        if response.status_code != 200:
+            sys.exit("{} returned {}".format(url, response.status_code))
+        # Streamed pages are only rendered while they are consumed
+        if response.streaming:
+            b''.join(response.streaming_content)
+    return run_view
+
+def measure(run, mode, repeat):
+    """ Returns the timings (ms) of repeat runs. Cold runs start with empty result and
+    prediction caches; warm runs are preceded by a warm-up run which is not measured. """
+    if mode == 'warm':
+        clear_caches()
+        run()
+    timings = []
+    for _ in range(repeat):
+        if mode == 'cold':
+            clear_caches()
+        start_time = perf_counter()
+        run()
+        timings.append((perf_counter() - start_time) * 1000)
+    return timings
+
+def measure_allocations(run, mode):
+    """ Returns the peak memory (KiB) allocated by 1 run, in the given mode. """
+    clear_caches()
+    if mode == 'warm':
+        run()
+    tracemalloc.start()
+    try:
+        run()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / 1024
+
+def get_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=PROJECT_DIR,
+                                       universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+def compare(results, old_results):
+    """ Prints the change of the p50/p95 latency and of the allocations of each benchmark which
+    is in both result sets. """
+    old_benchmarks = {(bench['name'], bench['mode'], bench['rows']): bench for bench in old_results['benchmarks']}
+    print("\nCompared with {} ({})".format(old_results['commit'], old_results['timestamp']))
+    print("{:<20} {:<5} {:>6} {:>10} {:>10} {:>10}".format('benchmark', 'mode', 'rows', 'p50 %', 'p95 %', 'KiB %'))
+    for bench in results['benchmarks']:
+        old = old_benchmarks.get((bench['name'], bench['mode'], bench['rows']))
+        if old is None:
+            continue
+        change = lambda key: (bench[key] - old[key]) / old[key] * 100 if old[key] else 0.0
+        print("{:<20} {:<5} {:>6} {:>+10.1f} {:>+10.1f} {:>+10.1f}".format(
+            bench['name'], bench['mode'], bench['rows'], change('p50_ms'), change('p95_ms'), change('peak_kib')))
+
+def main():
+    parser = argparse.ArgumentParser(description='End-to-end benchmark of the searches against a fake Solr')
+    parser.add_argument('--rows', default='10,100,1000,10000', help='comma-separated result sizes')
+    parser.add_argument('--benchmarks', default=','.join(list(SEARCHES) + list(VIEWS)),
+                        help='comma-separated searches/views to run')
+    parser.add_argument('--modes', default='cold,warm', help='cold, warm or both')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--latency-ms', type=float, default=0, help='latency of the fake Solr')
+    parser.add_argument('--num-found', type=int, default=20000, help='no. of docs each query matches')
+    parser.add_argument('--grouping', choices=['solr', 'python'], default=settings.CITATION_GROUPING)
+    parser.add_argument('--strip-polarity', action='store_true',
+                        help='citation contexts without a stored polarity (so the model predicts it)')
+    parser.add_argument('--responses-dir', default=None, help='replay <collection>.json from this folder')
+    parser.add_argument('--output', default=None, help='json file (default: benchmarks/results/<commit>.json)')
+    parser.add_argument('--compare', default=None, help='json file of an earlier run')
+    args = parser.parse_args()
+
+    fake_solr = FakeSolr(latency_ms=args.latency_ms, num_found=args.num_found, responses_dir=args.responses_dir,
+                         strip_polarity=args.strip_polarity)
+    solr_client.configure(base_url=fake_solr.start())
+    settings.CITATION_GROUPING = args.grouping
+    # In-memory persistent tier: the cold runs clear the cache, which mustn't touch the real one
+    prediction_cache.configure(sqlite_path=':memory:')
+    logging.getLogger('papersearchengine.performance').setLevel(logging.WARNING)
+    client = Client()
+
+    results = {'commit': get_commit(), 'timestamp': datetime.now().isoformat(timespec='seconds'),
+               'config': {'repeat': args.repeat, 'latency_ms': args.latency_ms, 'num_found': args.num_found,
+                          'grouping': args.grouping, 'strip_polarity': args.strip_polarity,
+                          'responses_dir': args.responses_dir},
+               'benchmarks': []}
+    print("{:<20} {:<5} {:>6} {:>9} {:>9} {:>9} {:>9} {:>10}".format('benchmark', 'mode', 'rows', 'p50 ms', 'p95 ms',
+                                                                     'p99 ms', 'req/s', 'peak KiB'))
+    try:
+        for name in args.benchmarks.split(','):
+            for num_rows in [int(rows) for rows in args.rows.split(',')]:
+                if name in VIEWS and num_rows > MAX_VIEW_ROWS:
+                    continue
+                run = make_runner(name, num_rows, client)
+                for mode in args.modes.split(','):
+                    timings = measure(run, mode, args.repeat)
+                    bench = {'name': name, 'mode': mode, 'rows': num_rows,
+                             'p50_ms': round(percentile(timings, 50), 3),
+                             'p95_ms': round(percentile(timings, 95), 3),
+                             'p99_ms': round(percentile(timings, 99), 3),
+                             'throughput': round(len(timings) / (sum(timings) / 1000), 2),
+                             'peak_kib': round(measure_allocations(run, mode), 1)}
+                    results['benchmarks'].append(bench)
+                    print("{name:<20} {mode:<5} {rows:>6} {p50_ms:>9.1f} {p95_ms:>9.1f} {p99_ms:>9.1f} "
+                          "{throughput:>9.1f} {peak_kib:>10.1f}".format(**bench))
+    finally:
+        fake_solr.stop()
+
+    output = args.output or os.path.join(BENCHMARKS_DIR, 'results', '{}.json'.format(results['commit']))
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w') as output_file:
+        json.dump(results, output_file, indent=2)
+    print("\nSaved to {} ({} Solr requests)".format(output, fake_solr.request_count))
+    if args.compare:
+        with open(args.compare) as old_file:
+            compare(results, json.load(old_file))
+
+if __name__ == '__main__':
+    main()
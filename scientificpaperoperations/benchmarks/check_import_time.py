@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+    #-------------------------------------------------------------------------------
+    # Name:        CHECK IMPORT TIME
+    # Purpose:     Reports what a worker (or a manage.py command) spends on imports at
+    #              startup: django.setup() plus the app's urls, views and API, measured in
+    #              a fresh interpreter with python -X importtime. The cumulative time is
+    #              broken down by top-level package. Exits with 1 if the total is over the
+    #              budget or if one of the lazily loaded packages (scikit-learn, pandas,
+    #              emoji by default) is imported at startup, so it can be run in CI.
+    #
+    #              Usage (from scientificpaperoperations/):
+    #              python benchmarks/check_import_time.py --budget-ms 1500
+    #-------------------------------------------------------------------------------
+
+"""
+import argparse
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# What a worker imports before it serves its first request
+STARTUP_CODE = """
+import os, sys
+sys.path.insert(0, {project_dir!r})
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'scientificpaperoperations.settings')
+import django
+django.setup()
+import papersearchengine.urls
+"""
+
+def measure_imports():
+    """ Runs the startup imports in a fresh interpreter with -X importtime and returns a list of
+    (depth, module, self microseconds, cumulative microseconds) in the order of the report. """
+    completed = subprocess.run([sys.executable, '-X', 'importtime', '-c',
+                                STARTUP_CODE.format(project_dir=PROJECT_DIR)],
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    if completed.returncode != 0:
+        sys.exit("The startup imports failed:\n" + completed.stderr[-2000:])
+    imports = []
+    for line in completed.stderr.splitlines():
+        # import time:       self [us] |  cumulative | imported package
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        imports.append((depth, name.strip(), int(self_us), int(cumulative_us)))
+    return imports
+
+def summarize(imports):
+    """ Returns the total startup import time (ms) and a dict top-level package -> cumulative
+    ms. Only the outermost imports are counted, so nested imports aren't counted twice. """
+    shallowest = min(depth for depth, name, self_us, cumulative_us in imports)
+    by_package = defaultdict(float)
+    for depth, name, self_us, cumulative_us in imports:
+        if depth == shallowest:
+            by_package[name.split('.')[0]] += cumulative_us / 1000
+    return sum(by_package.values()), by_package
+
+def main():
+    parser = argparse.ArgumentParser(description='Report (and check) the import time at startup')
+    parser.add_argument('--budget-ms', type=float, default=None,
+                        help='fail if the total import time is over this many milliseconds')
+    parser.add_argument('--forbid', default='sklearn,pandas,emoji',
+                        help='comma-separated packages which must not be imported at startup')
+    parser.add_argument('--top', type=int, default=15, help='no. of packages in the breakdown')
+    args = parser.parse_args()
+
+    imports = measure_imports()
+    total_ms, by_package = summarize(imports)
+    print("{:<30} {:>10}".format('package', 'ms'))
+    for package, package_ms in sorted(by_package.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print("{:<30} {:>10.1f}".format(package, package_ms))
+    print("{:<30} {:>10.1f}".format('TOTAL', total_ms))
+
+    failed = False
+    forbidden = {package.strip() for package in args.forbid.split(',') if package.strip()}
+    imported_forbidden = sorted({name.split('.')[0] for depth, name, self_us, cumulative_us in imports} & forbidden)
+    if imported_forbidden:
+        print("FAIL: imported at startup: {}".format(', '.join(imported_forbidden)))
+        failed = True
+    if args.budget_ms is not None and total_ms > args.budget_ms:
+        print("FAIL: {:.1f} ms is over the budget of {:.1f} ms".format(total_ms, args.budget_ms))
+        failed = True
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
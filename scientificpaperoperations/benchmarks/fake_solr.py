@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+"""
+    #-------------------------------------------------------------------------------
+    # Name:        FAKE SOLR
+    # Purpose:     Local stand-in for Solr, so that the query path can be benchmarked
+    #              without a populated Solr instance. It answers /select (GET and POST)
+    #              and /admin/luke for papers_plus, metadata_plus and references_plus with
+    #              synthetic docs (numFound, rows, start/cursorMark paging, result grouping
+    #              on citation_group, group.query batches and the citation_polarity facet),
+    #              after a configurable latency. Recorded responses can be replayed instead:
+    #              <responses dir>/<collection>.json is returned for every select on the
+    #              collection. Synthetic docs are deterministic, so runs are repeatable.
+    #
+    #              Usage (from scientificpaperoperations/), standalone:
+    #              python benchmarks/fake_solr.py --port 8984 --latency-ms 5 --num-found 20000
+    #              (then set SOLR_URL = 'http://localhost:8984/solr/'), or from
+    #              bench_search.py, which starts it in a thread.
+    #-------------------------------------------------------------------------------
+
+"""
+import argparse
+import json
+import os
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import sleep
+from urllib.parse import urlparse, parse_qs
+
+COLLECTIONS = ('papers_plus', 'metadata_plus', 'references_plus')
+POLARITIES = ('positive', 'neutral', 'neutral', 'neutral', 'negative')
+
+def make_doc(collection, number, group_size):
+    """ Returns synthetic doc no. number of the collection, with the stored fields of the schema.
+    For references_plus, group_size consecutive docs are sentences of the same citing paper with
+    the same citation (same citation_group). """
+    year, month, day = 2018 - number % 10, 1 + number % 12, 1 + number % 28
+    published_date = '{:04d}-{:02d}-{:02d}T00:00:00Z'.format(year, month, day)
+    published_date_display = '{} {:02d}, {}'.format(('January', 'February', 'March', 'April', 'May', 'June', 'July',
+                                                     'August', 'September', 'October', 'November',
+                                                     'December')[month - 1], day, year)
+    if collection == 'references_plus':
+        group = number // group_size
+        annotation = '<GC:{}>'.format(1000 + group % 97)
+        sentence = 'Sentence {} of the citing paper, which builds on the approach of {} for the task.'.format(
+                   number, annotation)
+        start = sentence.find(annotation)
+        return {'id': 'ref-{}'.format(number), 'annotation': annotation,
+                'cited_paper_details': 'Cited Author {0}; Other Author {0}. A cited paper title {0}'.format(group % 97),
+                'citing_arxiv_identifier': '18{:02d}.{:05d}'.format(month, group),
+                'citing_arxiv_url': 'http://arxiv.org/abs/18{:02d}.{:05d}'.format(month, group),
+                'citing_dblp_url': 'unavailable' if group % 3 else 'https://dblp.org/rec/{}'.format(group),
+                'citing_paper_authors': 'Author {0}; Coauthor {0}'.format(group),
+                'citing_paper_title': 'Citing paper number {}'.format(group),
+                'citing_published_date': published_date, 'citing_published_date_display': published_date_display,
+                'citing_revision_dates': 'unavailable', 'citing_sentence': sentence,
+                'citing_sentencenum': number % group_size, 'annotation_start': start,
+                'annotation_end': start + len(annotation),
+                'citation_polarity': POLARITIES[number % len(POLARITIES)],
+                'citation_group': '18{:02d}.{:05d}|{}'.format(month, group, annotation)}
+    doc = {'arxiv_identifier': '18{:02d}.{:05d}'.format(month, number),
+           'arxiv_url': 'http://arxiv.org/abs/18{:02d}.{:05d}'.format(month, number),
+           'authors': 'Author {0}; Coauthor {0}; Third Author {0}'.format(number),
+           'dblp_url': 'unavailable' if number % 3 else 'https://dblp.org/rec/{}'.format(number),
+           'published_date': published_date, 'published_date_display': published_date_display,
+           'revision_dates': 'unavailable', 'title': 'A synthetic paper title number {}'.format(number)}
+    if collection == 'papers_plus':
+        doc['id'] = 'sentence-{}'.format(number)
+        doc['sentence'] = 'Sentence {} of a paper, which contains the phrase that was searched for.'.format(number)
+        doc['sentencenum'] = number % 200
+    return doc
+
+class FakeSolr:
+    """ Fake Solr server, see the module docstring. num_found is the no. of docs which every query
+    matches, latency_ms the delay before each select is answered (also returned as QTime), and
+    group_size the no. of references_plus docs per citation group. """
+
+    def __init__(self, port=0, latency_ms=0, num_found=20000, group_size=3, responses_dir=None,
+                 strip_polarity=False):
+        self.latency_ms = latency_ms
+        self.num_found = num_found
+        self.group_size = group_size
+        self.responses_dir = responses_dir
+        # Docs without citation_polarity, like an index built before the field existed
+        self.strip_polarity = strip_polarity
+        self.request_count = 0
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), self._make_handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}/solr/'.format(self.server.server_address[1])
+
+    def start(self):
+        """ Serves the requests in a background thread, and returns the base url (for SOLR_URL). """
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self.url
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _make_handler(self):
+        fake_solr = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                self.respond(url.path, parse_qs(url.query))
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('utf-8')
+                self.respond(urlparse(self.path).path, parse_qs(body))
+
+            def respond(self, path, params):
+                status, body = fake_solr.handle(path, params)
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def handle(self, path, params):
+        """ Returns (status, body) for a request: path is /solr/<collection>/<handler>, params a
+        dict name -> list of values. """
+        parts = path.strip('/').split('/')
+        if len(parts) < 3 or parts[0] != 'solr' or parts[1] not in COLLECTIONS:
+            return 404, json.dumps({'error': {'msg': 'Unknown path ' + path}}).encode('utf-8')
+        collection, handler = parts[1], '/'.join(parts[2:])
+        if handler == 'admin/luke':
+            return 200, json.dumps({'index': {'version': 1, 'numDocs': self.num_found}}).encode('utf-8')
+        if handler != 'select':
+            return 404, json.dumps({'error': {'msg': 'Unknown handler ' + handler}}).encode('utf-8')
+        with self._lock:
+            self.request_count += 1
+        if self.latency_ms:
+            sleep(self.latency_ms / 1000)
+        if self.responses_dir is not None:
+            recorded = os.path.join(self.responses_dir, collection + '.json')
+            if os.path.exists(recorded):
+                with open(recorded, 'rb') as recorded_file:
+                    return 200, recorded_file.read()
+        # Only the params which change the response are part of the (cached) response's key
+        key = tuple((name, tuple(values)) for name, values in sorted(params.items())
+                    if name in ('q', 'rows', 'start', 'cursorMark', 'group', 'group.field', 'group.query',
+                                'group.limit', 'facet', 'facet.field'))
+        return 200, self._select(collection, key)
+
+    @lru_cache(maxsize=256)
+    def _docs(self, collection, start, rows):
+        rows = max(0, min(rows, self.num_found - start))
+        docs = [make_doc(collection, number, self.group_size) for number in range(start, start + rows)]
+        if self.strip_polarity:
+            for doc in docs:
+                doc.pop('citation_polarity', None)
+        return docs
+
+    @lru_cache(maxsize=256)
+    def _select(self, collection, key):
+        """ Returns the json body of a select (cached, so that the server's own work is the same in
+        cold and warm runs). """
+        params = {name: list(values) for name, values in key}
+        first = lambda name, default: params.get(name, [default])[0]
+        rows = int(first('rows', 10))
+        header = {'status': 0, 'QTime': int(self.latency_ms),
+                  'params': {'q': first('q', '*:*'), 'rows': str(rows)}}
+        data = OrderedDict([('responseHeader', header)])
+        if first('group', 'false') == 'true' and 'group.query' in params:
+            # Batch: the same top docs for each group query
+            limit = int(first('group.limit', 1))
+            data['grouped'] = {query: {'matches': self.num_found,
+                                       'doclist': {'numFound': self.num_found, 'start': 0,
+                                                   'docs': self._docs(collection, 0, limit)}}
+                               for query in params['group.query']}
+        elif first('group', 'false') == 'true':
+            start = int(first('start', 0))
+            limit = int(first('group.limit', 1))
+            num_groups = self.num_found // self.group_size
+            groups = []
+            for group in range(start, min(start + rows, num_groups)):
+                docs = self._docs(collection, group * self.group_size, min(limit, self.group_size))
+                groups.append({'groupValue': docs[0].get('citation_group') if docs else None,
+                               'doclist': {'numFound': self.group_size, 'start': 0, 'docs': docs}})
+            data['grouped'] = {first('group.field', ''): {'matches': self.num_found, 'ngroups': num_groups,
+                                                          'groups': groups}}
+        else:
+            cursor_mark = first('cursorMark', None)
+            if cursor_mark is not None:
+                start = 0 if cursor_mark == '*' else int(cursor_mark.split(':')[1])
+            else:
+                start = int(first('start', 0))
+            docs = self._docs(collection, start, rows)
+            data['response'] = {'numFound': self.num_found, 'start': start, 'docs': docs}
+            if cursor_mark is not None:
+                # Like Solr, the same cursorMark is returned after the last page
+                data['nextCursorMark'] = 'offset:{}'.format(start + len(docs)) if docs else cursor_mark
+        if first('facet', 'false') == 'true' and first('facet.field', '') == 'citation_polarity':
+            counts = [self.num_found * POLARITIES.count(polarity) // len(POLARITIES)
+                      for polarity in ('positive', 'neutral', 'negative')]
+            data['facet_counts'] = {'facet_fields': {'citation_polarity': ['positive', counts[0], 'neutral', counts[1],
+                                                                           'negative', counts[2]]}}
+        return json.dumps(data).encode('utf-8')
+
+def main():
+    parser = argparse.ArgumentParser(description='Fake Solr server for benchmarks')
+    parser.add_argument('--port', type=int, default=8984)
+    parser.add_argument('--latency-ms', type=float, default=0)
+    parser.add_argument('--num-found', type=int, default=20000)
+    parser.add_argument('--group-size', type=int, default=3)
+    parser.add_argument('--responses-dir', default=None, help='replay <collection>.json from this folder')
+    args = parser.parse_args()
+    fake_solr = FakeSolr(args.port, args.latency_ms, args.num_found, args.group_size, args.responses_dir)
+    print("Fake Solr at {}".format(fake_solr.url))
+    try:
+        fake_solr.server.serve_forever()
+    except KeyboardInterrupt:
+        fake_solr.stop()
+
+if __name__ == '__main__':
+    main()
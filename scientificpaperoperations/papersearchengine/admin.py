@@ -1,3 +1,10 @@
 from django.contrib import admin
+from .models import ExportJob
 
 # Register your models here.
+
+@admin.register(ExportJob)
+class ExportJobAdmin(admin.ModelAdmin):
+    list_display = ('search_name', 'query', 'file_format', 'status', 'num_exported', 'num_results', 'created_at')
+    list_filter = ('status', 'search_name', 'file_format')
+    search_fields = ('query',)
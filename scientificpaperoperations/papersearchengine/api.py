@@ -0,0 +1,183 @@
+    #-------------------------------------------------------------------------------
+    # Name:        Search API
+    # Purpose:     Versioned JSON API for the five searches, for batch clients which would
+    #              otherwise have to scrape the results pages. Records have the field names
+    #              of the _plus Solr schemas. format=json returns one page (paged with
+    #              cursorMark), format=ndjson streams all the results (1 record per line) as
+    #              the Solr pages arrive, so that the server only holds one page at a time
+    #              (under WSGI and ASGI, see async_search.streaming_content).
+    #              The batch endpoint runs a search for a whole list of queries at once, and
+    #              the bibliography endpoint resolves a whole reference list (streamed). The
+    #              suggest endpoint returns the typeahead suggestions of the search forms.
+    #-------------------------------------------------------------------------------
+
+import json
+from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from .async_search import streaming_content
+from .bibliography import parse_bibliography, resolve_bibliography
+from . import suggestions
+from .forms import ApiSearchForm, BibliographyForm, SuggestForm
+from .django_paper_search_v2 import SEARCH_DEFINITIONS, POLARITY_NAMES, fetch_records_page, get_polarity_counts, \
+                                    iter_records_pages, polarity_filter_query, prepare_query, search_batch, \
+                                    serialize_records, serialize_record_lists
+from .solr_client import SolrError
+
+API_VERSION = 'v1'
+
+def search(request, search_name):
+    """ GET /searchengine/api/v1/<search_name>/?query=...&numrows=...&cursor=...&format=json|ndjson&max_results=...
+    search_name is phrase, title, author, cited_paper or cited_author. For the author searches, the
+    authors are separated by semicolons, like in the forms. The citation contexts of the cited_paper
+    and cited_author searches can be filtered with polarity=positive|neutral|negative, and their json
+    response has the no. of contexts of each polarity (polarity_counts). """
+    if search_name not in SEARCH_DEFINITIONS:
+        return error_response(404, "Unknown search '{}', use one of: {}".format(
+                                   search_name, ', '.join(SEARCH_DEFINITIONS)))
+    form = ApiSearchForm(request.GET)
+    if not form.is_valid():
+        return error_response(400, form.errors.get_json_data())
+    cleaned = form.cleaned_data
+    query = prepare_query(search_name, cleaned['query'])
+    citation_search = SEARCH_DEFINITIONS[search_name][0] == 'references_plus'
+    polarity = cleaned.get('polarity') or None
+    if polarity is not None and not citation_search:
+        return error_response(400, "polarity can only be used with the cited_paper and cited_author searches")
+    filter_query = polarity_filter_query(polarity)
+    if cleaned.get('format') == 'ndjson':
+        return stream_search(request, search_name, query, cleaned.get('numrows') or settings.API_STREAM_PAGE_SIZE,
+                             cleaned.get('max_results'), filter_query)
+    num_rows = cleaned.get('numrows') or settings.API_DEFAULT_ROWS
+    cursor = cleaned.get('cursor') or '*'
+    try:
+        records, num_results, next_cursor = fetch_records_page(search_name, query, num_rows, cursor, filter_query)
+        # Counts for the whole query (not only the filtered polarity). None if the index has no
+        # citation_polarity field.
+        polarity_counts = get_polarity_counts(query, 0, 'title' if search_name == 'cited_paper'
+                                                        else 'authors') if citation_search else None
+    except SolrError as err:
+        return error_response(502, str(err))
+    response = {'version': API_VERSION, 'search': search_name, 'query': cleaned['query'],
+                'numresults': num_results, 'numrows': num_rows, 'cursor': cursor,
+                # None after the last page
+                'next_cursor': next_cursor if next_cursor != cursor else None,
+                'results': serialize_records(records)}
+    if citation_search:
+        response['polarity'] = polarity
+        response['polarity_counts'] = polarity_counts
+    return JsonResponse(response)
+
+@csrf_exempt
+@require_POST
+def batch_search(request, search_name):
+    """ POST /searchengine/api/v1/batch/<search_name>/ with the json body
+    {"queries": ["query 1", "query 2", ...], "numrows": 10}
+    Returns the top numrows results of each query: {"results": [{"query": ..., "numresults": ...,
+    "results": [...]}, ...]}, in the order of the (distinct) queries. The queries are sent to Solr
+    in a few grouped requests, and the citation polarity is predicted in 1 call to the model for
+    the results of all the queries. """
+    if search_name not in SEARCH_DEFINITIONS:
+        return error_response(404, "Unknown search '{}', use one of: {}".format(
+                                   search_name, ', '.join(SEARCH_DEFINITIONS)))
+    try:
+        body = json.loads(request.body.decode('utf-8'))
+    except ValueError:
+        return error_response(400, "The body must be a json object")
+    queries = body.get('queries') if isinstance(body, dict) else None
+    num_rows = body.get('numrows', settings.API_BATCH_DEFAULT_ROWS) if isinstance(body, dict) else None
+    if not isinstance(queries, list) or not all(isinstance(query, str) for query in queries):
+        return error_response(400, "queries must be a list of strings")
+    if len(queries) > settings.API_BATCH_MAX_QUERIES:
+        return error_response(400, "At most {} queries can be sent at once".format(settings.API_BATCH_MAX_QUERIES))
+    if not isinstance(num_rows, int) or not 1 <= num_rows <= 1000:
+        return error_response(400, "numrows must be a number between 1 and 1000")
+    try:
+        batch_results = search_batch(search_name, queries, num_rows)
+    except SolrError as err:
+        return error_response(502, str(err))
+    serialized_lists = serialize_record_lists([records for records, num_results in batch_results.values()])
+    results = [{'query': query, 'numresults': num_results, 'results': serialized}
+               for (query, (records, num_results)), serialized in zip(batch_results.items(), serialized_lists)]
+    return JsonResponse({'version': API_VERSION, 'search': search_name, 'numrows': num_rows, 'results': results})
+
+@csrf_exempt
+@require_POST
+def bibliography_search(request):
+    """ POST /searchengine/api/v1/bibliography/ with the reference list (BibTeX or one title per line)
+    in the field text or uploaded in the field file, and optionally numrows (citation contexts per
+    entry). Streams 1 json line per entry, in the order of the list, as the entries are resolved:
+    {"entry": 1, "title": ..., "paper": {...} or null, "numresults": ..., "contexts": [...]} """
+    form = BibliographyForm(request.POST, request.FILES)
+    if not form.is_valid():
+        return error_response(400, form.errors.get_json_data())
+    cleaned = form.cleaned_data
+    titles = parse_bibliography(cleaned['bibliography'])[:settings.BIBLIOGRAPHY_MAX_ENTRIES]
+    numrows = cleaned.get('numrows')
+    if numrows is None:
+        numrows = settings.BIBLIOGRAPHY_CONTEXTS_PER_ENTRY
+
+    def generate_lines():
+        try:
+            for number, entry in enumerate(resolve_bibliography(titles, numrows), 1):
+                contexts = [dict(context._asdict(), citation_polarity=POLARITY_NAMES[polarity])
+                            for context, polarity in zip(entry.contexts, entry.polarities)]
+                yield json.dumps({'entry': number, 'title': entry.title,
+                                  'paper': entry.paper._asdict() if entry.paper is not None else None,
+                                  'numresults': entry.num_contexts, 'contexts': contexts}) + '\n'
+        except SolrError as err:
+            yield json.dumps({'error': str(err)}) + '\n'
+
+    response = StreamingHttpResponse(streaming_content(request, generate_lines()),
+                                     content_type='application/x-ndjson')
+    response['X-API-Version'] = API_VERSION
+    return response
+
+def suggest(request, search_name):
+    """ GET /searchengine/api/v1/suggest/<search_name>/?q=...&limit=...
+    Returns the typeahead suggestions for what was typed (q) in the form of the title, author,
+    cited_paper or cited_author search: {"suggestions": [...]}, best first. They come from the
+    prefix index in memory (see suggestions.py), not from Solr, so they are empty until the index
+    has been built with manage.py build_suggestions. """
+    if search_name not in suggestions.SUGGESTION_DICTIONARIES:
+        return error_response(404, "No suggestions for '{}', use one of: {}".format(
+                                   search_name, ', '.join(suggestions.SUGGESTION_DICTIONARIES)))
+    form = SuggestForm(request.GET)
+    if not form.is_valid():
+        return error_response(400, form.errors.get_json_data())
+    cleaned = form.cleaned_data
+    return JsonResponse({'version': API_VERSION, 'search': search_name, 'q': cleaned['q'],
+                         'suggestions': suggestions.suggest(search_name, cleaned['q'], cleaned.get('limit') or 10)})
+
+def stream_search(request, search_name, query, page_size, max_results, filter_query=None):
+    """ Returns a streaming response with all the results of the search (or the first
+    max_results) as NDJSON, 1 chunk per page. The first page is fetched before the response
+    starts, so that a Solr error can still be returned as a 502. """
+    pages = iter_records_pages(search_name, query, page_size, max_results, filter_query)
+    try:
+        first_page, num_results = next(pages, ([], 0))
+    except SolrError as err:
+        return error_response(502, str(err))
+
+    def generate_pages():
+        yield ''.join(generate_ndjson(first_page))
+        try:
+            for records, num_results in pages:
+                yield ''.join(generate_ndjson(records))
+        except SolrError as err:
+            # The status has already been sent: the error is the last line.
+            yield json.dumps({'error': str(err)}) + '\n'
+
+    response = StreamingHttpResponse(streaming_content(request, generate_pages()),
+                                     content_type='application/x-ndjson')
+    response['X-API-Version'] = API_VERSION
+    return response
+
+def generate_ndjson(records):
+    """ Yields one json line per record. """
+    for record in serialize_records(records):
+        yield json.dumps(record) + '\n'
+
+def error_response(status, message):
+    return JsonResponse({'version': API_VERSION, 'error': message}, status=status)
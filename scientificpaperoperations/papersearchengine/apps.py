@@ -1,5 +1,46 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class PapersearchengineConfig(AppConfig):
     name = 'papersearchengine'
+
+    def ready(self):
+        """ Configures the shared Solr client, the result, fragment and prediction caches, the suggestions and the async search pool
+        from settings. Nothing heavy is imported or loaded here (this runs for every manage.py
+        command too): the citation model is loaded on first use, or by preload.py in servers. """
+        from . import async_search, fragment_cache, model_registry, prediction_cache, result_cache, solr_client, \
+                      suggestions
+        solr_client.configure(base_url=getattr(settings, 'SOLR_URL', None),
+                              pool_size=getattr(settings, 'SOLR_POOL_SIZE', None),
+                              connect_timeout=getattr(settings, 'SOLR_CONNECT_TIMEOUT', None),
+                              read_timeout=getattr(settings, 'SOLR_READ_TIMEOUT', None),
+                              max_retries=getattr(settings, 'SOLR_MAX_RETRIES', None),
+                              backoff_factor=getattr(settings, 'SOLR_BACKOFF_FACTOR', None),
+                              debug_timing=getattr(settings, 'SOLR_DEBUG_TIMING', None))
+        result_cache_settings = getattr(settings, 'RESULT_CACHE', {})
+        result_cache.configure(enabled=result_cache_settings.get('ENABLED'),
+                               backend=result_cache_settings.get('BACKEND'),
+                               max_entries=result_cache_settings.get('MAX_ENTRIES'),
+                               ttl=result_cache_settings.get('TTL'),
+                               cache_alias=result_cache_settings.get('CACHE_ALIAS'),
+                               index_version_check_interval=result_cache_settings.get('INDEX_VERSION_CHECK_INTERVAL'))
+        fragment_cache_settings = getattr(settings, 'FRAGMENT_CACHE', {})
+        fragment_cache.configure(enabled=fragment_cache_settings.get('ENABLED'),
+                                 backend=fragment_cache_settings.get('BACKEND'),
+                                 max_entries=fragment_cache_settings.get('MAX_ENTRIES'),
+                                 max_bytes=fragment_cache_settings.get('MAX_BYTES'),
+                                 max_fragment_bytes=fragment_cache_settings.get('MAX_FRAGMENT_BYTES'),
+                                 ttl=fragment_cache_settings.get('TTL'),
+                                 cache_alias=fragment_cache_settings.get('CACHE_ALIAS'))
+        prediction_cache_settings = getattr(settings, 'PREDICTION_CACHE', {})
+        prediction_cache.configure(enabled=prediction_cache_settings.get('ENABLED'),
+                                   max_entries=prediction_cache_settings.get('MAX_ENTRIES'),
+                                   sqlite_path=prediction_cache_settings.get('SQLITE_PATH'))
+        suggestions_settings = getattr(settings, 'SUGGESTIONS', {})
+        suggestions.configure(index_path=suggestions_settings.get('INDEX_PATH'),
+                              max_entries=suggestions_settings.get('MAX_ENTRIES'),
+                              min_prefix_length=suggestions_settings.get('MIN_PREFIX_LENGTH'),
+                              reload_check_interval=suggestions_settings.get('RELOAD_CHECK_INTERVAL'))
+        async_search.configure(max_concurrency=getattr(settings, 'SEARCH_MAX_CONCURRENCY', None))
+        model_registry.configure(getattr(settings, 'CITATION_MODEL_PATH', None))
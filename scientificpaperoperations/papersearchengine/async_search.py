@@ -0,0 +1,144 @@
+    #-------------------------------------------------------------------------------
+    # Name:        Async search
+    # Purpose:     Lets the async views run the (blocking) search functions of
+    #              django_paper_search_v2 without blocking the event loop. Each search
+    #              (Solr round trip over the pooled session + sentiment/grouping) runs in a
+    #              per-process thread pool, whose size bounds the no. of searches (and so
+    #              Solr requests) in flight in the process. Requests over the limit wait
+    #              in the pool's queue without holding a worker. The streamed responses
+    #              (NDJSON, bibliography) get their chunks the same way under ASGI.
+    #-------------------------------------------------------------------------------
+
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import django
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+
+_config = {
+    # Max. no. of searches running at the same time in this process. It shouldn't be higher
+    # than the Solr client's pool size, or the extra threads just wait for a connection.
+    'max_concurrency': int(os.environ.get('SEARCH_MAX_CONCURRENCY', 10)),
+}
+
+_lock = threading.Lock()
+# The pool is created lazily and re-created in child processes (e.g. after a fork in a
+# pre-forking server), like the Solr client's session.
+_executor = None
+_executor_pid = None
+_stats = {'running': 0, 'completed': 0}
+
+def configure(**kwargs):
+    """ Updates the config (max_concurrency). Values which are None are ignored. The thread
+    pool is rebuilt on next use; searches already submitted finish in the old one. """
+    global _executor
+    with _lock:
+        for key, value in kwargs.items():
+            if key not in _config:
+                raise ValueError("Unknown async search setting: {}".format(key))
+            if value is not None:
+                _config[key] = value
+        old_executor, _executor = _executor, None
+    if old_executor is not None:
+        old_executor.shutdown(wait=False)
+
+def get_executor():
+    """ Returns the thread pool of this process, creating it if needed. """
+    global _executor, _executor_pid
+    executor = _executor
+    if executor is not None and _executor_pid == os.getpid():
+        return executor
+    with _lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=_config['max_concurrency'],
+                                           thread_name_prefix='papersearch')
+            _executor_pid = os.getpid()
+        return _executor
+
+def _count(counter, delta):
+    with _lock:
+        _stats[counter] += delta
+
+def _run_counted(search_func, args, kwargs):
+    """ Runs the search in a pool thread, keeping the running/completed counts up to date. """
+    _count('running', 1)
+    try:
+        return search_func(*args, **kwargs)
+    finally:
+        _count('running', -1)
+        _count('completed', 1)
+
+async def run_search(search_func, *args, **kwargs):
+    """ Runs search_func(*args, **kwargs) (one of the search functions, e.g.
+    search_references_plus) in the thread pool and returns its results, without blocking
+    the event loop while it waits for Solr or predicts the sentiment. The search runs in a copy of
+    the view's context, so that its stages are timed in the request (see instrumentation.py). """
+    loop = asyncio.get_event_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(get_executor(),
+                                      functools.partial(context.run, _run_counted, search_func, args, kwargs))
+
+def get_stats():
+    """ Returns a dict with the max. concurrency and the no. of searches which are running
+    and completed in this process. """
+    with _lock:
+        stats = dict(_stats)
+    stats['max_concurrency'] = _config['max_concurrency']
+    return stats
+
+async def run_search_with_timeout(search_func, args, kwargs, timeout):
+    """ Runs the search like run_search, but gives up waiting for it after timeout seconds.
+    Returns (results, status), where status is 'ok', 'timeout' (results is None) or 'error'
+    (results is None). A search which timed out keeps its pool thread until Solr answers
+    (its results still end up in the result cache). """
+    try:
+        results = await asyncio.wait_for(run_search(search_func, *args, **kwargs), timeout)
+    except asyncio.TimeoutError:
+        return None, 'timeout'
+    except Exception:
+        return None, 'error'
+    return results, 'ok'
+
+async def run_searches(searches, timeout):
+    """ Runs several searches concurrently, each with its own time budget of timeout seconds,
+    so that the total time is that of the slowest one (at most timeout). searches is a dict
+    name -> (search_func, args, kwargs). Returns an OrderedDict name -> (results, status) in
+    the same order, see run_search_with_timeout. """
+    names = list(searches)
+    outcomes = await asyncio.gather(*[run_search_with_timeout(*searches[name], timeout)
+                                      for name in names])
+    return OrderedDict(zip(names, outcomes))
+
+# Returned by next() when a streamed iterator is exhausted
+_END_OF_STREAM = object()
+
+async def iterate_in_thread(iterator):
+    """ Async generator which yields the items of a blocking iterator (e.g. a generator which
+    fetches Solr pages), each one pulled in a thread, so that the event loop isn't blocked while
+    the next item is produced. The iterator is closed if the stream stops early (e.g. the client
+    disconnected). """
+    pull = sync_to_async(next, thread_sensitive=False)
+    try:
+        while True:
+            item = await pull(iterator, _END_OF_STREAM)
+            if item is _END_OF_STREAM:
+                return
+            yield item
+    finally:
+        close = getattr(iterator, 'close', None)
+        if close is not None:
+            await sync_to_async(close, thread_sensitive=False)()
+
+def streaming_content(request, iterator):
+    """ Returns the content of a StreamingHttpResponse which sends the chunks of iterator as they
+    are produced. Under ASGI, Django (>= 4.2) collects a sync iterator with sync_to_async(list)
+    before it sends anything, so it gets an async iterator instead (see iterate_in_thread). Under
+    WSGI (and older Django versions), the iterator is streamed as it is. """
+    if isinstance(request, ASGIRequest) and django.VERSION >= (4, 2):
+        return iterate_in_thread(iterator)
+    return iterator
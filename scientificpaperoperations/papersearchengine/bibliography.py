@@ -0,0 +1,94 @@
+    #-------------------------------------------------------------------------------
+    # Name:        Bibliography
+    # Purpose:     Parses reference lists (BibTeX or one title per line) and resolves all
+    #              their entries against metadata_plus (the arXiv paper with the title) and
+    #              references_plus (citation contexts which cite the title) in bulk: the
+    #              titles are sent in batches (see search_batch), and the entries are yielded
+    #              batch by batch, so that the results can be streamed while the rest of the
+    #              list is being resolved.
+    #-------------------------------------------------------------------------------
+
+import re
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from .django_paper_search_v2 import search_batch, get_polarities
+
+# Resolved entry of a bibliography: paper is the best matching PaperMetadata record (or None),
+# contexts are the top CitationContext records which cite it (out of num_contexts), and
+# polarities the citation polarity ('p', 'n', 'o') of each of the contexts.
+BibliographyEntry = namedtuple('BibliographyEntry', ['title', 'paper', 'num_contexts', 'contexts', 'polarities'])
+
+# Start of a BibTeX entry, e.g. @article{key,
+BIBTEX_ENTRY_START = re.compile(r'@\w+\s*[{(]')
+BIBTEX_TITLE_FIELD = re.compile(r'[,{(\s]title\s*=\s*', re.IGNORECASE)
+# LaTeX commands like \emph or \"
+LATEX_COMMAND = re.compile(r'\\([a-zA-Z]+|.)\s*')
+
+def parse_bibliography(text):
+    """ Returns the list of titles in text, which is either BibTeX (the title fields of the
+    entries) or a plain list with one title per line (empty lines and lines starting with %
+    or # are skipped). """
+    if BIBTEX_ENTRY_START.search(text):
+        titles = parse_bibtex_titles(text)
+    else:
+        titles = [line for line in text.splitlines() if line.strip() and not line.lstrip().startswith(('%', '#'))]
+    titles = [clean_title(title) for title in titles]
+    return [title for title in titles if title]
+
+def parse_bibtex_titles(text):
+    """ Returns the values of the title fields of the BibTeX entries in text. The values may be
+    in braces (with nested braces) or in double quotes. """
+    titles = []
+    for entry in BIBTEX_ENTRY_START.split(text)[1:]:
+        match = BIBTEX_TITLE_FIELD.search(',' + entry)
+        if match is None:
+            continue
+        value = (',' + entry)[match.end():]
+        if value.startswith('{'):
+            # Find the matching closing brace
+            depth = 0
+            for position, char in enumerate(value):
+                if char == '{':
+                    depth += 1
+                elif char == '}':
+                    depth -= 1
+                    if depth == 0:
+                        titles.append(value[1:position])
+                        break
+        elif value.startswith('"'):
+            end = value.find('"', 1)
+            if end != -1:
+                titles.append(value[1:end])
+    return titles
+
+def clean_title(title):
+    """ Removes LaTeX commands, braces and double quotes (which would end the phrase query) from
+    a title, and folds whitespace. """
+    title = LATEX_COMMAND.sub('', title)
+    title = title.replace('{', '').replace('}', '').replace('"', '')
+    return ' '.join(title.split())
+
+def resolve_bibliography(titles, num_contexts):
+    """ Generator which resolves the titles BATCH_QUERY_CHUNK_SIZE at a time and yields a
+    BibliographyEntry for each title, in order. For each batch, the metadata_plus and the
+    references_plus lookups are sent at the same time (so at most 2 Solr requests are in flight
+    per bibliography), and the polarity of the batch's contexts which were indexed without one is
+    predicted in 1 call.
+    Raises SolrError if Solr returns an error. """
+    chunk_size = settings.BATCH_QUERY_CHUNK_SIZE
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        for start in range(0, len(titles), chunk_size):
+            chunk = titles[start:start + chunk_size]
+            papers_future = executor.submit(search_batch, 'title_proximity', chunk, 1)
+            contexts_future = executor.submit(search_batch, 'cited_paper', chunk, num_contexts)
+            papers, contexts = papers_future.result(), contexts_future.result()
+            chunk_contexts = [contexts.get(title, ([], 0)) for title in chunk]
+            chunk_records = [context for records, num_found in chunk_contexts for context in records]
+            polarities = iter(get_polarities([context.citing_sentence for context in chunk_records],
+                                             [context.citation_polarity for context in chunk_records]))
+            for title, (records, num_found) in zip(chunk, chunk_contexts):
+                paper_records = papers.get(title, ([], 0))[0]
+                yield BibliographyEntry(title=title, paper=paper_records[0] if paper_records else None,
+                                        num_contexts=num_found, contexts=records,
+                                        polarities=[next(polarities) for record in records])
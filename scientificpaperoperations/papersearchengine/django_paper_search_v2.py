@@ -13,147 +13,307 @@
     # Copyright:   (c) Ashwath Sampath 2018
     #-------------------------------------------------------------------------------
 
-import requests
+import contextvars
 import copy
-import sys
-import re
 from collections import OrderedDict
 import datetime
-import pandas as pd
-from sklearn.externals import joblib
-import emoji
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from .model_registry import get_versioned_citation_model
+from . import prediction_cache
+from .records import PaperSentence, PaperMetadata, CitationContext, CitationGroup, make_records, display_date, \
+                     POLARITY_NAMES, POLARITY_SYMBOLS
+from .solr_client import select, post_select, SolrError
+from .result_cache import cache_results
+from .instrumentation import timed, record_solr_timing
 
-def search_sentences_plus(query, num_rows):
+# uniqueKey of the collections, needed in the sort for cursorMark (deep paging).
+UNIQUE_KEYS = {'papers_plus': 'id', 'references_plus': 'id', 'metadata_plus': 'arxiv_identifier'}
+
+# Sentiment symbol predicted by the model -> emoji appended to the citing sentence
+#SENTIMENT_MAPPING = {'o': emoji.emojize(' (:first_quarter_moon:)', use_aliases=True), 
+#                     'n': emoji.emojize(' (:new_moon:)', use_aliases=True),
+#                     'p': emoji.emojize(' (:full_moon:)', use_aliases=True)}
+_sentiment_mapping = None
+
+def get_sentiment_mapping():
+    """ Returns the dict sentiment symbol -> emoji string. emoji is only imported when the first
+    sentiment is displayed (or by preload.py), so that it isn't loaded with the views. """
+    global _sentiment_mapping
+    if _sentiment_mapping is None:
+        import emoji
+        _sentiment_mapping = {'o': emoji.emojize(' (:hand:)', use_aliases=True),
+                              'n': emoji.emojize(' (:thumbsdown:)', use_aliases=True),
+                              'p': emoji.emojize(' (:thumbsup:)', use_aliases=True)}
+    return _sentiment_mapping
+
+# Searches which can be run by name (e.g. by the API): name -> (collection, search field, query type,
+# sort field, class of the records)
+SEARCH_DEFINITIONS = OrderedDict([
+    ('phrase', ('papers_plus', 'sentence', 'exact', 'published_date desc', PaperSentence)),
+    ('title', ('metadata_plus', 'title', 'exact', 'published_date desc', PaperMetadata)),
+    ('author', ('metadata_plus', 'authors', 'and', 'published_date desc', PaperMetadata)),
+    # Titles from reference lists: the words of the title may be in a different order
+    ('title_proximity', ('metadata_plus', 'title', 'proximity_title', 'published_date desc', PaperMetadata)),
+    ('cited_paper', ('references_plus', 'cited_paper_details', 'proximity_title', 'citing_published_date desc',
+                     CitationContext)),
+    ('cited_author', ('references_plus', 'cited_paper_details', 'proximity_authors', 'citing_published_date desc',
+                      CitationContext)),
+])
+
+@cache_results('papers_plus', 'exact', 'published_date desc')
+def search_sentences_plus(query, num_rows, page=1, cursor=None):
     """ Takes user's query as input, finds all sentences with the given
     phrase, then finds the title, authors and url of the paper from the
     metadata_plus index which is made up of . It also gets the results and
     normalizes it so that correct errors messages are displayed, and fields
-    are displayed in the right format. """
+    are displayed in the right format. Only page 'page' (num_rows results) is
+    fetched from Solr, cursor is the cursorMark returned with the previous page
+    (if any). """
     # each result: sentence, filename (arxiv-identifier) and title
-    results_df, query, num_results = search_solr(query, num_rows * 10,
+    start, cursor_mark = get_start_and_cursor(num_rows, page, cursor)
+    # results is a list of PaperSentence records, published_date is already in the display format.
+    results, query, num_results, next_cursor = search_solr(query, num_rows,
                                              'papers_plus', 'sentence', 'exact', 
-                                             'published_date desc', None)
-    if len(results_df) == 0:
+                                             'published_date desc', None, start, cursor_mark)
+    if len(results) == 0:
         return []
-    # Change the date format of the published_date column to match what we want in the output.
-    results_df = change_date_format(results_df, 'published_date')
-    results = results_df.values.tolist()
-    results = results[:num_rows]
-    return results, num_results, num_rows, query
+    return results, num_results, num_rows, query, next_cursor
                           
-def search_references_plus(query, num_rows, search_type):
+# search_type is 'title' or 'authors': proximity_title/proximity_authors query
+@cache_results('references_plus', lambda search_type: 'proximity_' + search_type, 'citing_published_date desc')
+def search_references_plus(query, num_rows, search_type, page=1, cursor=None, polarity=None):
     """ Takes user's query as input, finds all references with the given
     author name/title, gets the local citation url and finds sentences in
-    which the citations occurred. """
+    which the citations occurred. Only page 'page' (num_rows citation contexts)
+    is fetched from Solr, cursor is the cursorMark returned with the previous
+    page (if any). If polarity (positive, neutral or negative) is given, only the
+    citation contexts with that polarity are returned. Besides the results of the other
+    searches, the tuple has num_page_contexts: None if num_results is the no. of groups
+    (grouped by Solr), else num_results is the no. of citation contexts (grouped here,
+    page by page) and num_page_contexts is the no. of citation contexts on the page. """
     # If search_type = title, we do an exact search. If search_type = authors, we do 
     # a proximity search with proximity = len(query) + 3 (as there are ands in the author
     # names, and search may be by last name of one author, full name of other author and so on.
     
-    # NOTE: results is now a dataframe in v2.
+    # By default, Solr groups the citation contexts by citing paper and annotation, so that
+    # exactly num_rows groups are fetched. Grouping them here (below) is the fallback.
+    if settings.CITATION_GROUPING == 'solr':
+        grouped_results = search_references_plus_grouped(query, num_rows, search_type, page, polarity)
+        if grouped_results is not None:
+            return grouped_results
+
+    # NOTE: results is a list of CitationContext records.
+    start, cursor_mark = get_start_and_cursor(num_rows, page, cursor)
+    filter_query = polarity_filter_query(polarity)
     if search_type == 'title':
-        # Return all rows to count no. of citations.
-        results_df, query, num_results = search_solr(query, num_rows*10,
+        results, query, num_results, next_cursor = search_solr(query, num_rows,
                                              'references_plus', 'cited_paper_details',
-                                             'proximity_title', 'citing_published_date desc', None)
+                                             'proximity_title', 'citing_published_date desc', filter_query,
+                                             start, cursor_mark)
     
     if search_type == 'authors':
-        # Return all rows to count no. of citations.
-        results_df, query, num_results = search_solr(query, num_rows*10,
+        results, query, num_results, next_cursor = search_solr(query, num_rows,
                                                  'references_plus', 'cited_paper_details',
-                                                 'proximity_authors', 'citing_published_date desc', None)
-    if len(results_df) == 0:
+                                                 'proximity_authors', 'citing_published_date desc', filter_query,
+                                                 start, cursor_mark)
+    if len(results) == 0:
         return []
-    # results_df is a df
-    # Get sentiment and add it to the end of the citing_sentence column: no separate column
-    results_df = get_sentiment_from_model(results_df)
-    # Group sentences from the same citing paper together
-    grouped_results_df = group_sentences_together(results_df)
-    # This is  not the real numresults, it is just sent to the template to prove that numrows 
-    # is greater/less than/equal to numresults
-    num_results = len(grouped_results_df)
-    # Get num_rows rows out of grouped_results_df
-    grouped_results_df = grouped_results_df.head(num_rows)
-    # Change the date format of the citing_published_date column to match what we want in the output.
-    grouped_results_df = change_date_format(grouped_results_df, 'citing_published_date')
-    # Add offsets of the location of the annotation in the sentence: append to the list citing_sentence to create a list of lists
+    # Group sentences from the same citing paper together (within this page). num_results
+    # is the total no. of citation contexts found by Solr.
+    with timed('group') as timing:
+        grouped_results = group_sentences_together(results)
+        timing.rows = len(grouped_results)
+    results_list = format_grouped_results(grouped_results)
+    return (results_list, num_results, num_rows, query, next_cursor, len(results))
+
+def search_references_plus_grouped(query, num_rows, search_type, page=1, polarity=None):
+    """ Same as search_references_plus, but uses Solr's result grouping on the citation_group
+    field (citing_arxiv_identifier|annotation) instead of grouping the fetched results. Page
+    'page' of num_rows groups is fetched (with up to CITATION_GROUP_LIMIT sentences per group),
+    and num_results is the total no. of groups. Returns None if the index has no citation_group
+    field (it was built before the field was added), so that the caller can fall back to
+    group_sentences_together. Raises SolrError if Solr returns any other error. """
+    query_type = 'proximity_title' if search_type == 'title' else 'proximity_authors'
+    url_params = {'q': add_query_type(query, query_type), 'df': 'cited_paper_details',
+                  'rows': num_rows, 'start': (page - 1) * num_rows,
+                  'sort': add_sort_tiebreaker('citing_published_date desc', 'references_plus'),
+                  'group': 'true', 'group.field': 'citation_group', 'group.ngroups': 'true',
+                  'group.limit': settings.CITATION_GROUP_LIMIT, 'group.sort': 'citing_sentencenum asc'}
+    if polarity is not None:
+        url_params['fq'] = polarity_filter_query(polarity)
+    solr_response = select('references_plus', url_params)
+    if is_undefined_field_error(solr_response, 'citation_group'):
+        return None
+    if not solr_response.ok:
+        raise SolrError("Solr returned {} for a grouped search of references_plus".format(solr_response.status_code))
+    data = parse_solr_response(solr_response)
+    query = data['responseHeader']['params']['q']
+    grouped = data['grouped']['citation_group']
+    num_results = grouped['ngroups']
+    if num_results == 0 or grouped['groups'] == []:
+        return []
+    with timed('parse_json') as timing:
+        grouped_results = parse_references_plus_grouped_json(grouped)
+        timing.rows = len(grouped_results)
+    results_list = format_grouped_results(grouped_results)
+    # Grouped results can't be paged with cursorMark, so there is no next cursor. num_results
+    # is the no. of groups (num_page_contexts is None).
+    return (results_list, num_results, num_rows, query, None, None)
+
+def polarity_filter_query(polarity):
+    """ Returns the filter query for the citation contexts with the polarity (positive, neutral or
+    negative), or None if polarity is None. """
+    if polarity is None:
+        return None
+    return 'citation_polarity:{}'.format(polarity)
+
+# search_type is 'title' or 'authors', like in search_references_plus
+@cache_results('references_plus', lambda search_type: 'proximity_' + search_type)
+def get_polarity_counts(query, num_rows, search_type):
+    """ Returns an OrderedDict polarity -> no. of citation contexts of the cited paper/cited author
+    with that polarity (positive, neutral, negative), counted by Solr with a facet on the
+    citation_polarity field (no docs are fetched, num_rows is unused). Returns None if the index
+    has no citation_polarity field (it was built before the field was added). Raises SolrError if
+    Solr returns any other error. """
+    query_type = 'proximity_title' if search_type == 'title' else 'proximity_authors'
+    url_params = {'q': add_query_type(query, query_type), 'df': 'cited_paper_details', 'rows': 0,
+                  'facet': 'true', 'facet.field': 'citation_polarity', 'facet.mincount': 0}
+    solr_response = select('references_plus', url_params)
+    if is_undefined_field_error(solr_response, 'citation_polarity'):
+        return None
+    if not solr_response.ok:
+        raise SolrError("Solr returned {} for the polarity counts of references_plus".format(solr_response.status_code))
+    # Solr returns the facet counts as a flat list: [value1, count1, value2, count2, ...]
+    facet_counts = parse_solr_response(solr_response)['facet_counts']['facet_fields']['citation_polarity']
+    counts = dict(zip(facet_counts[::2], facet_counts[1::2]))
+    return OrderedDict((polarity, counts.get(polarity, 0)) for polarity in ('positive', 'neutral', 'negative'))
+
+def is_undefined_field_error(solr_response, field):
+    """ Returns True if Solr rejected the request because the field isn't in the schema of the
+    collection (400, 'undefined field <field>'), e.g. an index built before the field was added. """
+    return solr_response.status_code == 400 and 'undefined field {}'.format(field) in solr_response.text
+
+def parse_references_plus_grouped_json(grouped):
+    """ Parses the 'grouped' part of a references_plus response (grouped on citation_group)
+    into a list of CitationGroup records, like the output of group_sentences_together.
+    Duplicate sentences within a group are dropped. """
+    grouped_results = []
+    for group in grouped['groups']:
+        docs = group['doclist']['docs']
+        # The group fields are the same in all the docs of the group: take them from the first one.
+        first_doc = docs[0]
+        sentences = OrderedDict()
+        for doc in docs:
+            sentences.setdefault(doc['citing_sentence'], (doc.get('annotation_start'), doc.get('annotation_end'),
+                                                          doc.get('citation_polarity')))
+        grouped_results.append(CitationGroup._make(first_doc.get(field) for field in CitationGroup._fields)._replace(
+            citing_sentence=[(sentence,) + details for sentence, details in sentences.items()],
+            citing_published_date=display_date(first_doc, 'citing_published_date')))
+    return grouped_results
+
+def format_grouped_results(grouped_results):
+    """ Adds the sentiment to the sentences of the grouped results (CitationGroup records) and
+    the annotation offsets, and returns the records. """
+    # Get sentiment and add it to the end of each sentence (1 call to the model for all the groups)
+    with timed('sentiment') as timing:
+        grouped_results = get_sentiment_from_model(grouped_results)
+        timing.rows = sum(len(group.citing_sentence) for group in grouped_results)
+    # Add offsets of the location of the annotation in the sentence: citing_sentence becomes a list of lists
     # with offsets included for each sentence (offsets for annotation's location in the sentence)
-    # Input [sentence1, sentece2,]
-    grouped_results_df['citing_sentence'] = grouped_results_df[['annotation', 'citing_sentence']].apply(addoffsets_citation, axis=1)
-    results_list = grouped_results_df.values.tolist()
-    return (results_list, num_results, num_rows, query)
-
-def change_date_format(df, column_name):
-    """ Converts a column column_name to the format %B %d, %Y from the current format %Y-%m-%d+Timestamp (Solr format) """
-    df[column_name] = pd.to_datetime(df[column_name])
-    df[column_name] = df[column_name].dt.strftime('%B %d, %Y')
-    #print(df[column_name])
-    return df
-
-def addoffsets_citation(row):
-    """ Adds offsets for the start and end of the annotation in the each sentence of sentence_list. 
-    row is a row of the dataframe with columns 'citing_sentence' and 'annotation' """
+    return [group._replace(citing_sentence=addoffsets_citation(group.annotation, group.citing_sentence))
+            for group in grouped_results]
+
+def addoffsets_citation(annotation, sentence_list):
+    """ Adds offsets for the start and end of the annotation in the each sentence of sentence_list, which has
+    (sentence, annotation_start, annotation_end) tuples. The offsets are stored in the index by the indexer, they are
+    only looked up here for docs indexed before that. """
     # Foll. list will be of the form [[sentence1, annotation_index, before_annotation_index, after_annotation_index], [sentence2,...],...]]
-    sentence_list = row.iloc[1]#row.citings_sentence
-    annotation = row.iloc[0]#row.annotation
     sentence_with_annotations = []
-    for sentence in sentence_list:
-        # sublist will contain 1 sentence, and three sets of indices 
-        sublist = []
-        match = re.search(annotation, sentence)
-        sublist.append(sentence)
+    for sentence, annotation_start, annotation_end in sentence_list:
+        if annotation_start is None:
+            # Plain find, not a regex: the annotation may contain regex metacharacters.
+            annotation_start = sentence.find(annotation)
+            annotation_end = annotation_start + len(annotation)
+            if annotation_start == -1:
+                # Annotation not found: nothing is highlighted, the whole sentence is after the (empty) annotation
+                annotation_start, annotation_end = 0, 0
         # Find indices of annotation in sentence (separated by :), indices of the sentence before the annotation and
         # indices of the sentence after the annotation, both also separated by a colon.
         # This is used in the template, where {{sentence|slice:annotation_indices}} is used to get the part to highlight the annotation. 
-        sublist.extend(["{}:{}".format(match.start(), match.end()), "{}:{}".format(0, match.start()), "{}:".format(match.end())])
-        sentence_with_annotations.append(sublist)
+        sentence_with_annotations.append([sentence, "{}:{}".format(annotation_start, annotation_end),
+                                          "{}:{}".format(0, annotation_start), "{}:".format(annotation_end)])
     return sentence_with_annotations
 
-def get_sentiment_from_model(df):
-    """ Takes a list of lists of results, converts it into a df, and gets the citation polarity from a machine learning
-    (SGDClassifier) model learned previously. This is appended at the end of the sentence and the results are converted
-    back to the orig form and returned."""
-    # Convert the list of lists into a dataframe, replace missing values (Nones are converted into NaNs when a dataframe is created)
-    text_pipeline = joblib.load('papersearchengine/citation_model_pipeline.joblib')
+def get_sentiment_from_model(grouped_results):
+    """ Takes a list of CitationGroup records, and gets the citation polarity of all their sentences: the one stored in
+    the index, or (for docs indexed without it) from a machine learning (SGDClassifier) model learned previously. This is
+    appended at the end of each sentence and the records are returned."""
+    # The pipeline is loaded once per process and shared (see model_registry.py)
     # Read the pipeline from the pickle (joblib)
     #text_pipeline = joblib.load('papersearchengine/citation_model_pipeline_v2.joblib')
     # Preprocess: add polar word (neg + pos) counts
     #positive_polarity_words, negative_polarity_words = read_polar_phrases()
     #df[['processed', 'num_negative_words', 'num_positive_words']] = processing(df.sentence, positive_polarity_words, negative_polarity_words)
     #df['sentiment'] = text_pipeline.predict(df[['sentence', 'processed', 'num_negative_words', 'num_positive_words']])
-    df['sentiment'] = text_pipeline.predict(df.citing_sentence)
-    # Map sentiment symbol to the actual sentiment
-    # Map sentiment symbol to the actual sentiment
-    #sentiment_mapping = {'o': emoji.emojize(' (:first_quarter_moon:)', use_aliases=True), 
-    #                     'n': emoji.emojize(' (:new_moon:)', use_aliases=True),
-    #                     'p': emoji.emojize(' (:full_moon:)', use_aliases=True)}
-    sentiment_mapping = {'o': emoji.emojize(' (:hand:)', use_aliases=True), 
-                         'n': emoji.emojize(' (:thumbsdown:)', use_aliases=True),
-                         'p': emoji.emojize(' (:thumbsup:)', use_aliases=True)}
-    df['sentiment'] = df['sentiment'].map(sentiment_mapping)
-    # Concatenate the sentiment column to the end of the sentence column, and drop the sentiment column
-    df.citing_sentence = df.citing_sentence.str.cat(df.sentiment)
-    df = df.drop('sentiment', axis=1)
-    return df
-
-def group_sentences_together(df):
-    """ Takes a list of lists of results which may include multiple sentences from the same CITING paper, and groups them
-    together in a list. The final list of lists which is returned will have fewer or equal results as the input list."""
-    
-    # Drop duplicate rows based on citing_arxiv identifier, citing_sentence and annotation
-    dropbasedoncols = ['citing_arxiv_identifier', 'citing_sentence', 'annotation']
-    df = df.drop_duplicates(subset=dropbasedoncols)
+    sentences = [sentence_details for group in grouped_results for sentence_details in group.citing_sentence]
+    sentiment_mapping = get_sentiment_mapping()
+    sentiments = iter([sentiment_mapping[polarity] for polarity in
+                       get_polarities([sentence for sentence, annotation_start, annotation_end, polarity in sentences],
+                                      [polarity for sentence, annotation_start, annotation_end, polarity in sentences])])
+    # Concatenate the sentiment to the end of the sentence (the annotation offsets are unchanged)
+    return [group._replace(citing_sentence=[(sentence + next(sentiments), annotation_start, annotation_end)
+                                            for sentence, annotation_start, annotation_end, polarity in group.citing_sentence])
+            for group in grouped_results]
 
-    # Convert the list of lists into a dataframe, replace missing values (Nones are converted into NaNs when a dataframe is created)
+def get_polarities(sentences, stored_polarities):
+    """ Returns the polarity symbol ('p', 'n' or 'o') of each of the sentences: the one stored in the index
+    (stored_polarities has the citation_polarity field of each sentence's doc), or, for the docs indexed without
+    it, the one predicted by the model (1 call for all these sentences)."""
+    predicted = iter(predict_polarity([sentence for sentence, polarity in zip(sentences, stored_polarities)
+                                       if polarity is None]))
+    return [POLARITY_SYMBOLS[polarity] if polarity is not None else next(predicted)
+            for polarity in stored_polarities]
 
-    groupby_list = ['citing_published_date', 'citing_arxiv_identifier', 'citing_paper_title', 'citing_paper_authors', 
-                    'citing_arxiv_url', 'citing_revision_dates', 'citing_dblp_url', 'annotation', 'cited_paper_details']
+def predict_sentiment(sentences):
+    """ Predicts the citation polarity of each of the sentences (in one call to the model) and
+    returns a list with the emoji string for each sentence."""
+    # Map sentiment symbol to the actual sentiment
+    sentiment_mapping = get_sentiment_mapping()
+    return [sentiment_mapping[sentiment] for sentiment in predict_polarity(sentences)]
 
-    df_grouped = pd.DataFrame(df.groupby(groupby_list, sort=False)['citing_sentence'].apply(list)).reset_index()
-    # Reorder the columns
-    cols = ['annotation', 'cited_paper_details', 'citing_sentence', 'citing_arxiv_identifier', 'citing_paper_title',
-            'citing_paper_authors', 'citing_arxiv_url', 'citing_published_date', 'citing_revision_dates', 'citing_dblp_url']
-    df_grouped = df_grouped[cols]
-    return df_grouped
+def predict_polarity(sentences):
+    """ Predicts the citation polarity of each of the sentences (in one call to the model) and
+    returns a list with the symbol predicted for each sentence: 'p' (positive), 'n' (negative)
+    or 'o' (neutral). Sentences which have already been predicted by the same model come from
+    the prediction cache, only the others go through the pipeline."""
+    if len(sentences) == 0:
+        return []
+    with timed('model_load'):
+        text_pipeline, model_version = get_versioned_citation_model()
+    return prediction_cache.predict(sentences, model_version, text_pipeline.predict)
+
+def group_sentences_together(results):
+    """ Takes a list of CitationContext records which may include multiple sentences from the same CITING paper, and groups them
+    together in a list. The final list of CitationGroup records which is returned will have fewer or equal results as the input list."""
+    # Group on all the fields except the sentence, in the order in which the groups first appear. Duplicate sentences
+    # (same citing_arxiv identifier, citing_sentence and annotation) are dropped.
+    groups = OrderedDict()
+    for result in results:
+        group_key = (result.citing_published_date, result.citing_arxiv_identifier, result.citing_paper_title,
+                     result.citing_paper_authors, result.citing_arxiv_url, result.citing_revision_dates,
+                     result.citing_dblp_url, result.annotation, result.cited_paper_details)
+        groups.setdefault(group_key, OrderedDict()).setdefault(result.citing_sentence,
+                                                               (result.annotation_start, result.annotation_end,
+                                                                result.citation_polarity))
+    return [CitationGroup(annotation=annotation, cited_paper_details=cited_paper_details,
+                          citing_sentence=[(sentence,) + details for sentence, details in sentences.items()],
+                          citing_arxiv_identifier=citing_arxiv_identifier, citing_paper_title=citing_paper_title,
+                          citing_paper_authors=citing_paper_authors, citing_arxiv_url=citing_arxiv_url,
+                          citing_published_date=citing_published_date, citing_revision_dates=citing_revision_dates,
+                          citing_dblp_url=citing_dblp_url)
+            for (citing_published_date, citing_arxiv_identifier, citing_paper_title, citing_paper_authors, citing_arxiv_url,
+                 citing_revision_dates, citing_dblp_url, annotation, cited_paper_details), sentences in groups.items()]
 
 def flatten_dates_modify_annotations(results):
     """ Flattens the published_date list for all the results into as string in which multiple dates are separated by semicolons.
@@ -172,35 +332,54 @@ def flatten_dates_modify_annotations(results):
         result[0] = "<{}>".format(result[0])
     return results
 
-def search_authors(query, num_rows):
+@cache_results('metadata_plus', 'and', 'published_date desc')
+def search_authors(query, num_rows, page=1, cursor=None):
     """ Returns all metadata (title, authors, urls) when names of 1 or more
-    authors are given in the user query. """
-    results_df, query, num_results = search_solr(query, num_rows * 10,
+    authors are given in the user query. Only page 'page' (num_rows results) is
+    fetched from Solr. """
+    start, cursor_mark = get_start_and_cursor(num_rows, page, cursor)
+    # results is a list of PaperMetadata records
+    results, query, num_results, next_cursor = search_solr(query, num_rows,
                                              'metadata_plus', 'authors', 'and', 
-                                             'published_date desc', None)
-    if len(results_df) == 0:
+                                             'published_date desc', None, start, cursor_mark)
+    if len(results) == 0:
         return []
-    # Change the date format of the published_date column to match what we want in the output.
-    results_df = change_date_format(results_df, 'published_date')
-    results = results_df.values.tolist()
-    results = results[:num_rows]
-    return results, num_results, num_rows, query
+    return results, num_results, num_rows, query, next_cursor
 
-def search_meta_titles(query, num_rows):
+@cache_results('metadata_plus', 'exact', 'published_date desc')
+def search_meta_titles(query, num_rows, page=1, cursor=None):
     """ Returns all metadata (title, authors, url) when a partial or
-    complete title is given in the user query. """
-    
-    results_df, query, num_results = search_solr(query, num_rows * 10,
+    complete title is given in the user query. Only page 'page' (num_rows
+    results) is fetched from Solr. """
+    start, cursor_mark = get_start_and_cursor(num_rows, page, cursor)
+    # results is a list of PaperMetadata records
+    results, query, num_results, next_cursor = search_solr(query, num_rows,
                                              'metadata_plus', 'title', 'exact', 
-                                             'published_date desc', None)
-    if len(results_df) == 0:
+                                             'published_date desc', None, start, cursor_mark)
+    if len(results) == 0:
         return []
-    
-    # Change the date format of the published_date column to match what we want in the output.
-    results_df = change_date_format(results_df, 'published_date')
-    results = results_df.values.tolist()
-    results = results[:num_rows]
-    return results, num_results, num_rows, query
+    return results, num_results, num_rows, query, next_cursor
+
+def get_start_and_cursor(num_rows, page, cursor):
+    """ Returns (start, cursorMark) to fetch page 'page' of num_rows results. The first page
+    and the pages reached through the 'next' links (which carry the nextCursorMark of the
+    previous page) use cursorMark, so that deep pages don't make Solr collect and skip all
+    the earlier results. Pages requested only by their number use start. """
+    if cursor:
+        return 0, cursor
+    if page <= 1:
+        return 0, '*'
+    return (page - 1) * num_rows, None
+
+def add_sort_tiebreaker(sort_field, collection):
+    """ Adds the collection's uniqueKey to the sort: cursorMark needs it, and it makes the
+    order (and so the pages) stable for documents with the same sort value. """
+    unique_key = UNIQUE_KEYS.get(collection, 'id')
+    if sort_field is None:
+        return '{} asc'.format(unique_key)
+    if unique_key in [clause.split()[0] for clause in sort_field.split(',')]:
+        return sort_field
+    return '{}, {} asc'.format(sort_field, unique_key)
 
 def add_query_type(query, query_type):
     """ Returns the query based on the query type (exact or proximity)
@@ -224,24 +403,156 @@ def add_query_type(query, query_type):
         query = ' AND '.join(query)
     return query
 
-def search_solr(query, num_rows, collection, search_field, query_type, sort_field=None, filter_query=None):
+def search_solr(query, num_rows, collection, search_field, query_type, sort_field=None, filter_query=None,
+                start=0, cursor_mark=None):
     """ Creates a URL to call Solr along with the search query, search field
     and number of rows as parameters, and sends a GET request to SOLR. It
     then calls the parse_json func to parse the json, and returns results
-    from that function."""
-    solr_url = 'http://localhost:8983/solr/' + collection + '/select'
+    from that function along with the nextCursorMark (None if cursor_mark is
+    None). num_rows results are fetched from start, or from cursor_mark if it
+    is given ('*' for the first page). Raises SolrError if Solr returns an error."""
     query = add_query_type(query, query_type)
-    if sort_field is not None:
-        url_params = {'q': query, 'rows': num_rows, 'df': search_field, 'sort': sort_field}
-    else:
-        url_params = {'q': query, 'rows': num_rows, 'df': search_field}
-    solr_response = requests.get(solr_url, params=url_params)
-    if solr_response.ok:
+    url_params = {'q': query, 'rows': num_rows, 'df': search_field,
+                  'sort': add_sort_tiebreaker(sort_field, collection)}
+    if filter_query is not None:
+        url_params['fq'] = filter_query
+    if cursor_mark is not None:
+        url_params['cursorMark'] = cursor_mark
+    elif start:
+        url_params['start'] = start
+    # Pooled keep-alive session with timeouts and retries (see solr_client.py)
+    solr_response = select(collection, url_params)
+    if not solr_response.ok:
+        raise SolrError("Solr returned {} for a search of {}".format(solr_response.status_code, collection))
+    data = parse_solr_response(solr_response)
+    with timed('parse_json') as timing:
+        results = parse_json(data, collection)
+        timing.rows = len(results[0])
+    return results + (data.get('nextCursorMark'),)
+
+def parse_solr_response(solr_response):
+    """ Returns the json of a Solr response. The parsing is timed as the json stage of the current
+    request, and Solr's own QTime (and debug=timing breakdown) is recorded (see instrumentation.py). """
+    with timed('json'):
         data = solr_response.json()
-        return parse_json(data, collection)
-    else:
-        print("Invalid response returned from Solr")
-        sys.exit(11)
+    record_solr_timing(data)
+    return data
+
+def prepare_query(search_name, query):
+    """ Returns the query of one of the searches in SEARCH_DEFINITIONS as the search expects it:
+    the author search takes a list of authors, which are separated by semicolons in the query
+    typed by the user. """
+    if SEARCH_DEFINITIONS[search_name][2] == 'and':
+        return [author.strip() for author in query.split(';')]
+    return query
+
+def fetch_records_page(search_name, query, num_rows, cursor_mark='*', filter_query=None):
+    """ Fetches a page of num_rows results of one of the searches in SEARCH_DEFINITIONS, from
+    cursor_mark ('*' for the first page). The results are records with the fields of the Solr
+    schema, with the values as stored in Solr (dates in Solr's format, no sentiment, citation
+    contexts not grouped). Returns (records, num_results, next_cursor), next_cursor is equal
+    to cursor_mark after the last page. Raises SolrError if Solr returns an error. """
+    collection, search_field, query_type, sort_field, record_class = SEARCH_DEFINITIONS[search_name]
+    url_params = {'q': add_query_type(query, query_type), 'rows': num_rows, 'df': search_field,
+                  'sort': add_sort_tiebreaker(sort_field, collection), 'cursorMark': cursor_mark}
+    if filter_query is not None:
+        url_params['fq'] = filter_query
+    solr_response = select(collection, url_params)
+    if not solr_response.ok:
+        raise SolrError("Solr returned {} for the {} search".format(solr_response.status_code, search_name))
+    data = parse_solr_response(solr_response)
+    with timed('parse_json') as timing:
+        records = make_records(record_class, data['response']['docs'])
+        timing.rows = len(records)
+    return records, data['response']['numFound'], data.get('nextCursorMark')
+
+def iter_records_pages(search_name, query, page_size, max_results=None, filter_query=None):
+    """ Generator which fetches all the results of one of the searches in SEARCH_DEFINITIONS
+    (or the first max_results) with cursorMark, page_size at a time, and yields each page of
+    records as it arrives (see fetch_records_page), along with the total no. of results:
+    (records, num_results). Only one page is held in memory. """
+    cursor_mark = '*'
+    num_fetched = 0
+    while max_results is None or num_fetched < max_results:
+        rows = page_size if max_results is None else min(page_size, max_results - num_fetched)
+        records, num_results, next_cursor = fetch_records_page(search_name, query, rows, cursor_mark, filter_query)
+        if records:
+            yield records, num_results
+        num_fetched += len(records)
+        # Solr returns the same cursorMark when there are no more results.
+        if not records or next_cursor == cursor_mark:
+            return
+        cursor_mark = next_cursor
+
+def search_batch(search_name, queries, num_rows):
+    """ Runs one of the searches in SEARCH_DEFINITIONS for each of the queries (strings, with the
+    authors separated by semicolons for the author search) and returns an OrderedDict
+    query -> (records, num_results) with the top num_rows records of each query (like
+    fetch_records_page). Instead of 1 request per query, the queries are sent
+    BATCH_QUERY_CHUNK_SIZE at a time in 1 Solr request (1 group.query per query), and up to
+    BATCH_MAX_PARALLEL_REQUESTS of these requests are sent at the same time. Empty and repeated
+    queries are skipped. Raises SolrError if Solr returns an error. """
+    collection, search_field, query_type, sort_field, record_class = SEARCH_DEFINITIONS[search_name]
+    # Solr query of each distinct user query
+    solr_queries = OrderedDict()
+    for query in queries:
+        if query.strip() and query not in solr_queries:
+            solr_queries[query] = add_query_type(prepare_query(search_name, query), query_type)
+    items = list(solr_queries.items())
+    chunk_size = settings.BATCH_QUERY_CHUNK_SIZE
+    chunks = [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+    results = OrderedDict()
+    if not chunks:
+        return results
+    with ThreadPoolExecutor(max_workers=min(len(chunks), settings.BATCH_MAX_PARALLEL_REQUESTS)) as executor:
+        # Each chunk runs in a copy of the caller's context, so that its stages are timed in the request
+        futures = [executor.submit(contextvars.copy_context().run, fetch_batch_chunk, collection, search_field,
+                                   sort_field, record_class, chunk, num_rows) for chunk in chunks]
+        for future in futures:
+            results.update(future.result())
+    return results
+
+def fetch_batch_chunk(collection, search_field, sort_field, record_class, chunk, num_rows):
+    """ Fetches the top num_rows results of each of the queries in chunk, a list of
+    (query, Solr query), in 1 Solr request. Each Solr query is a group.query, so that Solr
+    returns the results of each query separately. Returns an OrderedDict
+    query -> (records, num_results). """
+    distinct_solr_queries = list(OrderedDict.fromkeys(solr_query for query, solr_query in chunk))
+    sort = add_sort_tiebreaker(sort_field, collection)
+    # The main query (the OR of all the queries) limits the docs which the group queries are run on.
+    url_params = {'q': ' OR '.join('({})'.format(solr_query) for solr_query in distinct_solr_queries),
+                  'df': search_field, 'rows': len(distinct_solr_queries), 'sort': sort,
+                  'group': 'true', 'group.query': distinct_solr_queries, 'group.limit': num_rows,
+                  'group.sort': sort}
+    # Many group queries don't fit in a url: the params are POSTed.
+    solr_response = post_select(collection, url_params)
+    if not solr_response.ok:
+        raise SolrError("Solr returned {} for a batch of {} queries".format(solr_response.status_code, len(chunk)))
+    grouped = parse_solr_response(solr_response)['grouped']
+    results = OrderedDict()
+    for query, solr_query in chunk:
+        doclist = grouped[solr_query]['doclist']
+        results[query] = (make_records(record_class, doclist['docs']), doclist['numFound'])
+    return results
+
+def serialize_records(records):
+    """ Returns a list of dicts (Solr field -> value) for the records. The citation polarity of
+    citation contexts indexed without it is predicted by the model (1 call to the model per list
+    of records). """
+    return serialize_record_lists([records])[0]
+
+def serialize_record_lists(record_lists):
+    """ Like serialize_records, for several lists of records (e.g. the results of each query of a
+    batch): the missing polarities of the citation contexts of all the lists are predicted in 1 call. """
+    serialized_lists = [[record._asdict() for record in records] for records in record_lists]
+    contexts = [(record, serialized) for records, serialized_list in zip(record_lists, serialized_lists)
+                for record, serialized in zip(records, serialized_list) if isinstance(record, CitationContext)]
+    if contexts:
+        polarities = get_polarities([record.citing_sentence for record, serialized in contexts],
+                                    [record.citation_polarity for record, serialized in contexts])
+        for (record, serialized), polarity in zip(contexts, polarities):
+            serialized['citation_polarity'] = POLARITY_NAMES[polarity]
+    return serialized_lists
 
 def parse_json(data, collection):
     """ Calls the appropriate json parser based on the collection,
@@ -252,10 +563,7 @@ def parse_json(data, collection):
     query = data['responseHeader']['params']['q']
     num_responses = data['response']['numFound']
     if num_responses == 0:
-        if collection in ('references_plus', 'metadata_plus', 'papers_plus'):
-            return(pd.DataFrame(), query, 0)
-        else:
-            return ([], query, 0)
+        return ([], query, 0)
     if collection == 'papers':
         results = parse_sentence_json(data)
     elif collection == 'arxiv_metadata':
@@ -330,8 +638,8 @@ def parse_refs_json(data):
 
 
 def parse_references_plus_json(data):
-    """ Function which parses the references_plus json and returns a pandas dataframe of the
-    results.
+    """ Function which parses the references_plus json and returns a list of CitationContext
+    records.
     Solr Field definition shown below: 
      <!-- REFS file fields: cited paper-->
     <field name="annotation" type="string" indexed="true" stored="true" multiValued="false"/> 
@@ -356,12 +664,11 @@ def parse_references_plus_json(data):
     <field name="citing_dblp_url" type="string" indexed="true" stored="true" multiValued="false"/> 
     """
     docs = data['response']['docs']
-    docs_df = pd.DataFrame(docs)
-    docs_df = docs_df.drop(['_version_', 'id'], axis=1)
-    return docs_df
+    return make_records(CitationContext, docs, 'citing_published_date')
 
 def parse_papers_plus_json(data):
-    """ Function which parses the papers_plus json and returns a pandas dataframe of the results.
+    """ Function which parses the papers_plus json and returns a list of PaperSentence records
+    (published_date is converted to the display format).
     Solr Field definition shown below: 
         <!-- Citing paper fields: papers, metadata, arxiv_metadata -->
     <!-- Papers -->
@@ -380,12 +687,11 @@ def parse_papers_plus_json(data):
     <field name="dblp_url" type="string" indexed="true" stored="true" multiValued="false"/> 
     """
     docs = data['response']['docs']
-    docs_df = pd.DataFrame(docs)
-    docs_df = docs_df.drop(['_version_', 'id'], axis=1)
-    return docs_df
+    return make_records(PaperSentence, docs, 'published_date')
 
 def parse_metadata_plus_json(data):
-    """ Function which parses the papers_plus json and returns a pandas dataframe of the results.
+    """ Function which parses the metadata_plus json and returns a list of PaperMetadata records
+    (published_date is converted to the display format).
     Solr Field definition shown below: 
         <!-- Citing paper fields: papers, metadata, arxiv_metadata -->
     <!-- Papers -->
@@ -404,6 +710,4 @@ def parse_metadata_plus_json(data):
     <field name="dblp_url" type="string" indexed="true" stored="true" multiValued="false"/> 
     """
     docs = data['response']['docs']
-    docs_df = pd.DataFrame(docs)
-    docs_df = docs_df.drop(['_version_'], axis=1)
-    return docs_df
\ No newline at end of file
+    return make_records(PaperMetadata, docs, 'published_date')
\ No newline at end of file
@@ -0,0 +1,156 @@
+    #-------------------------------------------------------------------------------
+    # Name:        Exports
+    # Purpose:     Background export of all the results of a search (e.g. every citation
+    #              context of a prolific cited author) into a CSV, JSON Lines or Parquet
+    #              file. The jobs are ExportJob rows (the queue), which are run by the
+    #              export worker (manage.py run_export_worker). The worker pages through
+    #              Solr with cursorMark and appends each page to the file, so that only one
+    #              page is held in memory whatever the no. of results. The jobs of a
+    #              worker which died are requeued by the other workers.
+    #-------------------------------------------------------------------------------
+
+import csv
+import json
+import os
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+from .django_paper_search_v2 import (SEARCH_DEFINITIONS, iter_records_pages, polarity_filter_query, prepare_query,
+                                     serialize_records)
+from .models import ExportJob
+
+# Fields which are integers in Solr (all the other ones are exported as strings)
+INTEGER_FIELDS = {'sentencenum', 'citing_sentencenum', 'annotation_start', 'annotation_end'}
+
+def get_export_fields(search_name):
+    """ Returns the columns of the export of a search: the fields of its records (the Solr
+    fields, which include the citation polarity of citation contexts). """
+    return list(SEARCH_DEFINITIONS[search_name][4]._fields)
+
+class CSVExportWriter:
+    """ Writes the rows (dicts) into a CSV file with a header. """
+
+    def __init__(self, path, fields):
+        self.file = open(path, 'w', newline='', encoding='utf-8')
+        self.writer = csv.DictWriter(self.file, fieldnames=fields)
+        self.writer.writeheader()
+
+    def write_rows(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.file.close()
+
+class JSONLExportWriter:
+    """ Writes the rows (dicts) into a JSON Lines file (1 json object per line). """
+
+    def __init__(self, path, fields):
+        self.file = open(path, 'w', encoding='utf-8')
+
+    def write_rows(self, rows):
+        for row in rows:
+            self.file.write(json.dumps(row) + '\n')
+
+    def close(self):
+        self.file.close()
+
+class ParquetExportWriter:
+    """ Writes the rows (dicts) into a Parquet file, 1 row group per page. Needs pyarrow, which
+    is only imported when a Parquet export is run. """
+
+    def __init__(self, path, fields):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError("Parquet exports need pyarrow (pip install pyarrow)")
+        self.pyarrow = pyarrow
+        self.fields = fields
+        # Fixed schema, so that all the row groups have the same types (even if a field is
+        # empty in a whole page)
+        self.schema = pyarrow.schema([(field, pyarrow.int64() if field in INTEGER_FIELDS else pyarrow.string())
+                                      for field in fields])
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+
+    def write_rows(self, rows):
+        columns = {field: [row.get(field) for row in rows] for field in self.fields}
+        self.writer.write_table(self.pyarrow.Table.from_pydict(columns, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+class JobRequeued(Exception):
+    """ Raised when the job which is being run was requeued by another worker. """
+
+EXPORT_WRITERS = {'csv': CSVExportWriter, 'jsonl': JSONLExportWriter, 'parquet': ParquetExportWriter}
+
+def claim_next_job():
+    """ Returns the oldest queued job after marking it as running, or None if there is none. A
+    job is only claimed if it is still queued when it is updated, so that several workers can
+    run at the same time. """
+    while True:
+        job = ExportJob.objects.filter(status='queued').order_by('created_at').first()
+        if job is None:
+            return None
+        now = timezone.now()
+        if ExportJob.objects.filter(pk=job.pk, status='queued').update(status='running', started_at=now,
+                                                                       updated_at=now, attempts=F('attempts') + 1):
+            job.refresh_from_db()
+            return job
+
+def requeue_stale_jobs():
+    """ Requeues the running jobs without progress for EXPORT_STALE_TIMEOUT seconds, whose worker
+    died (e.g. it was killed during the export), or fails them if they have already been claimed
+    EXPORT_MAX_ATTEMPTS times. Returns the no. of jobs requeued or failed. """
+    now = timezone.now()
+    # The jobs started before updated_at was saved have none
+    stale_jobs = ExportJob.objects.filter(Q(updated_at__lt=now - timedelta(seconds=settings.EXPORT_STALE_TIMEOUT)) |
+                                          Q(updated_at__isnull=True), status='running')
+    num_failed = stale_jobs.filter(attempts__gte=settings.EXPORT_MAX_ATTEMPTS).update(
+        status='failed', error='The export was interrupted {} times'.format(settings.EXPORT_MAX_ATTEMPTS),
+        finished_at=now)
+    num_requeued = stale_jobs.update(status='queued', started_at=None, updated_at=None, num_exported=0)
+    return num_failed + num_requeued
+
+def run_export_job(job):
+    """ Runs a (claimed) job: fetches all the results of the search (or the first max_results)
+    EXPORT_PAGE_SIZE at a time with cursorMark, predicts the citation polarity page by page,
+    and appends each page to the file, saving the progress after every page. The file is
+    written under a temporary name, and renamed when it is complete. Returns True if the
+    export succeeded. If the job was requeued meanwhile (this worker was too slow, see
+    requeue_stale_jobs), the export is stopped and the job is left to its new worker. """
+    os.makedirs(settings.EXPORT_DIR, exist_ok=True)
+    file_path = os.path.join(settings.EXPORT_DIR, '{}.{}'.format(job.token, job.file_format))
+    # 1 temporary file per attempt, so that 2 workers never write the same file
+    temp_path = '{}.{}.part'.format(file_path, job.attempts)
+    # The updates of this attempt, which are ignored once the job has been requeued
+    this_attempt = ExportJob.objects.filter(pk=job.pk, status='running', attempts=job.attempts)
+    filter_query = polarity_filter_query(job.polarity) if job.polarity else None
+    num_results = 0
+    num_exported = 0
+    try:
+        writer = EXPORT_WRITERS[job.file_format](temp_path, get_export_fields(job.search_name))
+        try:
+            for records, num_results in iter_records_pages(job.search_name, prepare_query(job.search_name, job.query),
+                                                           settings.EXPORT_PAGE_SIZE, job.max_results, filter_query):
+                writer.write_rows(serialize_records(records))
+                num_exported += len(records)
+                if not this_attempt.update(num_results=num_results, num_exported=num_exported,
+                                           updated_at=timezone.now()):
+                    raise JobRequeued()
+        finally:
+            writer.close()
+        os.replace(temp_path, file_path)
+    except JobRequeued:
+        os.remove(temp_path)
+        return False
+    except Exception as err:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        this_attempt.update(status='failed', error='{}: {}'.format(type(err).__name__, err),
+                            finished_at=timezone.now())
+        return False
+    this_attempt.update(status='done', file_path=file_path, num_results=num_results,
+                        num_exported=num_exported, finished_at=timezone.now())
+    return True
@@ -1,6 +1,16 @@
 from django import forms
+from .models import ExportJob
 
-class SearchPapersForm(forms.Form):
+class PagedSearchForm(forms.Form):
+    """ Base class of the search forms: the page no. and the cursorMark of the page are
+    passed in the page/next links of the results pages. """
+    page = forms.IntegerField(required=False, min_value=1, widget=forms.HiddenInput())
+    cursor = forms.CharField(required=False, max_length=500, widget=forms.HiddenInput())
+
+# Values of the citation_polarity field of references_plus, by which the citation contexts can be filtered
+POLARITY_CHOICES = [('', 'all'), ('positive', 'positive'), ('neutral', 'neutral'), ('negative', 'negative')]
+
+class SearchPapersForm(PagedSearchForm):
     query = forms.CharField(widget = forms.TextInput( 
     attrs={
         'class': 'form-control',
@@ -13,10 +23,13 @@ class SearchPapersForm(forms.Form):
          'placeholder': 'No. of results (default: 100)',
     }))
 
-class SearchCitedAuthorsForm(forms.Form):
+class SearchCitedAuthorsForm(PagedSearchForm):
     query = forms.CharField(widget = forms.TextInput( 
     attrs={
         'class': 'form-control',
+        # Typeahead suggestions (see suggest.js)
+        'data-suggest': 'cited_author',
+        'autocomplete': 'off',
         'placeholder': 'Enter list of cited authors (separated by semicolons) '
     }
         ), max_length=100)
@@ -25,11 +38,16 @@ class SearchCitedAuthorsForm(forms.Form):
          'class': 'form-control',
          'placeholder': 'No. of results (default: 100)'
     }))
+    # Set by the polarity links of the results page
+    polarity = forms.ChoiceField(required=False, choices=POLARITY_CHOICES, widget=forms.HiddenInput())
 
-class SearchCitedPaperForm(forms.Form):
+class SearchCitedPaperForm(PagedSearchForm):
     query = forms.CharField(widget = forms.TextInput( 
     attrs={
         'class': 'form-control',
+        # Typeahead suggestions (see suggest.js)
+        'data-suggest': 'cited_paper',
+        'autocomplete': 'off',
         'placeholder': 'Enter title of cited paper (partial titles allowed)'
     }
         ), max_length=100)
@@ -38,11 +56,16 @@ class SearchCitedPaperForm(forms.Form):
          'class': 'form-control',
          'placeholder': 'No. of results (default: 100)'
     }))
+    # Set by the polarity links of the results page
+    polarity = forms.ChoiceField(required=False, choices=POLARITY_CHOICES, widget=forms.HiddenInput())
 
-class SearchMetatitleForm(forms.Form):
+class SearchMetatitleForm(PagedSearchForm):
     query = forms.CharField(widget = forms.TextInput( 
     attrs={
         'class': 'form-control',
+        # Typeahead suggestions (see suggest.js)
+        'data-suggest': 'title',
+        'autocomplete': 'off',
         'placeholder': "Enter paper's title (or part of it), e.g., 'linked data quality'"
     }
         ), max_length=100)
@@ -52,10 +75,13 @@ class SearchMetatitleForm(forms.Form):
          'placeholder': 'No. of results (default: 100)'
     }))
 
-class SearchAuthorsForm(forms.Form):
+class SearchAuthorsForm(PagedSearchForm):
     query = forms.CharField(widget = forms.TextInput( 
     attrs={
         'class': 'form-control',
+        # Typeahead suggestions (see suggest.js)
+        'data-suggest': 'author',
+        'autocomplete': 'off',
         'placeholder': "Enter list of authors (separated by semicolons; e.g., 'Tim Berners-Lee')"
     }
         ), max_length=100)
@@ -65,3 +91,107 @@ class SearchAuthorsForm(forms.Form):
          'placeholder': 'No. of results (default: 100)'
     }))
 
+
+class UniversalSearchForm(forms.Form):
+    query = forms.CharField(widget = forms.TextInput( 
+    attrs={
+        'class': 'form-control',
+        'placeholder': "Enter a phrase, title or author, e.g., 'knowledge base completion', 'Tim Berners-Lee'"
+    }
+        ), max_length=100)
+    numrows = forms.IntegerField(required=False, min_value=1, max_value=20, widget = forms.NumberInput(
+    attrs={
+         'class': 'form-control',
+         'placeholder': 'Top hits per search (default: 5)'
+    }))
+
+class ApiSearchForm(forms.Form):
+    """ Parameters of the search API (see api.py). numrows is the no. of results in json
+    format and the no. of results per Solr page in ndjson format. polarity filters the
+    citation contexts of the cited_paper/cited_author searches. """
+    query = forms.CharField(max_length=100)
+    numrows = forms.IntegerField(required=False, min_value=1, max_value=1000)
+    cursor = forms.CharField(required=False, max_length=500)
+    format = forms.ChoiceField(required=False, choices=[('json', 'json'), ('ndjson', 'ndjson')])
+    max_results = forms.IntegerField(required=False, min_value=1)
+    polarity = forms.ChoiceField(required=False, choices=POLARITY_CHOICES)
+
+class SuggestForm(forms.Form):
+    """ Parameters of the typeahead suggestions (see suggestions.py): what was typed in the form
+    so far (q) and the max. no. of suggestions. """
+    q = forms.CharField(max_length=100, strip=False)
+    limit = forms.IntegerField(required=False, min_value=1, max_value=20)
+
+class BibliographyForm(forms.Form):
+    """ Reference list for the bibliography search: pasted in text or uploaded as a file
+    (BibTeX or one title per line). """
+    text = forms.CharField(required=False, widget = forms.Textarea(
+    attrs={
+        'class': 'form-control',
+        'rows': 10,
+        'placeholder': 'Paste BibTeX entries or one title per line',
+    }))
+    file = forms.FileField(required=False, widget = forms.ClearableFileInput(
+    attrs={
+        'class': 'form-control-file',
+    }))
+    numrows = forms.IntegerField(required=False, min_value=0, max_value=100, widget = forms.NumberInput(
+    attrs={
+         'class': 'form-control',
+         'placeholder': 'Citation contexts per entry (default: 5)',
+    }))
+
+    def clean(self):
+        """ Reads the reference list from the file if one was uploaded, and checks that there is
+        one. The text of the list is in cleaned_data['bibliography']. """
+        cleaned_data = super().clean()
+        uploaded_file = cleaned_data.get('file')
+        if uploaded_file is not None:
+            try:
+                cleaned_data['bibliography'] = uploaded_file.read().decode('utf-8')
+            except UnicodeDecodeError:
+                raise forms.ValidationError("The file must be a text (.bib or .txt) file in UTF-8.")
+        else:
+            cleaned_data['bibliography'] = cleaned_data.get('text', '')
+        if not cleaned_data['bibliography'].strip():
+            raise forms.ValidationError("Paste a reference list or upload a file.")
+        return cleaned_data
+
+class ExportForm(forms.Form):
+    """ Export of all the results of a search into a file (see exports.py). """
+    search_name = forms.ChoiceField(choices=[
+        ('phrase', 'Papers containing the phrase'),
+        ('title', 'Papers with the title'),
+        ('author', 'Papers by the author(s) (separated by ;)'),
+        ('cited_paper', 'Citation contexts of the cited paper'),
+        ('cited_author', 'Citation contexts of the cited author(s)'),
+    ], widget = forms.Select(
+    attrs={
+        'class': 'form-control',
+    }))
+    query = forms.CharField(max_length=100, widget = forms.TextInput(
+    attrs={
+        'class': 'form-control',
+        'placeholder': 'Search query',
+    }))
+    file_format = forms.ChoiceField(choices=ExportJob.FORMAT_CHOICES, widget = forms.Select(
+    attrs={
+        'class': 'form-control',
+    }))
+    max_results = forms.IntegerField(required=False, min_value=1, widget = forms.NumberInput(
+    attrs={
+         'class': 'form-control',
+         'placeholder': 'Max. no. of results (default: all)',
+    }))
+    # Only the citation contexts with this polarity (cited paper/cited author searches)
+    polarity = forms.ChoiceField(required=False, choices=POLARITY_CHOICES, widget = forms.Select(
+    attrs={
+        'class': 'form-control',
+    }))
+
+    def clean(self):
+        cleaned_data = super().clean()
+        # Only the citation contexts have a polarity
+        if cleaned_data.get('search_name') not in ('cited_paper', 'cited_author'):
+            cleaned_data['polarity'] = ''
+        return cleaned_data
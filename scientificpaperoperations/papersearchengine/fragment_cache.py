@@ -0,0 +1,176 @@
+    #-------------------------------------------------------------------------------
+    # Name:        Fragment cache
+    # Purpose:     Caches the rendered results of the results pages (the list of result
+    #              cards, see the *resultslist.html templates) together with the few values
+    #              the rest of the page needs (no. of results, displayed query, next cursor,
+    #              polarity counts). A repeated search for the same page then skips both the
+    #              Solr round trip and the rendering of up to 1000 results; only the page
+    #              around the fragment (header, pagination links) is rendered. Keys are the
+    #              search name, the canonical query (see result_cache.py), the page
+    #              parameters and the Solr index version. The in-process backend evicts the
+    #              least recently used fragments beyond max_entries or max_bytes.
+    #-------------------------------------------------------------------------------
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from time import time
+from .result_cache import DjangoCache, canonical_query, get_index_version
+
+_config = {
+    'enabled': True,
+    # 'lru' (in-process, bounded) or 'django' (Django's cache framework)
+    'backend': 'lru',
+    'max_entries': 200,
+    # Max. total size (bytes of rendered html) of the lru backend
+    'max_bytes': 64 * 1024 * 1024,
+    # Fragments bigger than this (bytes) are not cached
+    'max_fragment_bytes': 4 * 1024 * 1024,
+    # Seconds after which an entry expires, None: no expiry
+    'ttl': 600,
+    # Alias in settings.CACHES for the django backend
+    'cache_alias': 'default',
+}
+
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'bypassed': 0, 'too_big': 0}
+
+class SizedLRUCache:
+    """ In-process cache of fragments which holds at most max_entries entries and max_bytes bytes
+    of html, evicting the least recently used ones, and expires entries ttl seconds after they
+    were stored. """
+
+    def __init__(self, max_entries, max_bytes, ttl=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.size = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """ Returns the fragment for key, or None if it is missing or has expired. """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, size, expires_at = entry
+            if expires_at is not None and expires_at < time():
+                self._remove(key)
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, size):
+        """ Stores the fragment (of size bytes) under key, evicting the least recently used
+        entries if needed. """
+        expires_at = time() + self.ttl if self.ttl else None
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (value, size, expires_at)
+            self.size += size
+            while len(self._data) > self.max_entries or self.size > self.max_bytes:
+                self._remove(next(iter(self._data)))
+
+    def _remove(self, key):
+        value, size, expires_at = self._data.pop(key)
+        self.size -= size
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.size = 0
+
+    def __len__(self):
+        return len(self._data)
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def configure(**kwargs):
+    """ Updates the cache config (enabled, backend, max_entries, max_bytes, max_fragment_bytes,
+    ttl, cache_alias). Values which are None are ignored. The backend is rebuilt on next use. """
+    global _backend
+    with _backend_lock:
+        for key, value in kwargs.items():
+            if key not in _config:
+                raise ValueError("Unknown fragment cache setting: {}".format(key))
+            if value is not None:
+                _config[key] = value
+        _backend = None
+
+def get_backend():
+    """ Returns the configured cache backend, creating it on first use. """
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                if _config['backend'] == 'django':
+                    _backend = DjangoCache(_config['cache_alias'], _config['ttl'])
+                elif _config['backend'] == 'lru':
+                    _backend = SizedLRUCache(_config['max_entries'], _config['max_bytes'], _config['ttl'])
+                else:
+                    raise ValueError("Unknown fragment cache backend: {}".format(_config['backend']))
+    return _backend
+
+def make_key(search_name, collection, query, query_type, *params):
+    """ Returns the key of the fragment of a results page: a hash of the search name, the
+    canonical query, the page parameters (rows, page, cursor, polarity...) and the current index
+    version of the collection. Returns None if the cache is disabled or the index version is
+    unknown (Solr couldn't be reached), in which case the fragment shouldn't be cached. """
+    if not _config['enabled']:
+        return None
+    index_version = get_index_version(collection)
+    if index_version is None:
+        _count('bypassed')
+        return None
+    key_parts = [search_name, canonical_query(query, query_type), params, index_version]
+    digest = hashlib.sha1(json.dumps(key_parts, sort_keys=True, default=str).encode('utf-8'))
+    return 'papersearch:fragment:' + digest.hexdigest()
+
+def get(key):
+    """ Returns the cached fragment (dict with the rendered results_html and the page values) for
+    key, or None. """
+    if key is None:
+        return None
+    fragment = get_backend().get(key)
+    _count('hits' if fragment is not None else 'misses')
+    return fragment
+
+def store(key, fragment):
+    """ Stores the fragment under key, unless it is bigger than max_fragment_bytes. """
+    if key is None:
+        return
+    size = len(fragment['results_html'].encode('utf-8'))
+    if size > _config['max_fragment_bytes']:
+        _count('too_big')
+        return
+    backend = get_backend()
+    if isinstance(backend, SizedLRUCache):
+        backend.set(key, fragment, size)
+    else:
+        backend.set(key, fragment)
+
+def _count(counter):
+    with _stats_lock:
+        _stats[counter] += 1
+
+def get_stats():
+    """ Returns a dict with the no. of hits, misses, bypassed lookups (index version unknown),
+    fragments too big to be cached, the hit ratio, and the no. of entries and bytes of the lru
+    backend in this process. """
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_ratio'] = stats['hits'] / lookups if lookups else 0.0
+    backend = get_backend()
+    if isinstance(backend, SizedLRUCache):
+        stats['entries'] = len(backend)
+        stats['bytes'] = backend.size
+    return stats
+
+def clear():
+    """ Removes all the cached fragments. """
+    get_backend().clear()
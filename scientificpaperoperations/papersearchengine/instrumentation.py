@@ -0,0 +1,171 @@
+    #-------------------------------------------------------------------------------
+    # Name:        Instrumentation
+    # Purpose:     Per-request stage timings of the searches: the Solr round trip, Solr's
+    #              own QTime (and its debug=timing breakdown), json parsing, building the
+    #              records, grouping, sentiment, the model and template rendering. Code
+    #              marks a stage with 'with timed(name) as timing', and can set the no. of
+    #              rows the stage handled. The timings of a request are collected in a
+    #              context variable (set by InstrumentationMiddleware, see middleware.py),
+    #              so they also reach the thread pool which runs the searches. Finished
+    #              requests are added to per-process latency histograms (get_metrics).
+    #              Outside a request (indexers, export worker), timed() does nothing.
+    #-------------------------------------------------------------------------------
+
+import contextvars
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from time import perf_counter
+
+# Upper bounds (ms) of the buckets of the latency histograms; the last bucket is unbounded.
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+_current_timings = contextvars.ContextVar('papersearch_request_timings', default=None)
+
+class StageTiming:
+    """ Duration (ms) and no. of rows of one stage. A stage which runs several times in a request
+    (e.g. Solr in the universal search) is summed, count is the no. of runs. """
+
+    def __init__(self, name):
+        self.name = name
+        self.duration_ms = 0.0
+        self.rows = None
+        self.count = 0
+
+    def as_dict(self):
+        return {'stage': self.name, 'ms': round(self.duration_ms, 3), 'rows': self.rows, 'count': self.count}
+
+class RequestTimings:
+    """ Stage timings of one request, in the order in which the stages first ran. Stages may be
+    added from several threads (concurrent searches). """
+
+    def __init__(self):
+        self.stages = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, name, duration_ms, rows=None):
+        with self._lock:
+            timing = self.stages.get(name)
+            if timing is None:
+                timing = self.stages[name] = StageTiming(name)
+            timing.duration_ms += duration_ms
+            timing.count += 1
+            if rows is not None:
+                timing.rows = (timing.rows or 0) + rows
+
+    def as_list(self):
+        with self._lock:
+            return [timing.as_dict() for timing in self.stages.values()]
+
+class _Timing:
+    """ Handed out by timed(): set rows to record the no. of rows the stage handled. """
+    __slots__ = ('rows',)
+
+    def __init__(self):
+        self.rows = None
+
+def start_request():
+    """ Starts collecting the timings of a request in the current context. Returns the
+    RequestTimings and a token for end_request. """
+    timings = RequestTimings()
+    return timings, _current_timings.set(timings)
+
+def resume_request(timings):
+    """ Collects the timings of the current context in the RequestTimings of a request again,
+    e.g. while the content of its streaming response is produced (after the view has returned).
+    Returns a token for end_request. """
+    return _current_timings.set(timings)
+
+def end_request(token):
+    _current_timings.reset(token)
+
+def get_current_timings():
+    """ Returns the RequestTimings of the current request, or None outside a request. """
+    return _current_timings.get()
+
+@contextmanager
+def timed(name):
+    """ Times the block as the stage name of the current request. """
+    timing = _Timing()
+    start_time = perf_counter()
+    try:
+        yield timing
+    finally:
+        timings = _current_timings.get()
+        if timings is not None:
+            timings.add(name, (perf_counter() - start_time) * 1000, timing.rows)
+
+def record_stage(name, duration_ms, rows=None):
+    """ Records a stage which was timed elsewhere (e.g. by Solr) in the current request. """
+    timings = _current_timings.get()
+    if timings is not None:
+        timings.add(name, duration_ms, rows)
+
+def record_solr_timing(data):
+    """ Records the QTime of a Solr json response (time spent in Solr, without the network and
+    the response writing) as the solr_qtime stage, and, if the request was sent with
+    debug=timing, the time of each search component (solr_query, solr_facet, ...). """
+    if _current_timings.get() is None:
+        return
+    header = data.get('responseHeader', {})
+    if 'QTime' in header:
+        record_stage('solr_qtime', header['QTime'])
+    debug_timing = data.get('debug', {}).get('timing')
+    if debug_timing:
+        for component, component_timing in debug_timing.get('process', {}).items():
+            if isinstance(component_timing, dict) and component_timing.get('time'):
+                record_stage('solr_' + component, component_timing['time'])
+
+class LatencyHistogram:
+    """ Counts of the durations in LATENCY_BUCKETS_MS, with their sum. """
+
+    def __init__(self):
+        self.bucket_counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.count = 0
+        self.sum_ms = 0.0
+
+    def observe(self, duration_ms):
+        for index, bound in enumerate(LATENCY_BUCKETS_MS):
+            if duration_ms <= bound:
+                break
+        else:
+            index = len(LATENCY_BUCKETS_MS)
+        self.bucket_counts[index] += 1
+        self.count += 1
+        self.sum_ms += duration_ms
+
+    def as_dict(self):
+        bounds = [str(bound) for bound in LATENCY_BUCKETS_MS] + ['+Inf']
+        return {'count': self.count, 'sum_ms': round(self.sum_ms, 3),
+                'mean_ms': round(self.sum_ms / self.count, 3) if self.count else None,
+                'buckets_ms': OrderedDict(zip(bounds, self.bucket_counts))}
+
+_metrics_lock = threading.Lock()
+# search type -> latency histogram of the requests
+_latencies = {}
+# search type -> stage -> latency histogram of the stage
+_stage_latencies = {}
+
+def observe_request(search_type, total_ms, timings):
+    """ Adds a finished request (its total duration and stage timings) to the histograms of its
+    search type (e.g. the url name of the view). """
+    stages = timings.as_list()
+    with _metrics_lock:
+        _latencies.setdefault(search_type, LatencyHistogram()).observe(total_ms)
+        search_stages = _stage_latencies.setdefault(search_type, {})
+        for stage in stages:
+            search_stages.setdefault(stage['stage'], LatencyHistogram()).observe(stage['ms'])
+
+def get_metrics():
+    """ Returns a dict search type -> {'latency': histogram, 'stages': stage -> histogram} of the
+    requests served by this process. """
+    with _metrics_lock:
+        return {search_type: {'latency': histogram.as_dict(),
+                              'stages': {stage: stage_histogram.as_dict() for stage, stage_histogram
+                                         in _stage_latencies.get(search_type, {}).items()}}
+                for search_type, histogram in _latencies.items()}
+
+def reset_metrics():
+    with _metrics_lock:
+        _latencies.clear()
+        _stage_latencies.clear()
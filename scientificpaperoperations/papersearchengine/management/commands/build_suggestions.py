@@ -0,0 +1,38 @@
+from time import sleep
+from django.core.management.base import BaseCommand
+from papersearchengine import suggestions
+from papersearchengine.solr_client import SolrError
+
+class Command(BaseCommand):
+    help = "Builds the prefix index of the typeahead suggestions (see papersearchengine/suggestions.py) " \
+           "if the Solr indexes changed since it was last built."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true',
+                            help="Rebuild the index even if the Solr indexes didn't change.")
+        parser.add_argument('--watch', type=float, default=None, metavar='SECONDS',
+                            help="Keep running, checking the Solr indexes for changes every SECONDS seconds.")
+
+    def handle(self, *args, **options):
+        force = options['force']
+        while True:
+            if force or suggestions.is_stale(suggestions.load_index_file()):
+                self.build()
+                force = False
+            elif options['watch'] is None:
+                self.stdout.write("The suggestions are up to date")
+            if options['watch'] is None:
+                return
+            sleep(options['watch'])
+
+    def build(self):
+        self.stdout.write("Building the suggestions")
+        try:
+            index = suggestions.build_index()
+        except SolrError as err:
+            self.stdout.write(self.style.ERROR("Building the suggestions failed: {}".format(err)))
+            return
+        suggestions.save_index(index)
+        self.stdout.write(self.style.SUCCESS("Saved {} suggestions".format(
+            ', '.join('{} {}'.format(len(dictionary['suggestions']), name)
+                      for name, dictionary in index['dictionaries'].items()))))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+from papersearchengine import model_registry, prediction_cache
+
+class Command(BaseCommand):
+    help = "Removes old predictions from the SQLite tier of the prediction cache " \
+           "(see papersearchengine/prediction_cache.py)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-age', type=float, default=None, metavar='DAYS',
+                            help="Remove the predictions stored more than DAYS days ago.")
+        parser.add_argument('--old-versions', action='store_true',
+                            help="Remove the predictions of every model version except the one of the artifact "
+                                 "currently on disk. Run it once all the workers use the new model.")
+
+    def handle(self, *args, **options):
+        if options['max_age'] is None and not options['old_versions']:
+            raise CommandError("Give --max-age and/or --old-versions")
+        max_age = options['max_age'] * 24 * 3600 if options['max_age'] is not None else None
+        keep_version = model_registry.get_model_version() if options['old_versions'] else None
+        num_removed = prediction_cache.prune(max_age=max_age, keep_version=keep_version)
+        self.stdout.write(self.style.SUCCESS("Removed {} cached predictions".format(num_removed)))
@@ -0,0 +1,37 @@
+from time import sleep
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from papersearchengine.exports import claim_next_job, requeue_stale_jobs, run_export_job
+
+class Command(BaseCommand):
+    help = "Runs the queued export jobs (see papersearchengine/exports.py), polling for new ones."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help="Run the jobs which are queued and exit, instead of polling for new ones.")
+        parser.add_argument('--poll-interval', type=float, default=None,
+                            help="Seconds between checks for new jobs (default: settings.EXPORT_POLL_INTERVAL).")
+
+    def handle(self, *args, **options):
+        poll_interval = options['poll_interval'] or settings.EXPORT_POLL_INTERVAL
+        while True:
+            # The jobs of the workers which died (including this one, before a restart)
+            num_stale_jobs = requeue_stale_jobs()
+            if num_stale_jobs:
+                self.stdout.write(self.style.WARNING("Requeued or failed {} interrupted jobs".format(num_stale_jobs)))
+            job = claim_next_job()
+            if job is None:
+                if options['once']:
+                    return
+                sleep(poll_interval)
+                continue
+            self.stdout.write("Running {}".format(job))
+            if run_export_job(job):
+                job.refresh_from_db()
+                self.stdout.write(self.style.SUCCESS("Exported {} results to {}".format(job.num_exported, job.file_path)))
+            else:
+                job.refresh_from_db()
+                if job.status == 'failed':
+                    self.stdout.write(self.style.ERROR("Export failed: {}".format(job.error)))
+                else:
+                    self.stdout.write(self.style.WARNING("The job was requeued by another worker"))
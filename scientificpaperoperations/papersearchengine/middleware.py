@@ -0,0 +1,155 @@
+    #-------------------------------------------------------------------------------
+    # Name:        Middleware
+    # Purpose:     InstrumentationMiddleware collects the stage timings of each request
+    #              (see instrumentation.py) and reports them: as a Server-Timing header
+    #              (shown by the browser's dev tools), as a structured (json) log line on
+    #              the papersearchengine.performance logger, and in the latency histograms
+    #              of the metrics endpoint. Works with both the sync and the async views.
+    #              Streaming responses (the NDJSON API, the bibliography) fetch their Solr
+    #              pages while they are sent, so they are timed until the stream ends and
+    #              have no Server-Timing header (it is sent before the content).
+    #-------------------------------------------------------------------------------
+
+import asyncio
+import json
+import logging
+from time import perf_counter
+from django.conf import settings
+from . import instrumentation
+
+try:
+    # asgiref >= 3.6.0 (Django >= 4.1)
+    from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+except ImportError:
+    iscoroutinefunction = asyncio.iscoroutinefunction
+
+    def markcoroutinefunction(middleware):
+        """ Marks the middleware instance as a coroutine function, as in the middleware docs of
+        Django 3.1 to 4.0. """
+        middleware._is_coroutine = asyncio.coroutines._is_coroutine
+
+logger = logging.getLogger('papersearchengine.performance')
+
+# Returned by next() when the content of a streaming response is exhausted
+_END_OF_STREAM = object()
+
+class InstrumentationMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            # Lets Django call the middleware as a coroutine function
+            markcoroutinefunction(self)
+        config = getattr(settings, 'INSTRUMENTATION', {})
+        self.enabled = config.get('ENABLED', True)
+        self.server_timing = config.get('SERVER_TIMING', True)
+        self.log = config.get('LOG', True)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not self.enabled:
+            return self.get_response(request)
+        timings, token = instrumentation.start_request()
+        start_time = perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            instrumentation.end_request(token)
+        return self.finish(request, response, timings, start_time)
+
+    async def __acall__(self, request):
+        if not self.enabled:
+            return await self.get_response(request)
+        timings, token = instrumentation.start_request()
+        start_time = perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            instrumentation.end_request(token)
+        return self.finish(request, response, timings, start_time)
+
+    def finish(self, request, response, timings, start_time):
+        """ Reports the request, or, for a streaming response, wraps its content so that the
+        request is reported once the content has been sent. """
+        if not response.streaming:
+            self.report(request, response, timings, (perf_counter() - start_time) * 1000)
+        elif getattr(response, 'is_async', False):
+            response.streaming_content = self.time_async_stream(request, response, timings, start_time,
+                                                                response.streaming_content)
+        else:
+            response.streaming_content = self.time_stream(request, response, timings, start_time,
+                                                          iter(response.streaming_content))
+        return response
+
+    def time_stream(self, request, response, timings, start_time, content):
+        """ Yields the chunks of content, recording the stages which produce them in the request's
+        timings, and reports the request when the stream ends or is closed. """
+        try:
+            while True:
+                token = instrumentation.resume_request(timings)
+                try:
+                    chunk = next(content, _END_OF_STREAM)
+                finally:
+                    instrumentation.end_request(token)
+                if chunk is _END_OF_STREAM:
+                    return
+                yield chunk
+        finally:
+            self.report(request, response, timings, (perf_counter() - start_time) * 1000)
+
+    async def time_async_stream(self, request, response, timings, start_time, content):
+        """ Same as time_stream, for the async content of a streaming response under ASGI. The
+        threads which produce the chunks (see async_search.iterate_in_thread) get the timings
+        with the context. """
+        try:
+            while True:
+                token = instrumentation.resume_request(timings)
+                try:
+                    chunk = await content.__anext__()
+                except StopAsyncIteration:
+                    return
+                finally:
+                    instrumentation.end_request(token)
+                yield chunk
+        finally:
+            self.report(request, response, timings, (perf_counter() - start_time) * 1000)
+
+    def report(self, request, response, timings, total_ms):
+        """ Adds the Server-Timing header, logs the request and adds it to the histograms. Only
+        requests which ran at least one stage (the searches) are logged and counted. """
+        stages = timings.as_list()
+        if not stages:
+            return
+        search_type = get_search_type(request)
+        if self.server_timing and not response.streaming:
+            response['Server-Timing'] = format_server_timing(stages, total_ms)
+        if self.log:
+            logger.info(json.dumps({'search_type': search_type, 'path': request.path,
+                                    'status': response.status_code, 'streaming': response.streaming,
+                                    'total_ms': round(total_ms, 3), 'stages': stages}))
+        instrumentation.observe_request(search_type, total_ms, timings)
+
+def get_search_type(request):
+    """ Returns the name of the search of a request: the url name of its view, with the search
+    name for the API (e.g. api_search:cited_author). """
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unknown'
+    search_name = match.kwargs.get('search_name')
+    return '{}:{}'.format(match.url_name, search_name) if search_name else match.url_name
+
+def format_server_timing(stages, total_ms):
+    """ Returns the Server-Timing header for the stages, e.g.
+    solr;dur=12.5;desc="rows=100", render;dur=3.1, total;dur=20.2 """
+    metrics = []
+    for stage in stages:
+        metric = '{};dur={:.1f}'.format(stage['stage'], stage['ms'])
+        if stage['rows'] is not None:
+            metric += ';desc="rows={}"'.format(stage['rows'])
+        metrics.append(metric)
+    metrics.append('total;dur={:.1f}'.format(total_ms))
+    return ', '.join(metrics)
@@ -0,0 +1,26 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('papersearchengine', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exportjob',
+            name='polarity',
+            field=models.CharField(blank=True, max_length=10),
+        ),
+        migrations.AddField(
+            model_name='exportjob',
+            name='updated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='exportjob',
+            name='attempts',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,110 @@
+    #-------------------------------------------------------------------------------
+    # Name:        Model registry
+    # Purpose:     Process-wide holder for the citation polarity pipeline (CountVectorizer
+    #              + TF-IDF + SGD) created by create_ml_model.py. The pipeline is unpickled
+    #              once per process (lazily on first use, or by preload.py),
+    #              shared read-only by all the threads, and only reloaded when the joblib
+    #              artifact changes on disk.
+    #-------------------------------------------------------------------------------
+
+import hashlib
+import os
+import threading
+from time import time
+
+# The artifact is written by create_ml_model.py into the app folder.
+DEFAULT_MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                  'citation_model_pipeline.joblib')
+
+_lock = threading.Lock()
+_model_path = DEFAULT_MODEL_PATH
+# Currently loaded pipeline and the (mtime, size) of the file it was loaded from.
+_model = None
+_model_signature = None
+# Version of the loaded pipeline: hash of the artifact's contents, which identifies the model
+# across processes and restarts (e.g. in the keys of the prediction cache).
+_model_version = None
+# (pipeline, version, signature), replaced in one assignment so that the threads which don't
+# take the lock always see a pipeline with its own version.
+_loaded = (None, None, None)
+# Stats about the last load, returned by get_model_info
+_load_seconds = None
+_loaded_at = None
+_load_count = 0
+
+def configure(model_path=None):
+    """ Sets the path of the joblib artifact. A changed path forces a reload on the next
+    call to get_citation_model. """
+    global _model_path, _model, _model_signature, _model_version, _loaded
+    with _lock:
+        new_path = model_path or DEFAULT_MODEL_PATH
+        if new_path != _model_path:
+            _model_path = new_path
+            _model = None
+            _model_signature = None
+            _model_version = None
+            _loaded = (None, None, None)
+
+def _file_signature(path):
+    """ Returns (mtime, size) of the artifact, which is used to detect that it has been
+    replaced on disk. """
+    stat = os.stat(path)
+    return (stat.st_mtime, stat.st_size)
+
+def _file_version(path):
+    """ Returns the sha1 of the artifact's contents. """
+    digest = hashlib.sha1()
+    with open(path, 'rb') as model_file:
+        for block in iter(lambda: model_file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def get_citation_model():
+    """ Returns the shared citation polarity pipeline, loading it if it hasn't been loaded
+    yet in this process or if the artifact has changed since it was loaded. The pipeline is
+    only used for predict, so the same object is handed out to every thread. """
+    return get_versioned_citation_model()[0]
+
+def get_versioned_citation_model():
+    """ Like get_citation_model, but returns (pipeline, version), where version is the hash of
+    the artifact the pipeline was loaded from. Both come from the same load, so predictions
+    made with the pipeline can safely be stored under the version. """
+    global _model, _model_signature, _model_version, _loaded, _load_seconds, _loaded_at, _load_count
+    signature = _file_signature(_model_path)
+    model, version, loaded_signature = _loaded
+    if model is not None and signature == loaded_signature:
+        return model, version
+    with _lock:
+        # Another thread may have loaded it while this one was waiting for the lock.
+        signature = _file_signature(_model_path)
+        if _model is not None and signature == _model_signature:
+            return _model, _model_version
+        start_time = time()
+        # scikit-learn is only imported when the model is first needed (or by preload.py), so
+        # that it isn't loaded with the views and by every manage.py command.
+        from sklearn.externals import joblib
+        model = joblib.load(_model_path)
+        version = _file_version(_model_path)
+        _load_seconds = time() - start_time
+        _loaded_at = time()
+        _load_count += 1
+        _model = model
+        _model_version = version
+        _model_signature = signature
+        _loaded = (model, version, signature)
+        return model, version
+
+def get_model_version():
+    """ Returns the version (hash) of the artifact currently on disk, without loading it. """
+    return _file_version(_model_path)
+
+def get_model_info():
+    """ Returns a dict with details about the currently loaded model: path, whether it is
+    loaded, its version (hash of the artifact), how long the last load took (in seconds), when
+    it was loaded (epoch seconds) and how many times it has been loaded in this process. """
+    return {'path': _model_path,
+            'loaded': _model is not None,
+            'version': _model_version,
+            'load_seconds': _load_seconds,
+            'loaded_at': _loaded_at,
+            'load_count': _load_count}
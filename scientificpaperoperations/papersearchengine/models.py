@@ -1,3 +1,58 @@
+import uuid
 from django.db import models
 
 # Create your models here.
+
+class ExportJob(models.Model):
+    """ Export of all the results of a search into a file on disk. The jobs are queued by the
+    export view and run by the export worker (manage.py run_export_worker), see exports.py. """
+    STATUS_CHOICES = (
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    )
+    FORMAT_CHOICES = (
+        ('csv', 'CSV'),
+        ('jsonl', 'JSON Lines'),
+        ('parquet', 'Parquet'),
+    )
+    # Used in the status and download urls, so that the jobs can't be enumerated
+    token = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    # Name of the search in django_paper_search_v2.SEARCH_DEFINITIONS
+    search_name = models.CharField(max_length=20)
+    query = models.CharField(max_length=100)
+    file_format = models.CharField(max_length=10, choices=FORMAT_CHOICES, default='csv')
+    # None: export all the results
+    max_results = models.PositiveIntegerField(null=True, blank=True)
+    # Only the citation contexts with this citation polarity (cited_paper/cited_author searches), '' for all
+    polarity = models.CharField(max_length=10, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued', db_index=True)
+    # Progress: total no. of results found by Solr, and no. of results written so far
+    num_results = models.PositiveIntegerField(null=True, blank=True)
+    num_exported = models.PositiveIntegerField(default=0)
+    file_path = models.CharField(max_length=500, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # Last progress of a running job: a job without progress for EXPORT_STALE_TIMEOUT seconds is
+    # requeued (its worker died), until it has been claimed EXPORT_MAX_ATTEMPTS times
+    updated_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['created_at']
+
+    def __str__(self):
+        return '{} export of {} search "{}" ({})'.format(self.file_format, self.search_name, self.query, self.status)
+
+    def get_progress(self):
+        """ Returns the percentage of the results which have been exported, or None if the
+        no. of results isn't known yet. """
+        if self.num_results is None:
+            return None
+        total = self.num_results if self.max_results is None else min(self.num_results, self.max_results)
+        if total == 0:
+            return 100
+        return min(100, int(100 * self.num_exported / total))
@@ -0,0 +1,214 @@
+    #-------------------------------------------------------------------------------
+    # Name:        Prediction cache
+    # Purpose:     Memoizes the citation polarity predicted for each citing sentence, so
+    #              that the sentences which come back in search after search aren't
+    #              vectorized and predicted again. Entries are keyed by (model version,
+    #              hash of the sentence): the model version is the hash of the joblib
+    #              artifact (see model_registry.py), so a new model never gets the
+    #              predictions of the old one. The cache has an in-process LRU tier and an
+    #              optional SQLite tier, which survives restarts and is shared by the
+    #              worker processes. Only the sentences missing from both tiers are
+    #              predicted, in 1 call to the model. The SQLite tier keeps the entries of
+    #              every model version (old and new workers share it during a rolling
+    #              deploy); old entries are removed with manage.py prune_prediction_cache.
+    #-------------------------------------------------------------------------------
+
+import hashlib
+import os
+import sqlite3
+import threading
+from time import time
+from .instrumentation import timed
+from .result_cache import LRUCache
+
+_config = {
+    'enabled': True,
+    # Max. no. of predictions in the in-process tier
+    'max_entries': 100000,
+    # Path of the SQLite database of the persistent tier, None: no persistent tier
+    'sqlite_path': None,
+}
+
+_lock = threading.Lock()
+_stats = {'hits': 0, 'disk_hits': 0, 'misses': 0}
+_memory = None
+# The SQLite connection is opened lazily, once per process (connections can't be shared
+# with a forked child); it is used by all the threads, under _db_lock.
+_db = None
+_db_pid = None
+_db_lock = threading.Lock()
+# Model version of the entries in the in-process tier. When a new version shows up, the
+# in-process entries of the old one are dropped (the SQLite entries are kept, see prune).
+_model_version = None
+
+# Max. no. of sentence hashes per SQLite query (SQLite allows 999 parameters)
+SQLITE_CHUNK_SIZE = 500
+
+def configure(**kwargs):
+    """ Updates the config (enabled, max_entries, sqlite_path). Values which are None are
+    ignored. Both tiers are reopened on next use. """
+    global _memory, _db
+    with _lock:
+        for key, value in kwargs.items():
+            if key not in _config:
+                raise ValueError("Unknown prediction cache setting: {}".format(key))
+            if value is not None:
+                _config[key] = value
+        _memory = None
+    with _db_lock:
+        if _db is not None and _db_pid == os.getpid():
+            _db.close()
+        _db = None
+
+def get_memory():
+    """ Returns the in-process tier, creating it on first use. """
+    global _memory
+    with _lock:
+        if _memory is None:
+            _memory = LRUCache(_config['max_entries'])
+        return _memory
+
+def _get_db():
+    """ Returns the SQLite connection of this process (opening it and creating the table if
+    needed), or None if there is no persistent tier. Must be called with _db_lock held. """
+    global _db, _db_pid
+    if _config['sqlite_path'] is None:
+        return None
+    if _db is None or _db_pid != os.getpid():
+        _db = sqlite3.connect(_config['sqlite_path'], timeout=10, check_same_thread=False)
+        # WAL lets the other worker processes read while one of them writes
+        _db.execute('PRAGMA journal_mode=WAL')
+        _db.execute('CREATE TABLE IF NOT EXISTS predictions (model_version TEXT NOT NULL, '
+                    'sentence_hash TEXT NOT NULL, polarity TEXT NOT NULL, stored_at REAL NOT NULL DEFAULT 0, '
+                    'PRIMARY KEY (model_version, sentence_hash)) WITHOUT ROWID')
+        # Databases created before stored_at was added: their entries count as the oldest ones
+        columns = [row[1] for row in _db.execute('PRAGMA table_info(predictions)')]
+        if 'stored_at' not in columns:
+            _db.execute('ALTER TABLE predictions ADD COLUMN stored_at REAL NOT NULL DEFAULT 0')
+        _db.commit()
+        _db_pid = os.getpid()
+    return _db
+
+def sentence_hash(sentence):
+    return hashlib.sha1(sentence.encode('utf-8')).hexdigest()
+
+def _check_model_version(model_version):
+    """ Drops the in-process entries of the previous model when the model version changes.
+    The SQLite entries are kept: the other workers may still be using the previous model. """
+    global _model_version
+    with _lock:
+        if model_version == _model_version:
+            return
+        _model_version = model_version
+    get_memory().clear()
+
+def _disk_get_many(model_version, hashes):
+    """ Returns a dict hash -> polarity of the hashes which are in the persistent tier. """
+    found = {}
+    with _db_lock:
+        db = _get_db()
+        if db is None:
+            return found
+        for start in range(0, len(hashes), SQLITE_CHUNK_SIZE):
+            chunk = hashes[start:start + SQLITE_CHUNK_SIZE]
+            rows = db.execute('SELECT sentence_hash, polarity FROM predictions WHERE model_version = ? AND '
+                              'sentence_hash IN ({})'.format(','.join('?' * len(chunk))), [model_version] + chunk)
+            found.update(rows)
+    return found
+
+def _disk_set_many(model_version, predictions):
+    """ Stores the predictions (dict hash -> polarity) in the persistent tier. """
+    with _db_lock:
+        db = _get_db()
+        if db is None:
+            return
+        with db:
+            stored_at = time()
+            db.executemany('INSERT OR REPLACE INTO predictions (model_version, sentence_hash, polarity, stored_at) '
+                           'VALUES (?, ?, ?, ?)',
+                           [(model_version, key, polarity, stored_at) for key, polarity in predictions.items()])
+
+def predict(sentences, model_version, predict_func):
+    """ Returns the polarity of each of the sentences: the cached ones are looked up in the
+    in-process tier, then in the persistent tier, and all the others are predicted with
+    1 call to predict_func (the model's predict, which takes a list of sentences). """
+    if not _config['enabled']:
+        return list(predict_func(sentences))
+    _check_model_version(model_version)
+    memory = get_memory()
+    hashes = [sentence_hash(sentence) for sentence in sentences]
+    polarities = {}
+    # hash -> sentence of the sentences which aren't in the in-process tier
+    missing = {}
+    for key, sentence in zip(hashes, sentences):
+        if key in polarities:
+            continue
+        polarity = memory.get((model_version, key))
+        if polarity is not None:
+            polarities[key] = polarity
+            _count('hits')
+        else:
+            polarities[key] = None
+            missing[key] = sentence
+    if missing:
+        found = _disk_get_many(model_version, list(missing))
+        for key, polarity in found.items():
+            polarities[key] = polarity
+            memory.set((model_version, key), polarity)
+        _count('disk_hits', len(found))
+        for key in found:
+            del missing[key]
+    if missing:
+        _count('misses', len(missing))
+        with timed('predict') as timing:
+            predicted = dict(zip(missing, predict_func(list(missing.values()))))
+            timing.rows = len(predicted)
+        for key, polarity in predicted.items():
+            polarities[key] = polarity
+            memory.set((model_version, key), polarity)
+        _disk_set_many(model_version, predicted)
+    return [polarities[key] for key in hashes]
+
+def _count(counter, count=1):
+    with _lock:
+        _stats[counter] += count
+
+def get_stats():
+    """ Returns a dict with the no. of sentences found in the in-process tier (hits) and in
+    the persistent tier (disk_hits), the no. which had to be predicted (misses) and the hit
+    ratio in this process. Repeated sentences in a call are counted once. """
+    with _lock:
+        stats = dict(_stats)
+    lookups = stats['hits'] + stats['disk_hits'] + stats['misses']
+    stats['hit_ratio'] = (stats['hits'] + stats['disk_hits']) / lookups if lookups else 0.0
+    stats['model_version'] = _model_version
+    return stats
+
+def prune(max_age=None, keep_version=None):
+    """ Removes the entries of the persistent tier which were stored more than max_age seconds
+    ago, and those of every model version except keep_version (either can be None). Returns the
+    no. of entries removed. """
+    conditions, params = [], []
+    if max_age is not None:
+        conditions.append('stored_at < ?')
+        params.append(time() - max_age)
+    if keep_version is not None:
+        conditions.append('model_version != ?')
+        params.append(keep_version)
+    if not conditions:
+        return 0
+    with _db_lock:
+        db = _get_db()
+        if db is None:
+            return 0
+        with db:
+            return db.execute('DELETE FROM predictions WHERE {}'.format(' OR '.join(conditions)), params).rowcount
+
+def clear():
+    """ Removes all the cached predictions, in both tiers. """
+    get_memory().clear()
+    with _db_lock:
+        db = _get_db()
+        if db is not None:
+            with db:
+                db.execute('DELETE FROM predictions')
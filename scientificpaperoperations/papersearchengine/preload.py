@@ -0,0 +1,29 @@
+    #-------------------------------------------------------------------------------
+    # Name:        Preload
+    # Purpose:     Warm-up hook for servers. The views don't import scikit-learn or emoji
+    #              and the citation model is loaded on first use, so that manage.py
+    #              commands and the index/about pages start fast. A server can instead pay
+    #              for them once at startup: wsgi.py/asgi.py call preload() when
+    #              CITATION_MODEL_PRELOAD is turned on, so with a pre-forking server which loads
+    #              the app in the master (e.g. gunicorn --preload), the workers are forked
+    #              with everything already imported and the model in (shared) memory.
+    #-------------------------------------------------------------------------------
+
+import os
+from time import time
+from . import model_registry
+from .django_paper_search_v2 import get_sentiment_mapping
+
+def preload():
+    """ Imports emoji and loads the citation model with scikit-learn (if its artifact exists).
+    Returns a dict with the seconds spent on each step. """
+    timings = {}
+    start_time = time()
+    get_sentiment_mapping()
+    timings['emoji'] = time() - start_time
+    start_time = time()
+    # Nothing to load if the artifact hasn't been created yet (create_ml_model.py)
+    if os.path.exists(model_registry.get_model_info()['path']):
+        model_registry.get_citation_model()
+    timings['citation_model'] = time() - start_time
+    return timings
@@ -0,0 +1,63 @@
+    #-------------------------------------------------------------------------------
+    # Name:        Records
+    # Purpose:     Light-weight records for the results of the _plus indices. They are
+    #              built straight from the docs in Solr's json response (no pandas), and
+    #              their fields are in the order in which the results templates unpack them.
+    #-------------------------------------------------------------------------------
+
+import datetime
+from collections import namedtuple
+
+# papers_plus: phrase search results
+PaperSentence = namedtuple('PaperSentence', ['arxiv_identifier', 'arxiv_url', 'authors', 'dblp_url', 'published_date',
+                                             'revision_dates', 'sentence', 'sentencenum', 'title'])
+
+# metadata_plus: title and author search results
+PaperMetadata = namedtuple('PaperMetadata', ['arxiv_identifier', 'arxiv_url', 'authors', 'dblp_url', 'published_date',
+                                             'revision_dates', 'title'])
+
+# Citation polarity symbol predicted by the citation model -> value of the citation_polarity field
+# of references_plus (also used in the API and the exports)
+POLARITY_NAMES = {'p': 'positive', 'n': 'negative', 'o': 'neutral'}
+POLARITY_SYMBOLS = {name: symbol for symbol, name in POLARITY_NAMES.items()}
+
+# references_plus: one citation context (1 doc). citation_polarity is None for docs indexed before
+# the indexer classified the sentences.
+CitationContext = namedtuple('CitationContext', ['annotation', 'cited_paper_details', 'citing_arxiv_identifier',
+                                                 'citing_arxiv_url', 'citing_dblp_url', 'citing_paper_authors',
+                                                 'citing_paper_title', 'citing_published_date', 'citing_revision_dates',
+                                                 'citing_sentence', 'citing_sentencenum', 'annotation_start',
+                                                 'annotation_end', 'citation_polarity'])
+
+# references_plus: cited paper/cited author search results, which have all the sentences of a citing
+# paper with the same citation (annotation) in citing_sentence. Before they are formatted, the sentences
+# are (sentence, annotation_start, annotation_end, citation_polarity) tuples.
+CitationGroup = namedtuple('CitationGroup', ['annotation', 'cited_paper_details', 'citing_sentence',
+                                             'citing_arxiv_identifier', 'citing_paper_title', 'citing_paper_authors',
+                                             'citing_arxiv_url', 'citing_published_date', 'citing_revision_dates',
+                                             'citing_dblp_url'])
+
+def format_display_date(solr_date):
+    """ Converts a date from Solr's format (2018-01-13T00:00:00Z) to the display format
+    (January 13, 2018). Missing dates are returned as they are. """
+    if not solr_date:
+        return solr_date
+    return datetime.datetime.strptime(solr_date[:10], '%Y-%m-%d').strftime('%B %d, %Y')
+
+def display_date(doc, date_field):
+    """ Returns the date in date_field of a Solr doc in the display format. The indexers store
+    it in date_field + '_display'; it is only converted here for docs indexed before that. """
+    return doc.get(date_field + '_display') or format_display_date(doc.get(date_field))
+
+def make_records(record_class, docs, date_field=None):
+    """ Returns a list of record_class records built from the Solr docs. Fields which are
+    missing in a doc are None. The date in date_field (if given) is in the display format. """
+    fields = record_class._fields
+    date_index = fields.index(date_field) if date_field is not None else None
+    records = []
+    for doc in docs:
+        values = [doc.get(field) for field in fields]
+        if date_index is not None:
+            values[date_index] = display_date(doc, date_field)
+        records.append(record_class._make(values))
+    return records
@@ -0,0 +1,205 @@
+    #-------------------------------------------------------------------------------
+    # Name:        Result cache
+    # Purpose:     Caches the final, post-processed results of the search functions in
+    #              django_paper_search_v2 (after sentiment, grouping and date formatting),
+    #              so that repeated searches skip both Solr and the post-processing.
+    #              Keys are a canonical form of (collection, query, query type, rows,
+    #              sort, fq) plus the version of the Solr index, so that a commit to the
+    #              index invalidates the entries built from the old version.
+    #-------------------------------------------------------------------------------
+
+import functools
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from time import time
+from . import solr_client
+
+_config = {
+    # 'lru' (in-process, bounded) or 'django' (Django's cache framework)
+    'backend': 'lru',
+    'max_entries': 500,
+    # Seconds after which an entry expires, None: no expiry
+    'ttl': 600,
+    # Alias in settings.CACHES for the django backend
+    'cache_alias': 'default',
+    # How often (seconds) the Solr index version of a collection is looked up again
+    'index_version_check_interval': 30,
+    'enabled': True,
+}
+
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'bypassed': 0}
+
+class LRUCache:
+    """ In-process cache which holds at most max_entries entries, evicting the least recently
+    used one, and expires entries ttl seconds after they were stored. """
+
+    def __init__(self, max_entries, ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """ Returns the value for key, or None if it is missing or has expired. """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at < time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        """ Stores value under key, evicting the least recently used entries if needed. """
+        expires_at = time() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+class DjangoCache:
+    """ Stores the entries in one of the caches defined in settings.CACHES (e.g. memcached,
+    so that the entries are shared by all the worker processes). """
+
+    def __init__(self, alias, ttl=None):
+        from django.core.cache import caches
+        self.cache = caches[alias]
+        self.ttl = ttl
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def set(self, key, value):
+        self.cache.set(key, value, self.ttl)
+
+    def clear(self):
+        self.cache.clear()
+
+_backend = None
+_backend_lock = threading.Lock()
+# collection -> (index version, time when it was looked up)
+_index_versions = {}
+
+def configure(**kwargs):
+    """ Updates the cache config (backend, max_entries, ttl, cache_alias,
+    index_version_check_interval, enabled). Values which are None are ignored. The backend
+    is rebuilt on next use. """
+    global _backend
+    with _backend_lock:
+        for key, value in kwargs.items():
+            if key not in _config:
+                raise ValueError("Unknown result cache setting: {}".format(key))
+            if value is not None:
+                _config[key] = value
+        _backend = None
+
+def get_backend():
+    """ Returns the configured cache backend, creating it on first use. """
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                if _config['backend'] == 'django':
+                    _backend = DjangoCache(_config['cache_alias'], _config['ttl'])
+                elif _config['backend'] == 'lru':
+                    _backend = LRUCache(_config['max_entries'], _config['ttl'])
+                else:
+                    raise ValueError("Unknown result cache backend: {}".format(_config['backend']))
+    return _backend
+
+def get_index_version(collection):
+    """ Returns the Solr index version of the collection. It is looked up at most once every
+    index_version_check_interval seconds, so that a cache hit doesn't need a round trip. """
+    cached = _index_versions.get(collection)
+    if cached is not None and time() - cached[1] < _config['index_version_check_interval']:
+        return cached[0]
+    version = solr_client.get_index_version(collection)
+    _index_versions[collection] = (version, time())
+    return version
+
+def normalize_text(text):
+    """ Folds case and whitespace: ' Tim  Berners-Lee ' -> 'tim berners-lee' """
+    return ' '.join(str(text).split()).lower()
+
+def canonical_query(query, query_type):
+    """ Returns a canonical form of the query. For the author search (query_type 'and'), the
+    query is a list of authors which are ANDed, so the order of the authors is irrelevant. """
+    if isinstance(query, (list, tuple)):
+        authors = [normalize_text(author) for author in query if author.strip()]
+        if query_type == 'and':
+            authors.sort()
+        return ';'.join(authors)
+    return normalize_text(query)
+
+def make_key(collection, query, query_type, num_rows, sort_field=None, filter_query=None,
+             extra=None):
+    """ Returns the cache key for a search: a hash of the canonical search parameters and the
+    current index version of the collection, or None if the index version is unknown (Solr
+    couldn't be reached), in which case the results shouldn't be cached. """
+    index_version = get_index_version(collection)
+    if index_version is None:
+        return None
+    key_parts = [collection, canonical_query(query, query_type), query_type, num_rows,
+                 sort_field, filter_query, index_version, extra]
+    digest = hashlib.sha1(json.dumps(key_parts, sort_keys=True, default=str).encode('utf-8'))
+    return 'papersearch:results:' + digest.hexdigest()
+
+def cache_results(collection, query_type, sort_field=None, filter_query=None):
+    """ Decorator for the search functions of django_paper_search_v2 which take
+    (query, num_rows, *args). The final results are cached; any other positional/keyword
+    args (e.g. search_type) are part of the key. query_type may be a function which gets the
+    other positional args and returns the query type. """
+    def decorator(search_func):
+        @functools.wraps(search_func)
+        def wrapper(query, num_rows, *args, **kwargs):
+            if not _config['enabled']:
+                return search_func(query, num_rows, *args, **kwargs)
+            qtype = query_type(*args) if callable(query_type) else query_type
+            key = make_key(collection, query, qtype, num_rows, sort_field, filter_query,
+                           extra=[search_func.__name__, args, sorted(kwargs.items())])
+            if key is None:
+                _count('bypassed')
+                return search_func(query, num_rows, *args, **kwargs)
+            backend = get_backend()
+            results = backend.get(key)
+            if results is not None:
+                _count('hits')
+                return results
+            _count('misses')
+            results = search_func(query, num_rows, *args, **kwargs)
+            backend.set(key, results)
+            return results
+        return wrapper
+    return decorator
+
+def _count(counter):
+    with _stats_lock:
+        _stats[counter] += 1
+
+def get_stats():
+    """ Returns a dict with the no. of hits, misses, bypassed lookups (index version
+    unknown) and the hit ratio in this process. """
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_ratio'] = stats['hits'] / lookups if lookups else 0.0
+    return stats
+
+def clear():
+    """ Removes all the cached results and the cached index versions. """
+    _index_versions.clear()
+    get_backend().clear()
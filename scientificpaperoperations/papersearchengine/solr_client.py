@@ -0,0 +1,145 @@
+    #-------------------------------------------------------------------------------
+    # Name:        Solr client
+    # Purpose:     Shared HTTP client for Solr which is used by the Django views and by
+    #              the indexing scripts in Solr/Indexing. It keeps one pooled keep-alive
+    #              requests.Session per process, sets connect/read timeouts, retries
+    #              idempotent selects with a backoff and asks Solr for gzipped responses.
+    #              The indexers also post their updates with it (see bulk_writer.py).
+    #              It doesn't depend on Django, so that the indexers can import it too.
+    #-------------------------------------------------------------------------------
+
+import os
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from .instrumentation import timed
+
+# Defaults can be overridden through environment variables (indexers) or through
+# configure(), which the Django app calls with the values in settings.py.
+_config = {
+    'base_url': os.environ.get('SOLR_URL', 'http://localhost:8983/solr/'),
+    # Max. no. of keep-alive connections per host in this process.
+    'pool_size': int(os.environ.get('SOLR_POOL_SIZE', 10)),
+    'connect_timeout': float(os.environ.get('SOLR_CONNECT_TIMEOUT', 3.05)),
+    'read_timeout': float(os.environ.get('SOLR_READ_TIMEOUT', 60)),
+    'max_retries': int(os.environ.get('SOLR_MAX_RETRIES', 3)),
+    'backoff_factor': float(os.environ.get('SOLR_BACKOFF_FACTOR', 0.3)),
+    # Ask Solr for the time spent in each search component (debug=timing) on every select
+    'debug_timing': os.environ.get('SOLR_DEBUG_TIMING', '') == '1',
+}
+
+class SolrError(Exception):
+    """ Raised when Solr returns an error response to a select or an update, or when a select can't
+    reach Solr (after the retries). """
+
+_lock = threading.Lock()
+# The session is created lazily and re-created in child processes (e.g. the workers of a
+# ProcessPoolExecutor in the indexers), as pooled sockets must not be shared after a fork.
+_session = None
+_session_pid = None
+
+def configure(**kwargs):
+    """ Updates the client config (base_url, pool_size, connect_timeout, read_timeout,
+    max_retries, backoff_factor, debug_timing). Values which are None are ignored. The pooled session is
+    rebuilt on the next request. """
+    global _session
+    with _lock:
+        for key, value in kwargs.items():
+            if key not in _config:
+                raise ValueError("Unknown Solr client setting: {}".format(key))
+            if value is not None:
+                _config[key] = value
+        if not _config['base_url'].endswith('/'):
+            _config['base_url'] += '/'
+        _session = None
+
+def _build_retry():
+    """ Retries only GETs (selects are idempotent) on connection errors and on the 5xx
+    statuses Solr returns while it is overloaded or restarting. """
+    retry_kwargs = {'total': _config['max_retries'], 'backoff_factor': _config['backoff_factor'],
+                    'status_forcelist': (502, 503, 504), 'raise_on_status': False}
+    try:
+        return Retry(allowed_methods=frozenset(['GET']), **retry_kwargs)
+    except TypeError:
+        # urllib3 < 1.26
+        return Retry(method_whitelist=frozenset(['GET']), **retry_kwargs)
+
+def get_session():
+    """ Returns the pooled requests.Session of this process, creating it if needed. """
+    global _session, _session_pid
+    session = _session
+    if session is not None and _session_pid == os.getpid():
+        return session
+    with _lock:
+        if _session is None or _session_pid != os.getpid():
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=_config['pool_size'],
+                                  pool_maxsize=_config['pool_size'],
+                                  max_retries=_build_retry())
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            session.headers.update({'Accept-Encoding': 'gzip, deflate',
+                                    'Connection': 'keep-alive'})
+            _session = session
+            _session_pid = os.getpid()
+        return _session
+
+def get_url(collection, handler='select'):
+    """ Returns the url of a request handler of a collection, e.g. .../papers_plus/select """
+    return '{}{}/{}'.format(_config['base_url'], collection, handler)
+
+def get(collection, handler, params, timeout=None):
+    """ Sends a GET request to a request handler of the collection with the given params
+    over the pooled session and returns the requests.Response. timeout is (connect, read)
+    in seconds, the configured timeouts are used if it is None. """
+    if timeout is None:
+        timeout = (_config['connect_timeout'], _config['read_timeout'])
+    return get_session().get(get_url(collection, handler), params=params, timeout=timeout)
+
+def select(collection, params, timeout=None):
+    """ Sends a select request to the collection, see get(). The round trip is timed as the
+    solr stage of the current request (see instrumentation.py). Raises SolrError if Solr can't
+    be reached or doesn't answer in time. """
+    if _config['debug_timing']:
+        params = dict(params, debug='timing')
+    with timed('solr'):
+        try:
+            return get(collection, 'select', params, timeout)
+        except requests.RequestException as err:
+            raise SolrError("Solr couldn't be reached for a search of {}: {}".format(collection, err)) from err
+
+def post_select(collection, params, timeout=None):
+    """ Sends a select to the collection with the params in the body of a POST, for requests
+    whose url would be too long (e.g. a batch with many group.query params). Unlike GETs,
+    POSTs are not retried. timeout and errors are like in select(). """
+    if timeout is None:
+        timeout = (_config['connect_timeout'], _config['read_timeout'])
+    if _config['debug_timing']:
+        params = dict(params, debug='timing')
+    with timed('solr'):
+        try:
+            return get_session().post(get_url(collection, 'select'), data=params, timeout=timeout)
+        except requests.RequestException as err:
+            raise SolrError("Solr couldn't be reached for a search of {}: {}".format(collection, err)) from err
+
+def post_update(collection, body, params=None, timeout=None):
+    """ Posts a json update (body: the serialized json, e.g. a list of documents) to the update
+    handler of the collection over the pooled session and returns the requests.Response. Like
+    the other POSTs, updates are not retried. timeout is like in get(). """
+    if timeout is None:
+        timeout = (_config['connect_timeout'], _config['read_timeout'])
+    return get_session().post(get_url(collection, 'update'), data=body, params=params, timeout=timeout,
+                              headers={'Content-Type': 'application/json'})
+
+def get_index_version(collection):
+    """ Returns the version of the collection's index (it changes on every commit which
+    modifies the index), or None if Solr couldn't be reached. """
+    try:
+        response = get(collection, 'admin/luke', {'numTerms': 0, 'show': 'index', 'wt': 'json'},
+                       timeout=(_config['connect_timeout'], 5))
+    except requests.RequestException:
+        return None
+    if not response.ok:
+        return None
+    return response.json().get('index', {}).get('version')
@@ -0,0 +1,37 @@
+// Typeahead suggestions for the inputs with a data-suggest attribute (the search name, see forms.py).
+// The suggestions come from the suggest endpoint of the API (see api.py), whose url is in the data-url
+// attribute of this script's tag (with SEARCH_NAME in place of the search name). For the author
+// inputs, where the authors are separated by semicolons, the last author is completed.
+(function () {
+    var suggestUrl = document.currentScript.getAttribute('data-url');
+    // Wait this long (ms) after the last key before asking for suggestions
+    var DELAY = 150;
+
+    $('input[data-suggest]').each(function (inputNumber, input) {
+        var searchName = input.getAttribute('data-suggest');
+        var datalist = $('<datalist>').attr('id', 'suggestions-' + inputNumber).insertAfter(input);
+        var timer = null;
+        var request = null;
+        input.setAttribute('list', datalist.attr('id'));
+
+        $(input).on('input', function () {
+            clearTimeout(timer);
+            timer = setTimeout(function () {
+                var value = input.value;
+                var separator = value.lastIndexOf(';');
+                // What was typed before the author which is completed
+                var head = separator === -1 ? '' : value.slice(0, separator + 1) + ' ';
+                var typed = value.slice(separator + 1).trim();
+                if (request !== null) {
+                    request.abort();
+                }
+                request = $.getJSON(suggestUrl.replace('SEARCH_NAME', searchName), {q: typed, limit: 10}, function (data) {
+                    datalist.empty();
+                    $.each(data.suggestions, function (suggestionNumber, suggestion) {
+                        $('<option>').attr('value', head + suggestion).appendTo(datalist);
+                    });
+                });
+            }, DELAY);
+        });
+    });
+})();
@@ -0,0 +1,256 @@
+    #-------------------------------------------------------------------------------
+    # Name:        Suggestions
+    # Purpose:     Typeahead suggestions for the title, author, cited paper and cited
+    #              author forms, served from a prefix index held in memory, so that they
+    #              never go to Solr. The index has 3 dictionaries, built from the stored
+    #              fields of the Solr collections by the build_suggestions command: the
+    #              titles and the authors of metadata_plus, and the cited paper details of
+    #              references_plus (the cited author form uses the authors). Each entry is
+    #              found from the start of any of its first words (so 'residual' finds 'Deep
+    #              Residual Learning'), and the entries are ranked by their no. of papers
+    #              (citation contexts for the cited papers). The keys are sorted and packed
+    #              in 1 bytes object (see PackedKeys), which is searched with bisect; the top
+    #              entries of the prefixes which match many keys are precomputed, so a lookup
+    #              never scans more than SCAN_LIMIT keys.
+    #              The index is saved to a pickle file, which is reloaded when it changes.
+    #-------------------------------------------------------------------------------
+
+import heapq
+import os
+import pickle
+import threading
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from itertools import groupby
+from time import time
+from . import solr_client
+from .result_cache import normalize_text
+from .solr_client import SolrError
+
+_config = {
+    # Path of the pickle file of the prefix index
+    'index_path': None,
+    # Max. no. of entries of each dictionary (the ones with the most papers are kept)
+    'max_entries': 200000,
+    # Min. no. of characters typed before suggestions are returned
+    'min_prefix_length': 2,
+    # How often (seconds) the index file is checked for a new version
+    'reload_check_interval': 10,
+}
+
+# Form (search) -> dictionary of its suggestions
+SUGGESTION_DICTIONARIES = {'title': 'titles', 'author': 'authors', 'cited_paper': 'cited_papers',
+                           'cited_author': 'authors'}
+# Max. no. of suggestions returned by a lookup
+MAX_SUGGESTIONS = 20
+# An entry can be found from the start of each of its first MAX_WORD_STARTS words
+MAX_WORD_STARTS = 8
+# Keys are truncated to this no. of characters
+MAX_KEY_LENGTH = 50
+# Max. no. of keys scanned by a lookup: prefixes which match more keys have precomputed top entries
+SCAN_LIMIT = 2000
+# Page size of the Solr requests which fetch the stored fields
+FETCH_PAGE_SIZE = 5000
+
+_lock = threading.Lock()
+_index = None
+# mtime of the loaded index file, and time when the file was last checked
+_index_mtime = None
+_last_check = 0
+
+def configure(**kwargs):
+    """ Updates the config (index_path, max_entries, min_prefix_length, reload_check_interval).
+    Values which are None are ignored. The index is reloaded on next use. """
+    global _index, _index_mtime
+    with _lock:
+        for key, value in kwargs.items():
+            if key not in _config:
+                raise ValueError("Unknown suggestions setting: {}".format(key))
+            if value is not None:
+                _config[key] = value
+        _index = None
+        _index_mtime = None
+
+def iter_stored_fields(collection, fields, sort_field):
+    """ Generator which fetches the stored fields (comma-separated) of all the docs of the collection
+    with cursorMark, FETCH_PAGE_SIZE at a time (sort_field must be the collection's uniqueKey), and
+    yields the docs. Raises SolrError if Solr returns an error. """
+    cursor_mark = '*'
+    while True:
+        solr_response = solr_client.select(collection, {'q': '*:*', 'fl': fields, 'rows': FETCH_PAGE_SIZE,
+                                                        'sort': sort_field + ' asc', 'cursorMark': cursor_mark})
+        if not solr_response.ok:
+            raise SolrError("Solr returned {} for {}".format(solr_response.status_code, collection))
+        data = solr_response.json()
+        yield from data['response']['docs']
+        # Solr returns the same cursorMark when there are no more results.
+        if data['nextCursorMark'] == cursor_mark:
+            return
+        cursor_mark = data['nextCursorMark']
+
+def count_entries(counts, displays, text):
+    """ Counts one occurrence of text in counts (normalized text -> count), keeping the first
+    spelling of each entry for display. """
+    display = ' '.join(text.split())
+    key = display.lower()
+    if not key:
+        return
+    if key not in displays:
+        displays[key] = display
+    counts[key] += 1
+
+class PackedKeys:
+    """ Sorted keys stored compactly: their UTF-8 bytes joined in 1 bytes object, and the offset of
+    each key in an array, instead of 1 str object per key (up to MAX_WORD_STARTS per entry). It
+    supports len() and indexing, which is all bisect needs; the keys are decoded when they're read. """
+
+    def __init__(self, keys):
+        data = bytearray()
+        # offsets[i]:offsets[i + 1] are the bytes of key i
+        self.offsets = array('I', [0])
+        for key in keys:
+            data += key.encode('utf-8')
+            self.offsets.append(len(data))
+        self.data = bytes(data)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, position):
+        if position < 0:
+            position += len(self)
+        if not 0 <= position < len(self):
+            raise IndexError("key position out of range")
+        return self.data[self.offsets[position]:self.offsets[position + 1]].decode('utf-8')
+
+def build_dictionary(counts, displays, max_entries):
+    """ Returns the prefix dictionary of the max_entries entries with the highest counts:
+    suggestions (the display strings, by decreasing count, so a lower id is a better entry), the
+    sorted keys (start of each entry at each of its first words, as PackedKeys), the ids of the
+    entries of the keys, and tops (prefix -> ids of its best entries, for the prefixes of more
+    than SCAN_LIMIT keys). """
+    entries = [key for key, count in counts.most_common(max_entries)]
+    key_ids = []
+    for entry_id, entry in enumerate(entries):
+        words = entry.split(' ')
+        for word_start in range(min(len(words), MAX_WORD_STARTS)):
+            key_ids.append((' '.join(words[word_start:])[:MAX_KEY_LENGTH], entry_id))
+    key_ids.sort()
+    keys = [key for key, entry_id in key_ids]
+    ids = array('I', (entry_id for key, entry_id in key_ids))
+    del key_ids
+    # The ranges of keys of the heavy prefixes (more than SCAN_LIMIT keys), 1 character longer at
+    # each step. Only the prefixes of a heavy prefix can be heavy.
+    tops = {}
+    ranges = [(0, len(keys))]
+    prefix_length = 1
+    while ranges and prefix_length <= MAX_KEY_LENGTH:
+        heavy_ranges = []
+        for start, end in ranges:
+            position = start
+            for prefix, group in groupby(keys[start:end], key=lambda key: key[:prefix_length]):
+                group_end = position + sum(1 for _ in group)
+                if group_end - position > SCAN_LIMIT and len(prefix) == prefix_length:
+                    tops[prefix] = heapq.nsmallest(MAX_SUGGESTIONS, set(ids[position:group_end]))
+                    heavy_ranges.append((position, group_end))
+                position = group_end
+        ranges = heavy_ranges
+        prefix_length += 1
+    return {'suggestions': [displays[entry] for entry in entries], 'keys': PackedKeys(keys), 'ids': ids,
+            'tops': tops}
+
+def get_index_versions():
+    """ Returns the current index versions of the collections the suggestions are built from. """
+    return {collection: solr_client.get_index_version(collection)
+            for collection in ('metadata_plus', 'references_plus')}
+
+def build_index(max_entries=None):
+    """ Builds the prefix index from the stored titles and authors of metadata_plus and the cited
+    paper details of references_plus. Returns the index (see save_index). """
+    max_entries = max_entries or _config['max_entries']
+    index_versions = get_index_versions()
+    titles, authors, cited_papers = Counter(), Counter(), Counter()
+    displays = {'titles': {}, 'authors': {}, 'cited_papers': {}}
+    for doc in iter_stored_fields('metadata_plus', 'arxiv_identifier,title,authors', 'arxiv_identifier'):
+        if doc.get('title'):
+            count_entries(titles, displays['titles'], doc['title'])
+        # The authors are stored separated by semicolons
+        for author in (doc.get('authors') or '').split(';'):
+            count_entries(authors, displays['authors'], author)
+    for doc in iter_stored_fields('references_plus', 'id,cited_paper_details', 'id'):
+        if doc.get('cited_paper_details'):
+            count_entries(cited_papers, displays['cited_papers'], doc['cited_paper_details'])
+    return {'index_versions': index_versions, 'built_at': time(),
+            'dictionaries': {'titles': build_dictionary(titles, displays['titles'], max_entries),
+                             'authors': build_dictionary(authors, displays['authors'], max_entries),
+                             'cited_papers': build_dictionary(cited_papers, displays['cited_papers'],
+                                                              max_entries)}}
+
+def save_index(index, path=None):
+    """ Saves the index to the index file (atomically, so that a server never loads half of it). """
+    path = path or _config['index_path']
+    with open(path + '.part', 'wb') as index_file:
+        pickle.dump(index, index_file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(path + '.part', path)
+
+def load_index_file(path=None):
+    """ Returns the index saved in the index file, or None if there is none. """
+    path = path or _config['index_path']
+    try:
+        with open(path, 'rb') as index_file:
+            return pickle.load(index_file)
+    except FileNotFoundError:
+        return None
+
+def is_stale(index):
+    """ Returns True if there is no index or one of the Solr collections changed since it was built. """
+    return index is None or index['index_versions'] != get_index_versions()
+
+def get_index():
+    """ Returns the index of this process, loading it from the index file on first use and
+    whenever the file changes (checked at most every reload_check_interval seconds). Returns
+    None if there is no index file. """
+    global _index, _index_mtime, _last_check
+    if _index is not None and time() - _last_check < _config['reload_check_interval']:
+        return _index
+    with _lock:
+        _last_check = time()
+        if _config['index_path'] is None:
+            return None
+        try:
+            mtime = os.stat(_config['index_path']).st_mtime
+        except FileNotFoundError:
+            return _index
+        if mtime != _index_mtime:
+            _index = load_index_file()
+            _index_mtime = mtime
+        return _index
+
+def suggest(search_name, prefix, limit=10):
+    """ Returns up to limit (at most MAX_SUGGESTIONS) suggestions for what was typed (prefix) in
+    the form of the search (title, author, cited_paper or cited_author), best first. """
+    key = normalize_text(prefix)[:MAX_KEY_LENGTH]
+    if len(key) < _config['min_prefix_length']:
+        return []
+    index = get_index()
+    if index is None:
+        return []
+    dictionary = index['dictionaries'][SUGGESTION_DICTIONARIES[search_name]]
+    limit = min(limit, MAX_SUGGESTIONS)
+    entry_ids = dictionary['tops'].get(key)
+    if entry_ids is None:
+        # Not a heavy prefix: it matches at most SCAN_LIMIT keys
+        keys = dictionary['keys']
+        start = bisect_left(keys, key)
+        end = bisect_left(keys, key + '\uffff', start, min(start + SCAN_LIMIT, len(keys)))
+        entry_ids = heapq.nsmallest(limit, set(dictionary['ids'][start:end]))
+    return [dictionary['suggestions'][entry_id] for entry_id in entry_ids[:limit]]
+
+def get_stats():
+    """ Returns the no. of entries of each dictionary and when the loaded index was built. """
+    index = get_index()
+    if index is None:
+        return {'loaded': False}
+    return {'loaded': True, 'built_at': index['built_at'], 'index_versions': index['index_versions'],
+            'entries': {name: len(dictionary['suggestions']) for name, dictionary in index['dictionaries'].items()}}
@@ -1,3 +1,544 @@
-from django.test import TestCase
+import io
+import json
+import os
+import sys
+import tempfile
+from contextlib import redirect_stdout
+import requests
+from unittest import mock
+from django.conf import settings
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+from . import api, django_paper_search_v2, instrumentation, middleware, prediction_cache, result_cache, solr_client, \
+              views
+from .bibliography import BibliographyEntry, parse_bibliography
+from .django_paper_search_v2 import addoffsets_citation, search_references_plus
+from .solr_client import SolrError
 
-# Create your tests here.
+# The indexers live outside the Django project (they put scientificpaperoperations on sys.path themselves)
+INDEXING_FOLDERPATH = os.path.join(settings.BASE_DIR, '..', 'Solr', 'Indexing')
+if INDEXING_FOLDERPATH not in sys.path:
+    sys.path.insert(0, INDEXING_FOLDERPATH)
+
+# Polarity symbol -> text appended to the sentences (instead of the emojis)
+TEST_SENTIMENT_MAPPING = {'p': ' (positive)', 'n': ' (negative)', 'o': ' (neutral)'}
+
+class FakeSolrResponse:
+    """ Stands in for the requests response of a Solr select. """
+
+    def __init__(self, data=None, status_code=200, text=''):
+        self.data = data
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self.text = text
+
+    def json(self):
+        return self.data
+
+def references_plus_doc(citing_arxiv_identifier, citing_sentence, annotation='<GC:1>', polarity='positive',
+                        **fields):
+    """ Returns a references_plus doc as stored by the indexer. """
+    doc = {'annotation': annotation, 'cited_paper_details': 'Deep Residual Learning',
+           'citing_arxiv_identifier': citing_arxiv_identifier, 'citing_paper_title': 'Title ' + citing_arxiv_identifier,
+           'citing_paper_authors': 'Author', 'citing_published_date': '2018-01-13T00:00:00Z',
+           'citing_published_date_display': 'January 13, 2018', 'citing_sentence': citing_sentence,
+           'citation_polarity': polarity}
+    doc.update(fields)
+    return doc
+
+class ReferencesPlusIndexerTests(SimpleTestCase):
+    """ The records built by indexing_references_plus.py in its 2 modes. """
+
+    def setUp(self):
+        import indexing_references_plus
+        self.indexer = indexing_references_plus
+        # No metadata join (Solr or side table) and no citation model
+        for name in ('add_paper_metadata', 'classify_citation_polarity'):
+            patcher = mock.patch.object(indexing_references_plus, name)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.folderpath = folder.name
+
+    def write_file(self, filename, lines):
+        filepath = os.path.join(self.folderpath, filename)
+        with open(filepath, 'w') as file:
+            file.write('\n'.join(lines) + '\n')
+        return filepath
+
+    def test_citation_record_id_ignores_surrounding_whitespace(self):
+        self.assertEqual(self.indexer.citation_record_id('1801.01234', 'We use <GC:1>.', '<GC:1>'),
+                         self.indexer.citation_record_id('1801.01234', ' We use <GC:1>.\n', '<GC:1>'))
+        self.assertNotEqual(self.indexer.citation_record_id('1801.01234', 'We use <GC:1>.', '<GC:1>'),
+                            self.indexer.citation_record_id('1801.01234', 'We use <GC:1> too.', '<GC:1>'))
+
+    def test_normalize_arxiv_identifier(self):
+        self.assertEqual(self.indexer.normalize_arxiv_identifier('/dataset/1801.01234.txt'), '1801.01234')
+        self.assertEqual(self.indexer.normalize_arxiv_identifier('1801.01234.refs'), '1801.01234')
+        self.assertEqual(self.indexer.normalize_arxiv_identifier('1801.01234'), '1801.01234')
+
+    def test_both_modes_give_the_same_ids(self):
+        sentences = ['We use <GC:1> and <DBLP:conf/x/Y18>.', '==========', 'Unlike <GC:1>, we do not.']
+        txt_filepath = self.write_file('1801.01234.txt', sentences)
+        refs_filepath = self.write_file('1801.09999.refs', ['GC:1;Deep Residual Learning;',
+                                                            'DBLP:conf/x/Y18;Some Paper;'])
+        # Single-pass mode: scans the txt file and joins the annotations with the refs files
+        with mock.patch.dict(self.indexer.references, clear=True), redirect_stdout(io.StringIO()):
+            self.indexer.read_references(self.folderpath)
+            single_pass_records = self.indexer.parse_sentences_build_records(txt_filepath)
+        # Per-annotation mode: searches the papers index (no sentence numbers, the fileName of the txt file)
+        def search_papers(annotation, collection, search_field, num_rows):
+            return [[sentence, '1801.01234.txt', None] for sentence in sentences if '<{}>'.format(annotation) in sentence]
+        with mock.patch.object(self.indexer, 'search_solr', side_effect=search_papers), \
+             mock.patch.object(self.indexer, 'searched_annotations', set()):
+            per_annotation_records = self.indexer.parse_file_build_records(refs_filepath)
+        self.assertEqual(len(single_pass_records), 3)
+        self.assertEqual(sorted(record['id'] for record in single_pass_records),
+                         sorted(record['id'] for record in per_annotation_records))
+        self.assertEqual(len({record['id'] for record in single_pass_records}), 3)
+        # Only the single-pass mode knows the sentence numbers (the ====== lines aren't counted)
+        self.assertEqual([record['citing_sentencenum'] for record in single_pass_records], [1, 1, 2])
+        self.assertTrue(all('citing_sentencenum' not in record for record in per_annotation_records))
+
+    def test_build_record_annotation_offsets(self):
+        record = self.indexer.build_record('GC:1', 'Deep Residual Learning', '1801.09999', 'As in <GC:1>, we',
+                                           '1801.01234', 4)
+        self.assertEqual(record['annotation'], '<GC:1>')
+        self.assertEqual((record['annotation_start'], record['annotation_end']), (6, 12))
+        self.assertEqual(record['citing_sentence'][record['annotation_start']:record['annotation_end']], '<GC:1>')
+        # Regex metacharacters in the annotation are matched literally
+        record = self.indexer.build_record('DBLP:a+b(c)', 'Paper', '1801.09999', 'See <DBLP:a+b(c)>', '1801.01234', 1)
+        self.assertEqual((record['annotation_start'], record['annotation_end']), (4, 17))
+
+    def test_build_record_without_the_annotation_in_the_sentence(self):
+        record = self.indexer.build_record('GC:1', 'Deep Residual Learning', '1801.09999', 'No citation here',
+                                           '1801.01234', 4)
+        self.assertNotIn('annotation_start', record)
+        self.assertNotIn('annotation_end', record)
+
+    def test_build_record_citation_group(self):
+        record = self.indexer.build_record('GC:1', 'Deep Residual Learning', '1801.09999', 'As in <GC:1>',
+                                           '/dataset/1801.01234.txt', None)
+        self.assertEqual(record['citing_arxiv_identifier'], '1801.01234')
+        self.assertEqual(record['citation_group'], '1801.01234|<GC:1>')
+
+class AddOffsetsCitationTests(SimpleTestCase):
+
+    def test_stored_offsets_are_used(self):
+        self.assertEqual(addoffsets_citation('<GC:1>', [('As in <GC:1>, we', 6, 12)]),
+                         [['As in <GC:1>, we', '6:12', '0:6', '12:']])
+
+    def test_missing_offsets_are_found(self):
+        self.assertEqual(addoffsets_citation('<DBLP:a+b>', [('See <DBLP:a+b> and', None, None)]),
+                         [['See <DBLP:a+b> and', '4:14', '0:4', '14:']])
+
+    def test_annotation_not_in_the_sentence(self):
+        self.assertEqual(addoffsets_citation('<GC:1>', [('No citation here', None, None)]),
+                         [['No citation here', '0:0', '0:0', '0:']])
+
+@override_settings(CITATION_GROUPING='python')
+class PythonCitationGroupingTests(SimpleTestCase):
+    """ The Python grouping fallback of search_references_plus. """
+
+    def setUp(self):
+        enabled = result_cache._config['enabled']
+        result_cache.configure(enabled=False)
+        self.addCleanup(result_cache.configure, enabled=enabled)
+        patcher = mock.patch.object(django_paper_search_v2, 'get_sentiment_mapping',
+                                    return_value=TEST_SENTIMENT_MAPPING)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def search(self, docs, num_found):
+        data = {'responseHeader': {'params': {'q': '"deep residual"~2'}},
+                'response': {'numFound': num_found, 'docs': docs}, 'nextCursorMark': 'AoE'}
+        with mock.patch.object(django_paper_search_v2, 'select', return_value=FakeSolrResponse(data)) as select:
+            results = search_references_plus('deep residual', 10, 'title')
+        return results, select
+
+    def test_citation_contexts_are_grouped_by_citing_paper_and_annotation(self):
+        docs = [references_plus_doc('1801.01234', 'First <GC:1>.', annotation_start=6, annotation_end=12),
+                references_plus_doc('1802.00001', 'Other <GC:1>.', polarity='negative'),
+                references_plus_doc('1801.01234', 'Second <GC:1>.', polarity='neutral'),
+                # Same sentence again: dropped from the group
+                references_plus_doc('1801.01234', 'First <GC:1>.', annotation_start=6, annotation_end=12)]
+        (results_list, num_results, num_rows, query, next_cursor, num_page_contexts), select = self.search(docs, 57)
+        self.assertEqual(select.call_args[0][0], 'references_plus')
+        self.assertEqual((num_results, num_rows, query, next_cursor, num_page_contexts),
+                         (57, 10, '"deep residual"~2', 'AoE', 4))
+        self.assertEqual([group.citing_arxiv_identifier for group in results_list], ['1801.01234', '1802.00001'])
+        self.assertEqual(results_list[0].citing_sentence,
+                         [['First <GC:1>. (positive)', '6:12', '0:6', '12:'],
+                          ['Second <GC:1>. (neutral)', '7:13', '0:7', '13:']])
+        self.assertEqual(results_list[1].citing_sentence, [['Other <GC:1>. (negative)', '6:12', '0:6', '12:']])
+        self.assertEqual(results_list[0].citing_published_date, 'January 13, 2018')
+
+    def test_no_results(self):
+        results, select = self.search([], 0)
+        self.assertEqual(results, [])
+
+@override_settings(CITATION_GROUPING='solr')
+class MissingFieldFallbackTests(SimpleTestCase):
+    """ The searches which need the citation_group/citation_polarity fields only fall back when
+    the index doesn't have them, and raise SolrError for the other Solr errors. """
+
+    def setUp(self):
+        enabled = result_cache._config['enabled']
+        result_cache.configure(enabled=False)
+        self.addCleanup(result_cache.configure, enabled=enabled)
+        patcher = mock.patch.object(django_paper_search_v2, 'get_sentiment_mapping',
+                                    return_value=TEST_SENTIMENT_MAPPING)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_grouped_search_falls_back_when_the_index_has_no_citation_group_field(self):
+        data = {'responseHeader': {'params': {'q': '"deep residual"~2'}},
+                'response': {'numFound': 1, 'docs': [references_plus_doc('1801.01234', 'First <GC:1>.')]},
+                'nextCursorMark': 'AoE'}
+        responses = [FakeSolrResponse(status_code=400, text='{"error": {"msg": "undefined field citation_group"}}'),
+                     FakeSolrResponse(data)]
+        with mock.patch.object(django_paper_search_v2, 'select', side_effect=responses) as select:
+            results_list, num_results, num_rows, query, next_cursor, num_page_contexts = \
+                search_references_plus('deep residual', 10, 'title')
+        self.assertEqual(select.call_count, 2)
+        self.assertNotIn('group', select.call_args_list[1][0][1])
+        self.assertEqual((num_results, num_page_contexts), (1, 1))
+        self.assertEqual([group.citing_arxiv_identifier for group in results_list], ['1801.01234'])
+
+    def test_grouped_search_raises_other_solr_errors(self):
+        with mock.patch.object(django_paper_search_v2, 'select',
+                               return_value=FakeSolrResponse(status_code=500, text='Server error')) as select:
+            with self.assertRaises(SolrError):
+                search_references_plus('deep residual', 10, 'title')
+        self.assertEqual(select.call_count, 1)
+
+    def test_polarity_counts_are_none_when_the_index_has_no_citation_polarity_field(self):
+        response = FakeSolrResponse(status_code=400, text='{"error": {"msg": "undefined field citation_polarity"}}')
+        with mock.patch.object(django_paper_search_v2, 'select', return_value=response):
+            self.assertIsNone(django_paper_search_v2.get_polarity_counts('deep residual', 0, 'title'))
+
+    def test_polarity_counts_raise_other_solr_errors(self):
+        # A 400 for another reason (e.g. a syntax error in the query) isn't a missing field either
+        for response in (FakeSolrResponse(status_code=500, text='Server error'),
+                         FakeSolrResponse(status_code=400, text="org.apache.solr.search.SyntaxError")):
+            with mock.patch.object(django_paper_search_v2, 'select', return_value=response):
+                with self.assertRaises(SolrError):
+                    django_paper_search_v2.get_polarity_counts('deep residual', 0, 'title')
+
+class PredictionCacheTests(SimpleTestCase):
+    """ The SQLite tier of the prediction cache, shared by workers which may run different models. """
+
+    def setUp(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.sqlite_path = os.path.join(folder.name, 'predictions.sqlite3')
+        # Closes the connection after the config is restored
+        self.addCleanup(prediction_cache.configure)
+        patcher = mock.patch.dict(prediction_cache._config, enabled=True, sqlite_path=self.sqlite_path)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        prediction_cache.configure()
+
+    def predict(self, sentences, model_version, polarity):
+        predict_func = mock.Mock(side_effect=lambda missing: [polarity] * len(missing))
+        return prediction_cache.predict(sentences, model_version, predict_func), predict_func
+
+    def test_a_version_change_keeps_the_entries_of_the_other_versions(self):
+        self.predict(['Good <GC:1>.', 'Bad <GC:1>.'], 'old', 'p')
+        self.predict(['Good <GC:1>.'], 'new', 'n')
+        # Back to the old model (another worker of a rolling deploy): its entries are still on disk
+        polarities, predict_func = self.predict(['Good <GC:1>.', 'Bad <GC:1>.'], 'old', 'o')
+        self.assertEqual(polarities, ['p', 'p'])
+        predict_func.assert_not_called()
+        polarities, predict_func = self.predict(['Good <GC:1>.'], 'new', 'o')
+        self.assertEqual(polarities, ['n'])
+        predict_func.assert_not_called()
+
+    def test_prune_old_versions(self):
+        self.predict(['Good <GC:1>.', 'Bad <GC:1>.'], 'old', 'p')
+        self.predict(['Good <GC:1>.'], 'new', 'n')
+        self.assertEqual(prediction_cache.prune(keep_version='new'), 2)
+        prediction_cache.get_memory().clear()
+        polarities, predict_func = self.predict(['Good <GC:1>.', 'Bad <GC:1>.'], 'old', 'o')
+        self.assertEqual(polarities, ['o', 'o'])
+        self.assertEqual(predict_func.call_count, 1)
+
+    def test_prune_by_age(self):
+        with mock.patch.object(prediction_cache, 'time', return_value=1000.0):
+            self.predict(['Good <GC:1>.'], 'old', 'p')
+        with mock.patch.object(prediction_cache, 'time', return_value=5000.0):
+            self.predict(['Bad <GC:1>.'], 'new', 'n')
+            self.assertEqual(prediction_cache.prune(), 0)
+            self.assertEqual(prediction_cache.prune(max_age=3000), 1)
+        self.assertEqual(prediction_cache._disk_get_many('new', [prediction_cache.sentence_hash('Bad <GC:1>.')]),
+                         {prediction_cache.sentence_hash('Bad <GC:1>.'): 'n'})
+
+class BulkWriterTests(SimpleTestCase):
+    """ The batches sent by the shared writer of the indexers (Solr/Indexing/bulk_writer.py). """
+
+    def setUp(self):
+        import bulk_writer
+        self.bulk_writer = bulk_writer
+        # (no. of docs or None for the commit, url params) of each post, in the order in which they were sent
+        self.posts = []
+        self.failing_batches = set()
+        patcher = mock.patch.object(bulk_writer, 'post_update', side_effect=self.post_update)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(bulk_writer, 'REPORT_INTERVAL', float('inf'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post_update(self, collection, body, params):
+        docs = json.loads(body.decode('utf-8'))
+        if 'commit' in params:
+            self.posts.append((None, params))
+            return FakeSolrResponse()
+        self.posts.append((len(docs), params))
+        if docs[0]['id'] in self.failing_batches:
+            return FakeSolrResponse(status_code=400, text='Document is missing mandatory uniqueKey field')
+        return FakeSolrResponse()
+
+    def batch_sizes(self):
+        return sorted(num_docs for num_docs, params in self.posts if num_docs is not None)
+
+    def commits(self):
+        return [params for num_docs, params in self.posts if num_docs is None]
+
+    def test_batches_are_split_by_count(self):
+        with redirect_stdout(io.StringIO()):
+            num_docs = self.bulk_writer.write_documents('references_plus', ({'id': i} for i in range(5)), batch_size=2)
+        self.assertEqual(num_docs, 5)
+        self.assertEqual(self.batch_sizes(), [1, 2, 2])
+        self.assertTrue(all(params['commitWithin'] == self.bulk_writer.COMMIT_WITHIN
+                            for num_docs, params in self.posts if num_docs is not None))
+        # 1 hard commit, after all the batches
+        self.assertEqual(self.posts[-1], (None, {'commit': 'true', 'wt': 'json'}))
+        self.assertEqual(len(self.commits()), 1)
+
+    def test_batches_are_split_by_bytes(self):
+        documents = [{'id': i, 'sentence': 'x' * 40} for i in range(6)]
+        document_bytes = len(json.dumps(documents[0]).encode('utf-8')) + 1
+        with redirect_stdout(io.StringIO()):
+            self.bulk_writer.write_documents('references_plus', documents, max_batch_bytes=document_bytes * 2)
+        self.assertEqual(self.batch_sizes(), [2, 2, 2])
+        # A document bigger than a batch is sent alone
+        self.posts.clear()
+        with redirect_stdout(io.StringIO()):
+            self.bulk_writer.write_documents('references_plus', [{'id': 0}, {'id': 1, 'sentence': 'x' * 1000}, {'id': 2}],
+                                             max_batch_bytes=100)
+        self.assertEqual(self.batch_sizes(), [1, 1, 1])
+
+    def test_no_final_commit(self):
+        with redirect_stdout(io.StringIO()):
+            self.bulk_writer.write_documents('references_plus', ({'id': i} for i in range(3)), commit=False)
+        self.assertEqual(self.batch_sizes(), [3])
+        self.assertEqual(self.commits(), [])
+
+    def test_abort_sends_no_commit(self):
+        with self.assertRaises(ValueError):
+            with self.bulk_writer.BulkWriter('references_plus', batch_size=2) as writer:
+                for i in range(3):
+                    writer.add({'id': i})
+                raise ValueError('parse error')
+        # The full batch was sent, the last (partial) batch and the commit weren't
+        self.assertEqual(self.batch_sizes(), [2])
+        self.assertEqual(self.commits(), [])
+
+    def test_abort_doesnt_hide_the_error_of_the_run(self):
+        self.failing_batches.add(0)
+        with self.assertRaises(ValueError):
+            with self.bulk_writer.BulkWriter('references_plus', batch_size=2) as writer:
+                for i in range(3):
+                    writer.add({'id': i})
+                raise ValueError('parse error')
+        self.assertEqual(self.commits(), [])
+
+    def test_close_raises_the_first_batch_error(self):
+        self.failing_batches.add(0)
+        writer = self.bulk_writer.BulkWriter('references_plus', batch_size=2)
+        for i in range(3):
+            writer.add({'id': i})
+        with self.assertRaisesMessage(self.bulk_writer.SolrError, 'Solr returned 400 for a batch of 2 documents'):
+            writer.close()
+        self.assertEqual(self.commits(), [])
+
+class SolrErrorTests(SimpleTestCase):
+    """ Solr errors are raised as SolrError, and the search pages show them with status 502. """
+
+    def setUp(self):
+        enabled = result_cache._config['enabled']
+        result_cache.configure(enabled=False)
+        self.addCleanup(result_cache.configure, enabled=enabled)
+        # No index versions: nothing is cached
+        patcher = mock.patch.object(solr_client, 'get_index_version', return_value=None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_search_solr_raises_solr_error(self):
+        with mock.patch.object(django_paper_search_v2, 'select', return_value=FakeSolrResponse(status_code=500)):
+            with self.assertRaisesMessage(SolrError, 'Solr returned 500 for a search of papers_plus'):
+                django_paper_search_v2.search_sentences_plus('deep residual', 10)
+
+    def test_select_raises_solr_error_when_solr_cant_be_reached(self):
+        with mock.patch.object(solr_client, 'get', side_effect=requests.ConnectionError('refused')):
+            with self.assertRaisesMessage(SolrError, "Solr couldn't be reached"):
+                solr_client.select('papers_plus', {'q': '*:*'})
+
+    def test_search_page_shows_the_error(self):
+        with mock.patch.object(django_paper_search_v2, 'select', return_value=FakeSolrResponse(status_code=500)):
+            response = self.client.get(reverse('phrasesearchresults'), {'query': 'deep residual'})
+        self.assertEqual(response.status_code, 502)
+        self.assertTemplateUsed(response, 'papersearchengine/searcherror.html')
+        self.assertContains(response, 'Solr returned 500', status_code=502)
+
+class NdjsonStreamTests(SimpleTestCase):
+    """ format=ndjson of the search API sends each Solr page as soon as it has been fetched. """
+
+    def setUp(self):
+        # Solr pages which have been fetched so far
+        self.fetched_pages = []
+        patcher = mock.patch.object(api, 'iter_records_pages', side_effect=self.iter_records_pages)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(api, 'serialize_records',
+                                    side_effect=lambda records: [{'sentence': record} for record in records])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def iter_records_pages(self, search_name, query, page_size, max_results, filter_query):
+        for page in (1, 2, 3):
+            self.fetched_pages.append(page)
+            yield ['sentence {}.{}'.format(page, number) for number in (1, 2)], 6
+
+    async def test_pages_are_streamed_under_asgi(self):
+        response = await self.async_client.get(reverse('api_search', args=['phrase']),
+                                               {'query': 'deep residual', 'format': 'ndjson', 'numrows': 2})
+        self.assertTrue(response.is_async)
+        chunks = []
+        async for chunk in response.streaming_content:
+            chunks.append(chunk.decode('utf-8'))
+            # Only the page which is sent (and the first one, fetched before the response) have been fetched
+            self.assertEqual(self.fetched_pages, list(range(1, len(chunks) + 1)))
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual([json.loads(line) for line in ''.join(chunks).splitlines()],
+                         [{'sentence': 'sentence {}.{}'.format(page, number)} for page in (1, 2, 3) for number in (1, 2)])
+
+    def test_pages_are_streamed_under_wsgi(self):
+        response = self.client.get(reverse('api_search', args=['phrase']),
+                                   {'query': 'deep residual', 'format': 'ndjson', 'numrows': 2})
+        self.assertFalse(response.is_async)
+        content = iter(response.streaming_content)
+        next(content)
+        self.assertEqual(self.fetched_pages, [1])
+        self.assertEqual(len(b''.join(content).splitlines()), 4)
+
+class StreamingInstrumentationTests(SimpleTestCase):
+    """ InstrumentationMiddleware times a streaming response until its last chunk has been sent. """
+
+    def setUp(self):
+        instrumentation.reset_metrics()
+        self.addCleanup(instrumentation.reset_metrics)
+        patcher = mock.patch.object(api, 'iter_records_pages', side_effect=self.iter_records_pages)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(api, 'serialize_records',
+                                    side_effect=lambda records: [{'sentence': record} for record in records])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(middleware, 'logger')
+        self.logger = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def iter_records_pages(self, search_name, query, page_size, max_results, filter_query):
+        for page in (1, 2, 3):
+            instrumentation.record_stage('solr', 10.0, rows=2)
+            yield ['sentence {}.{}'.format(page, number) for number in (1, 2)], 6
+
+    def assert_reported_after_the_stream(self, response):
+        self.assertNotIn('Server-Timing', response)
+        # Only the first page had been fetched when the view returned
+        self.assertEqual(instrumentation.get_metrics(), {})
+        self.logger.info.assert_not_called()
+
+    def assert_all_pages_reported(self):
+        metrics = instrumentation.get_metrics()['api_search:phrase']
+        self.assertEqual(metrics['latency']['count'], 1)
+        # The solr stage of the request includes the 3 pages
+        self.assertEqual(metrics['stages']['solr']['sum_ms'], 30.0)
+        self.logger.info.assert_called_once()
+        log_entry = json.loads(self.logger.info.call_args[0][0])
+        self.assertTrue(log_entry['streaming'])
+        self.assertEqual(log_entry['stages'][0], {'stage': 'solr', 'ms': 30.0, 'rows': 6, 'count': 3})
+
+    def test_wsgi_stream(self):
+        response = self.client.get(reverse('api_search', args=['phrase']),
+                                   {'query': 'deep residual', 'format': 'ndjson', 'numrows': 2})
+        self.assert_reported_after_the_stream(response)
+        self.assertEqual(len(b''.join(response.streaming_content).splitlines()), 6)
+        self.assert_all_pages_reported()
+
+    async def test_asgi_stream(self):
+        response = await self.async_client.get(reverse('api_search', args=['phrase']),
+                                               {'query': 'deep residual', 'format': 'ndjson', 'numrows': 2})
+        self.assert_reported_after_the_stream(response)
+        chunks = [chunk async for chunk in response.streaming_content]
+        self.assertEqual(len(chunks), 3)
+        self.assert_all_pages_reported()
+
+class ParseBibliographyTests(SimpleTestCase):
+
+    def test_bibtex_titles(self):
+        text = """@article{he2016deep,
+  author = {He, Kaiming and Zhang, Xiangyu},
+  booktitle = {Proceedings of CVPR},
+  title = {Deep {Residual} Learning for {\\emph{Image}}
+           Recognition},
+  year = {2016}
+}
+
+@inproceedings{vaswani2017,
+  title = "Attention Is All You {N}eed",
+}
+@misc{nokey, author = {Nobody}}
+@article{schrodinger, Title={On {Schr\\"{o}dinger's} \\textit{Cat}}}
+"""
+        self.assertEqual(parse_bibliography(text), ['Deep Residual Learning for Image Recognition',
+                                                    'Attention Is All You Need', "On Schrodinger's Cat"])
+
+    def test_one_title_per_line(self):
+        text = "Deep Residual Learning\n\n   \n% a comment\n# another comment\n  Attention   Is All You Need  \n"
+        self.assertEqual(parse_bibliography(text), ['Deep Residual Learning', 'Attention Is All You Need'])
+
+    def test_blank_text(self):
+        self.assertEqual(parse_bibliography('\n \n\t\n'), [])
+
+class BibliographyPageStreamTests(SimpleTestCase):
+    """ The results page of the bibliography search is sent entry by entry, as they are resolved. """
+
+    def setUp(self):
+        # Entries which have been resolved so far
+        self.resolved = []
+        patcher = mock.patch.object(views, 'resolve_bibliography', side_effect=self.resolve_bibliography)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def resolve_bibliography(self, titles, numrows):
+        for title in titles:
+            self.resolved.append(title)
+            yield BibliographyEntry(title=title, paper=None, num_contexts=0, contexts=[], polarities=[])
+
+    async def test_entries_are_streamed_under_asgi(self):
+        response = await self.async_client.post(reverse('bibliographysearch'),
+                                                {'text': 'First Title\nSecond Title\nThird Title'})
+        self.assertTrue(response.is_async)
+        chunks = []
+        async for chunk in response.streaming_content:
+            chunks.append(chunk.decode('utf-8'))
+            # The head of the page, then 1 entry per chunk: an entry is only resolved when it is sent
+            self.assertEqual(len(self.resolved), min(len(chunks) - 1, 3))
+        page = ''.join(chunks)
+        self.assertEqual(len(chunks), 5)
+        self.assertLess(page.index('First Title'), page.index('Second Title'))
+        self.assertIn('Third Title', chunks[3])
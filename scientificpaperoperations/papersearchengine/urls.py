@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import api, views
 
 urlpatterns = [
     path('', views.index, name='index'),
@@ -13,5 +13,16 @@ urlpatterns = [
     path('citedpapersearchresults/', views.cited_paper_search, name='citedpapersearchresults'),
     path('citedauthorsearch/', views.cited_author_serach, name='citedauthorsearch'),
     path('citedauthorsearchresults/', views.cited_author_serach, name='citedauthorsearchresults'),
+    path('universalsearch/', views.universal_search, name='universalsearch'),
+    path('universalsearchresults/', views.universal_search, name='universalsearchresults'),
+    path('bibliographysearch/', views.bibliography_search, name='bibliographysearch'),
+    path('export/', views.export_search, name='exportsearch'),
+    path('export/<uuid:token>/', views.export_status, name='exportstatus'),
+    path('export/<uuid:token>/download/', views.export_download, name='exportdownload'),
     path('about/', views.about, name='about'),
+    path('metrics/', views.metrics, name='metrics'),
+    path('api/{}/batch/<str:search_name>/'.format(api.API_VERSION), api.batch_search, name='api_batch_search'),
+    path('api/{}/bibliography/'.format(api.API_VERSION), api.bibliography_search, name='api_bibliography_search'),
+    path('api/{}/suggest/<str:search_name>/'.format(api.API_VERSION), api.suggest, name='api_suggest'),
+    path('api/{}/<str:search_name>/'.format(api.API_VERSION), api.search, name='api_search'),
 ]
@@ -1,9 +1,51 @@
+import asyncio
 import datetime
+import functools
 import re
-from django.shortcuts import render
-from django.http import HttpResponse, Http404, HttpResponseRedirect
-from .forms import SearchPapersForm, SearchCitedAuthorsForm, SearchCitedPaperForm, SearchAuthorsForm, SearchMetatitleForm
+from collections import OrderedDict
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.shortcuts import render as django_render, get_object_or_404
+from django.http import FileResponse, HttpResponse, Http404, HttpResponseRedirect, JsonResponse, QueryDict, \
+                        StreamingHttpResponse
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils.safestring import mark_safe
+from .forms import SearchPapersForm, SearchCitedAuthorsForm, SearchCitedPaperForm, SearchAuthorsForm, SearchMetatitleForm, \
+                   UniversalSearchForm, BibliographyForm, ExportForm
 from .django_paper_search_v2 import *
+from . import async_search, fragment_cache, instrumentation, model_registry, prediction_cache, result_cache, \
+              suggestions
+from .async_search import run_search, run_searches, streaming_content
+from .bibliography import parse_bibliography, resolve_bibliography
+from .models import ExportJob
+from .records import format_display_date
+from .solr_client import SolrError
+
+def render(request, template_name, context=None, status=None):
+    """ django.shortcuts.render, timed as the render stage of the request (see instrumentation.py). """
+    with instrumentation.timed('render'):
+        return django_render(request, template_name, context, status=status)
+
+def search_error_page(view):
+    """ Decorator for the async search views: when Solr returns an error (or can't be reached),
+    an error page is shown with status 502, like the API's 502 responses, instead of a server error. """
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        try:
+            return await view(request, *args, **kwargs)
+        except SolrError as err:
+            return render(request, 'papersearchengine/searcherror.html', {'message': str(err)}, status=502)
+    return wrapper
+
+# Searches run by the universal search: name -> (heading, name of the url of the search's results page)
+UNIVERSAL_SEARCH_CATEGORIES = OrderedDict([
+    ('phrase', ("Papers containing the phrase", 'phrasesearchresults')),
+    ('title', ("Papers with the title", 'metadatatitlesearchresults')),
+    ('author', ("Papers by the author(s)", 'authorsearchresults')),
+    ('cited_paper', ("Citation contexts of the cited paper", 'citedpapersearchresults')),
+    ('cited_author', ("Citation contexts of the cited author(s)", 'citedauthorsearchresults')),
+])
 #from .django_paper_search import *
 
 # Create your views here.
@@ -14,7 +56,8 @@ def index(request):
     'papersearchengine/index.html',
     )
 
-def phrase_search(request):
+@search_error_page
+async def phrase_search(request):
     """ Implements  the phrase search by displaying a search form, checking for errors
     and rendering the results in the front-end."""
     # Check if the query field has already been populated. If so, send a get request to
@@ -31,14 +74,19 @@ def phrase_search(request):
             numrows = cleaned.get('numrows')
             if numrows is None:
                 numrows = 100
-            # Render the search results form
-            reslist = search_sentences_plus(query, numrows)
-            if reslist == []:
-                # No results found
-                printdict = {'query': query, 'numresults': 0, 'results':[], 'numrows': numrows}
-            else:
-                results, num_results, num_rows, query  = reslist
-                printdict = {'query': query, 'numresults': num_results, 'results':results, 'numrows': numrows}
+            page = cleaned.get('page') or 1
+            cursor = cleaned.get('cursor') or None
+            # Render the search results form. A page which was rendered before is taken from
+            # the fragment cache, without a search.
+            key = await run_search(fragment_cache.make_key, 'phrase', 'papers_plus', query, 'phrase',
+                                   numrows, page, cursor)
+            fragment = await get_fragment(key)
+            if fragment is None:
+                reslist = await run_search(search_sentences_plus, query, numrows, page=page, cursor=cursor)
+                fragment = await run_search(make_results_fragment, 'papersearchengine/phraseresultslist.html', reslist, query,
+                                            page, numrows)
+                await store_fragment(key, fragment)
+            printdict = get_results_context(request, fragment, page, numrows, cursor)
 
             return render(request, 'papersearchengine/phrasesearchresults.html', 
                           printdict)
@@ -47,7 +95,8 @@ def phrase_search(request):
     # Render empty form
     return render(request, 'papersearchengine/phrasesearch.html',{'form':form})
 
-def metadatatitle_search(request):
+@search_error_page
+async def metadatatitle_search(request):
      """ Implements  the metadata title search by displaying a search form, checking for errors
      and rendering the results in the front-end."""
      # Check if the query field has already been populated. If so, send a get request to
@@ -64,13 +113,17 @@ def metadatatitle_search(request):
              numrows = cleaned.get('numrows')
              if numrows is None:
                  numrows = 100
-             reslist = search_meta_titles(query, numrows)
-             if reslist == []:
-                 # No results found
-                 printdict = {'query': query, 'numresults': 0, 'results':[], 'numrows': numrows}
-             else:
-                 results, num_results, num_rows, query  = reslist
-                 printdict = {'query': query, 'numresults': num_results, 'results':results, 'numrows': numrows}
+             page = cleaned.get('page') or 1
+             cursor = cleaned.get('cursor') or None
+             key = await run_search(fragment_cache.make_key, 'title', 'metadata_plus', query, 'exact',
+                                    numrows, page, cursor)
+             fragment = await get_fragment(key)
+             if fragment is None:
+                 reslist = await run_search(search_meta_titles, query, numrows, page=page, cursor=cursor)
+                 fragment = await run_search(make_results_fragment, 'papersearchengine/titleresultslist.html', reslist, query,
+                                             page, numrows)
+                 await store_fragment(key, fragment)
+             printdict = get_results_context(request, fragment, page, numrows, cursor)
 
              return render(request, 'papersearchengine/titlesearchresults.html', 
                            printdict)
@@ -79,7 +132,8 @@ def metadatatitle_search(request):
      # Render empty form       
      return render(request, 'papersearchengine/titlesearch.html', {'form':form})
 
-def author_search(request):
+@search_error_page
+async def author_search(request):
      """ Implements  the author search by displaying a search form, checking for errors
      and rendering the results in the front-end."""
      # Check if the query field has already been populated. If so, send a get request to
@@ -102,13 +156,18 @@ def author_search(request):
              authors = [author.strip() for author in authors]
              # Create a display string for the query with ANDs between authors.
              displayauthors = ' AND '.join(authors)
-             reslist = search_authors(authors, numrows)
-             if reslist == []:
-                 # No results found
-                 printdict = {'query': displayauthors, 'numresults': 0, 'results':[], 'numrows': numrows}
-             else:
-                 results, num_results, num_rows, query  = reslist
-                 printdict = {'query': displayauthors, 'numresults': num_results, 'results':results, 'numrows': numrows}
+             page = cleaned.get('page') or 1
+             cursor = cleaned.get('cursor') or None
+             key = await run_search(fragment_cache.make_key, 'author', 'metadata_plus', authors, 'and',
+                                    numrows, page, cursor)
+             fragment = await get_fragment(key)
+             if fragment is None:
+                 reslist = await run_search(search_authors, authors, numrows, page=page, cursor=cursor)
+                 fragment = await run_search(make_results_fragment, 'papersearchengine/authorresultslist.html', reslist, query,
+                                             page, numrows)
+                 await store_fragment(key, fragment)
+             printdict = get_results_context(request, fragment, page, numrows, cursor)
+             printdict['query'] = displayauthors
 
              return render(request, 'papersearchengine/authorsearchresults.html', 
                            printdict)
@@ -117,6 +176,77 @@ def author_search(request):
      # Render empty form       
      return render(request, 'papersearchengine/authorsearch.html', {'form':form})
 
+async def get_fragment(key):
+    """ Returns the fragment of the key from the fragment cache, or None. The cache is used from
+    the thread of the sync code (like the ORM in async views), not on the event loop, as its
+    django backend can block on I/O or use the database. """
+    return await sync_to_async(fragment_cache.get)(key)
+
+async def store_fragment(key, fragment):
+    """ Stores the fragment of the key in the fragment cache, like get_fragment. """
+    await sync_to_async(fragment_cache.store)(key, fragment)
+
+def make_results_fragment(template_name, reslist, query, page, num_rows):
+    """ Renders the results of a search (reslist, as returned by the search function) with the
+    results list template template_name, and returns the fragment for the fragment cache: the
+    rendered results_html with the values the rest of the results page needs (the views run it in
+    the thread pool, as rendering up to 1000 results would block the event loop). query is shown if
+    there are no results, otherwise Solr's query is. For the cited searches, num_page_contexts
+    is set if the citation contexts were grouped page by page, as numresults then counts the
+    citation contexts, not the results (groups) shown. """
+    if reslist == []:
+        return {'query': query, 'numresults': 0, 'num_page_results': 0, 'next_cursor': None,
+                'num_page_contexts': None, 'results_html': ''}
+    results, num_results, num_rows, query, next_cursor = reslist[:5]
+    # Only search_references_plus returns num_page_contexts
+    num_page_contexts = reslist[5] if len(reslist) > 5 else None
+    with instrumentation.timed('render') as timing:
+        results_html = render_to_string(template_name, {'results': results, 'offset': (page - 1) * num_rows})
+        timing.rows = len(results)
+    return {'query': query, 'numresults': num_results, 'num_page_results': len(results),
+            'next_cursor': next_cursor, 'num_page_contexts': num_page_contexts, 'results_html': results_html}
+
+def get_results_context(request, fragment, page, num_rows, cursor):
+    """ Returns the template context of a results page from its (possibly cached) fragment: the
+    rendered results, the no. of results and the pagination links for this request. """
+    num_page_contexts = fragment.get('num_page_contexts')
+    context = {'query': fragment['query'], 'numresults': fragment['numresults'], 'numrows': num_rows,
+               'num_page_results': fragment['num_page_results'],
+               # numresults counts citation contexts (not results) when they were grouped page by page
+               'numresults_are_contexts': num_page_contexts is not None,
+               'results_html': mark_safe(fragment['results_html'])}
+    if fragment['numresults'] != 0:
+        # The pages are counted in the unit of numresults
+        num_page_results = num_page_contexts if num_page_contexts is not None else fragment['num_page_results']
+        context.update(get_pagination_context(request, page, num_rows, fragment['numresults'],
+                                              num_page_results, cursor, fragment['next_cursor']))
+    return context
+
+def get_pagination_context(request, page, num_rows, num_results, num_page_results, cursor, next_cursor):
+    """ Returns the template context for the page/next links of a results page: page no.,
+    offset of the first result on the page (for the numbering), first/last result no. and
+    the urls of the previous and next pages. The next link carries the nextCursorMark returned
+    by Solr, so deep pages are fetched with cursorMark. The previous link only has the page
+    no. (Solr can't page backwards with a cursor), so it is only shown for shallow pages. """
+    offset = (page - 1) * num_rows
+    context = {'page': page, 'offset': offset, 'first_result': offset + 1,
+               'last_result': offset + num_page_results, 'previous_url': None, 'next_url': None}
+    # Solr returns the same cursorMark when there are no more results.
+    if offset + num_rows < num_results and (cursor is None or next_cursor != cursor):
+        params = request.GET.copy()
+        params['page'] = page + 1
+        if next_cursor is not None:
+            params['cursor'] = next_cursor
+        else:
+            params.pop('cursor', None)
+        context['next_url'] = '?' + params.urlencode()
+    if page > 1 and (page - 2) * num_rows < settings.SEARCH_DEEP_PAGING_START:
+        params = request.GET.copy()
+        params['page'] = page - 1
+        params.pop('cursor', None)
+        context['previous_url'] = '?' + params.urlencode()
+    return context
+
 def normalize_results(results):
     """ This func normalizes the published date and authors of metadata so that they are displayed in the right format.
     """
@@ -154,7 +284,8 @@ def normalize_date_phrase_search(results):
         result[5] = published_date
     return results
 
-def cited_author_serach(request):
+@search_error_page
+async def cited_author_serach(request):
      """ Implements  the cited author search by displaying a search form, checking for errors
      and rendering the results in the front-end."""
      # Check if the query field has already been populated. If so, send a get request to
@@ -171,16 +302,29 @@ def cited_author_serach(request):
              numrows = cleaned.get('numrows')
              if numrows is None:
                  numrows = 100
+             page = cleaned.get('page') or 1
+             cursor = cleaned.get('cursor') or None
              # Render the search results form
-             reslist = search_references_plus(query, numrows, 'authors')
-             if reslist == []:
-                 # No results found
-                 printdict = {'query': query, 'numresults': 0, 'results':[], 'numrows': numrows}
-             else:
-                 results, num_results, num_rows, query = reslist
-                 # Display only the query (remove the proximity symbol etc.)
-                 query = query[:query.rfind('"')+1]
-                 printdict = {'query': query, 'results':results, 'numrows': numrows, 'numresults': num_results}
+             polarity = cleaned.get('polarity') or None
+             key = await run_search(fragment_cache.make_key, 'cited_author', 'references_plus', query, 'proximity_authors',
+                                    numrows, page, cursor, polarity)
+             fragment = await get_fragment(key)
+             if fragment is None:
+                 # The polarity counts are fetched at the same time as the results
+                 reslist, polarity_counts = await asyncio.gather(
+                     run_search(search_references_plus, query, numrows, 'authors', page=page, cursor=cursor, polarity=polarity),
+                     run_search(get_polarity_counts, query, 0, 'authors'))
+                 fragment = await run_search(make_results_fragment, 'papersearchengine/citedauthorresultslist.html', reslist, query,
+                                             page, numrows)
+                 if reslist != []:
+                     # Display only the query (remove the proximity symbol etc.)
+                     fragment['query'] = fragment['query'][:fragment['query'].rfind('"')+1]
+                 fragment['polarity_counts'] = polarity_counts
+                 await store_fragment(key, fragment)
+             printdict = get_results_context(request, fragment, page, numrows, cursor)
+             printdict['polarity_facets'] = get_polarity_facets(request, fragment['polarity_counts'], polarity)
+             # The export link keeps the polarity filter
+             printdict['polarity'] = polarity
              return render(request, 'papersearchengine/citedauthorsearchresults.html', 
                            printdict)
      else:
@@ -188,7 +332,8 @@ def cited_author_serach(request):
      # Render empty form       
      return render(request, 'papersearchengine/citedauthorsearch.html', {'form':form})
 
-def cited_paper_search(request):
+@search_error_page
+async def cited_paper_search(request):
      """ Implements  the cited paper search by displaying a search form, checking for errors
      and rendering the results in the front-end."""
      # Check if the query field has already been populated. If so, send a get request to
@@ -205,22 +350,56 @@ def cited_paper_search(request):
              numrows = cleaned.get('numrows')
              if numrows is None:
                  numrows = 100
+             page = cleaned.get('page') or 1
+             cursor = cleaned.get('cursor') or None
              # Render the search results form
-             reslist = search_references_plus(query, numrows, 'title')
-             if reslist == []:
-                 # No results found
-                 printdict = {'query': query, 'numresults': 0, 'results':[], 'numrows': numrows}
-             else:
-                 results, num_results, num_rows, query = reslist
-                 # Display only the query (remove the proximity symbol etc.)
-                 query = query[:query.rfind('"')+1]
-                 printdict = {'query': query, 'results':results, 'numrows': numrows, 'numresults': num_results}
+             polarity = cleaned.get('polarity') or None
+             key = await run_search(fragment_cache.make_key, 'cited_paper', 'references_plus', query, 'proximity_title',
+                                    numrows, page, cursor, polarity)
+             fragment = await get_fragment(key)
+             if fragment is None:
+                 # The polarity counts are fetched at the same time as the results
+                 reslist, polarity_counts = await asyncio.gather(
+                     run_search(search_references_plus, query, numrows, 'title', page=page, cursor=cursor, polarity=polarity),
+                     run_search(get_polarity_counts, query, 0, 'title'))
+                 fragment = await run_search(make_results_fragment, 'papersearchengine/citedpaperresultslist.html', reslist, query,
+                                             page, numrows)
+                 if reslist != []:
+                     # Display only the query (remove the proximity symbol etc.)
+                     fragment['query'] = fragment['query'][:fragment['query'].rfind('"')+1]
+                 fragment['polarity_counts'] = polarity_counts
+                 await store_fragment(key, fragment)
+             printdict = get_results_context(request, fragment, page, numrows, cursor)
+             printdict['polarity_facets'] = get_polarity_facets(request, fragment['polarity_counts'], polarity)
+             # The export link keeps the polarity filter
+             printdict['polarity'] = polarity
              return render(request, 'papersearchengine/citedpapersearchresults.html', printdict)
      else:
          form=SearchCitedPaperForm()
      # Render empty form       
      return render(request, 'papersearchengine/citedpapersearch.html', {'form':form})
 
+def get_polarity_facets(request, polarity_counts, polarity):
+    """ Returns the template context for the polarity links of the cited paper/cited author results
+    pages: for each polarity, its emoji, the no. of citation contexts with it, whether the results
+    are filtered on it, and the url of the results filtered on it (or of all the results, if they
+    already are). Returns [] if the counts are unknown (polarity_counts is None). """
+    if polarity_counts is None:
+        return []
+    facets = []
+    for name, count in polarity_counts.items():
+        # Filtering starts again from the first page
+        params = request.GET.copy()
+        params.pop('page', None)
+        params.pop('cursor', None)
+        if name == polarity:
+            params.pop('polarity', None)
+        else:
+            params['polarity'] = name
+        facets.append({'name': name, 'sentiment': get_sentiment_mapping()[POLARITY_SYMBOLS[name]], 'count': count,
+                       'active': name == polarity, 'url': '?' + params.urlencode()})
+    return facets
+
 def change_dateformat_addoffsets_citation(results):
     """ Changes the date format for all the results from yyyy-mm-dd into Month dd, yyyy; """
     for result in results:
@@ -246,6 +425,143 @@ def change_dateformat_addoffsets_citation(results):
         result[2] = sentence_with_annotations
     return results
 
+async def universal_search(request):
+    """ Implements the universal search: the query is sent to all the searches at the same time,
+    and the top hits of each are rendered together. Each search gets UNIVERSAL_SEARCH_TIMEOUT
+    seconds, the ones which take longer are shown as skipped (partial results)."""
+    if request.method == 'GET' and request.GET.get('query'):
+        form = UniversalSearchForm(request.GET)
+        if form.is_valid():
+            cleaned = form.cleaned_data
+            query = cleaned.get('query')
+            numrows = cleaned.get('numrows')
+            if numrows is None:
+                numrows = settings.UNIVERSAL_SEARCH_TOP_HITS
+            # The author searches take a list of authors, like in author_search
+            authors = [author.strip() for author in query.split(';')]
+            # name -> (search function, args, kwargs), in the order of UNIVERSAL_SEARCH_CATEGORIES
+            searches = OrderedDict([('phrase', (search_sentences_plus, (query, numrows), {})),
+                                    ('title', (search_meta_titles, (query, numrows), {})),
+                                    ('author', (search_authors, (authors, numrows), {})),
+                                    ('cited_paper', (search_references_plus, (query, numrows, 'title'), {})),
+                                    ('cited_author', (search_references_plus, (query, numrows, 'authors'), {}))])
+            outcomes = await run_searches(searches, settings.UNIVERSAL_SEARCH_TIMEOUT)
+            categories = []
+            for name, (reslist, status) in outcomes.items():
+                heading, url_name = UNIVERSAL_SEARCH_CATEGORIES[name]
+                # Link to the full results of this search
+                params = QueryDict(mutable=True)
+                params['query'] = query
+                category = {'name': name, 'heading': heading, 'status': status, 'results': [], 'numresults': 0,
+                            'more_url': '{}?{}'.format(reverse(url_name), params.urlencode())}
+                if reslist:
+                    category['results'], category['numresults'] = reslist[0], reslist[1]
+                categories.append(category)
+            return render(request, 'papersearchengine/universalsearchresults.html',
+                          {'query': query, 'numrows': numrows, 'categories': categories})
+    else:
+        form = UniversalSearchForm()
+    # Render empty form
+    return render(request, 'papersearchengine/universalsearch.html', {'form': form})
+
+# Place in bibliographysearchresults.html where the entries are streamed
+BIBLIOGRAPHY_ENTRIES_MARKER = '<!-- bibliography entries -->'
+
+def bibliography_search(request):
+    """ Implements the bibliography search: the titles in an uploaded/pasted reference list are
+    resolved against metadata_plus and references_plus in batches. The results page is streamed,
+    each batch of entries is sent as soon as it has been resolved (under ASGI, each chunk of the page
+    is produced in a thread, see async_search.streaming_content)."""
+    if request.method == 'POST':
+        form = BibliographyForm(request.POST, request.FILES)
+        if form.is_valid():
+            cleaned = form.cleaned_data
+            titles = parse_bibliography(cleaned['bibliography'])
+            numentries = len(titles)
+            titles = titles[:settings.BIBLIOGRAPHY_MAX_ENTRIES]
+            numrows = cleaned.get('numrows')
+            if numrows is None:
+                numrows = settings.BIBLIOGRAPHY_CONTEXTS_PER_ENTRY
+            page = render_to_string('papersearchengine/bibliographysearchresults.html',
+                                    {'numentries': numentries, 'numresolved': len(titles), 'numrows': numrows,
+                                     'entries_marker': BIBLIOGRAPHY_ENTRIES_MARKER}, request)
+            head, tail = page.split(BIBLIOGRAPHY_ENTRIES_MARKER)
+            return StreamingHttpResponse(streaming_content(request, stream_bibliography_page(head, tail, titles, numrows)))
+    else:
+        form = BibliographyForm()
+    # Render empty form (or the form with its errors)
+    return render(request, 'papersearchengine/bibliographysearch.html',
+                  {'form': form, 'max_entries': settings.BIBLIOGRAPHY_MAX_ENTRIES})
+
+def stream_bibliography_page(head, tail, titles, numrows):
+    """ Yields the results page of the bibliography search: head, the entries as they are resolved, tail. """
+    yield head
+    try:
+        for number, entry in enumerate(resolve_bibliography(titles, numrows), 1):
+            paper = entry.paper
+            if paper is not None:
+                paper = paper._replace(published_date=format_display_date(paper.published_date))
+            contexts = [(context._replace(citing_published_date=format_display_date(context.citing_published_date)),
+                         get_sentiment_mapping()[polarity]) for context, polarity in zip(entry.contexts, entry.polarities)]
+            yield render_to_string('papersearchengine/bibliographyentry.html',
+                                   {'number': number, 'title': entry.title, 'paper': paper,
+                                    'num_contexts': entry.num_contexts, 'contexts': contexts})
+    except SolrError:
+        # The page has already been started: the error is shown in place of the remaining entries.
+        yield render_to_string('papersearchengine/bibliographyentry.html', {'error': True})
+    yield tail
+
+def export_search(request):
+    """ Queues an export of all the results of a search (run by the export worker, see
+    exports.py) and redirects to the status page of the export. The form can be prefilled
+    with the search_name, query and polarity GET parameters. """
+    if request.method == 'POST':
+        form = ExportForm(request.POST)
+        if form.is_valid():
+            cleaned = form.cleaned_data
+            job = ExportJob.objects.create(search_name=cleaned['search_name'], query=cleaned['query'],
+                                           file_format=cleaned['file_format'], max_results=cleaned.get('max_results'),
+                                           polarity=cleaned.get('polarity') or '')
+            return HttpResponseRedirect(reverse('exportstatus', args=[job.token]))
+    else:
+        form = ExportForm(initial={'search_name': request.GET.get('search_name', 'cited_author'),
+                                   'query': request.GET.get('query', ''),
+                                   'polarity': request.GET.get('polarity', '')})
+    return render(request, 'papersearchengine/exportsearch.html', {'form': form})
+
+def export_status(request, token):
+    """ Displays the progress of an export, and the download link once it is done. The page
+    refreshes itself while the export is queued or running. """
+    job = get_object_or_404(ExportJob, token=token)
+    return render(request, 'papersearchengine/exportstatus.html',
+                  {'job': job, 'progress': job.get_progress(),
+                   'refresh': job.status in ('queued', 'running')})
+
+def export_download(request, token):
+    """ Sends the file of a finished export. """
+    job = get_object_or_404(ExportJob, token=token, status='done')
+    try:
+        export_file = open(job.file_path, 'rb')
+    except OSError:
+        raise Http404("The export file no longer exists")
+    return FileResponse(export_file, as_attachment=True,
+                        filename='{}_export.{}'.format(job.search_name, job.file_format))
+
+def metrics(request):
+    """ Returns the latency histograms of the searches served by this process, per search type and
+    stage (see instrumentation.py), and the stats of the caches, the async search pool and the
+    citation model, as json. Only answered for the addresses in INSTRUMENTATION['METRICS_ALLOWED_IPS']. """
+    if request.META.get('REMOTE_ADDR') not in settings.INSTRUMENTATION['METRICS_ALLOWED_IPS']:
+        raise Http404("Not found")
+    return JsonResponse({'searches': instrumentation.get_metrics(),
+                         'latency_buckets_ms': instrumentation.LATENCY_BUCKETS_MS,
+                         'result_cache': result_cache.get_stats(),
+                         'prediction_cache': prediction_cache.get_stats(),
+                         'fragment_cache': fragment_cache.get_stats(),
+                         'suggestions': suggestions.get_stats(),
+                         'async_search': async_search.get_stats(),
+                         'citation_model': model_registry.get_model_info()})
+
 def about(request):
     """ Displays an About Us page. """
     return render(
@@ -0,0 +1,29 @@
+"""
+ASGI config for scientificpaperoperations project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+The search views are async, so that a slow Solr query doesn't hold a worker
+(needs Django >= 3.1). Run it with an ASGI server, e.g.
+uvicorn scientificpaperoperations.asgi:application --workers 4
+
+For more information on this file, see
+https://docs.djangoproject.com/en/3.1/howto/deployment/asgi/
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "scientificpaperoperations.settings")
+
+application = get_asgi_application()
+
+# With CITATION_MODEL_PRELOAD=1, import the heavy dependencies and load the citation model now,
+# so that the workers of a pre-forking server which loads the app in the master (e.g. gunicorn
+# --preload) don't each pay for them on their first search (see papersearchengine/preload.py).
+# By default, the model is loaded on the first search which needs it.
+from django.conf import settings
+
+if settings.CITATION_MODEL_PRELOAD:
+    from papersearchengine.preload import preload
+    preload()
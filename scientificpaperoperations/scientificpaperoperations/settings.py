@@ -41,6 +41,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'papersearchengine.middleware.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -119,3 +120,214 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/2.0/howto/static-files/
 
 STATIC_URL = '/static/'
+
+
+# Citation polarity model (see papersearchengine/model_registry.py)
+# The pipeline is loaded once per process on first use, and reloaded only when the artifact
+# changes on disk. With CITATION_MODEL_PRELOAD (off by default, turned on with the environment
+# variable CITATION_MODEL_PRELOAD=1, e.g. for gunicorn --preload), the WSGI/ASGI application
+# loads it (and imports scikit-learn and emoji) at startup instead; manage.py commands never load it.
+
+CITATION_MODEL_PATH = os.path.join(BASE_DIR, 'papersearchengine', 'citation_model_pipeline.joblib')
+
+CITATION_MODEL_PRELOAD = os.environ.get('CITATION_MODEL_PRELOAD', '') == '1'
+
+
+# Solr client (see papersearchengine/solr_client.py)
+# One pooled keep-alive session is used per process. Timeouts are in seconds, and only
+# selects (GETs) are retried.
+
+SOLR_URL = 'http://localhost:8983/solr/'
+
+SOLR_POOL_SIZE = 10
+
+SOLR_CONNECT_TIMEOUT = 3.05
+
+SOLR_READ_TIMEOUT = 60
+
+SOLR_MAX_RETRIES = 3
+
+SOLR_BACKOFF_FACTOR = 0.3
+
+# Send every select with debug=timing, so that the time of each search component is recorded
+# (see INSTRUMENTATION below). Adds some work in Solr: only for investigating slow searches.
+SOLR_DEBUG_TIMING = False
+
+
+# Result cache (see papersearchengine/result_cache.py)
+# Caches the post-processed results of the searches. BACKEND is 'lru' (per process, at most
+# MAX_ENTRIES entries) or 'django' (the cache in CACHES named CACHE_ALIAS). Entries expire
+# after TTL seconds, and are invalidated when the Solr index version changes (checked at most
+# every INDEX_VERSION_CHECK_INTERVAL seconds).
+
+RESULT_CACHE = {
+    'ENABLED': True,
+    'BACKEND': 'lru',
+    'MAX_ENTRIES': 500,
+    'TTL': 600,
+    'CACHE_ALIAS': 'default',
+    'INDEX_VERSION_CHECK_INTERVAL': 30,
+}
+
+
+# Fragment cache (see papersearchengine/fragment_cache.py)
+# Caches the rendered results of the results pages (with the no. of results, next cursor and
+# polarity counts), so that a repeated search for the same page skips Solr and the rendering
+# of the results. BACKEND is 'lru' (per process, evicting the least recently used fragments
+# beyond MAX_ENTRIES fragments or MAX_BYTES bytes of html) or 'django' (the cache in CACHES
+# named CACHE_ALIAS). Fragments bigger than MAX_FRAGMENT_BYTES are not cached. Entries expire
+# after TTL seconds, and are invalidated when the Solr index version changes.
+
+FRAGMENT_CACHE = {
+    'ENABLED': True,
+    'BACKEND': 'lru',
+    'MAX_ENTRIES': 200,
+    'MAX_BYTES': 64 * 1024 * 1024,
+    'MAX_FRAGMENT_BYTES': 4 * 1024 * 1024,
+    'TTL': 600,
+    'CACHE_ALIAS': 'default',
+}
+
+
+# Typeahead suggestions (see papersearchengine/suggestions.py)
+# The title, author, cited paper and cited author forms get suggestions from a prefix index
+# built from the Solr collections by 'manage.py build_suggestions' (run it after indexing, or
+# with --watch to rebuild it whenever an index changes) and saved in INDEX_PATH. Each
+# dictionary keeps the MAX_ENTRIES entries with the most papers. Suggestions start after
+# MIN_PREFIX_LENGTH characters. Servers reload the file (checked every RELOAD_CHECK_INTERVAL
+# seconds) when it is rebuilt.
+
+SUGGESTIONS = {
+    'INDEX_PATH': os.path.join(BASE_DIR, 'suggestions.pickle'),
+    'MAX_ENTRIES': 200000,
+    'MIN_PREFIX_LENGTH': 2,
+    'RELOAD_CHECK_INTERVAL': 10,
+}
+
+
+# Pagination of the search results
+# Pages after the first are fetched with Solr's cursorMark when they are reached through the
+# 'next' links. A 'previous' link (which uses start) is only shown for pages whose start is
+# below SEARCH_DEEP_PAGING_START.
+
+SEARCH_DEEP_PAGING_START = 1000
+
+
+# Grouping of the citation contexts in the cited paper/cited author searches
+# 'solr': result grouping on the citation_group field of references_plus (exactly numrows
+# groups per page, with at most CITATION_GROUP_LIMIT sentences each), 'python': group the
+# fetched citation contexts in Python. 'solr' falls back to 'python' if the index doesn't
+# have the citation_group field.
+
+CITATION_GROUPING = 'solr'
+
+CITATION_GROUP_LIMIT = 100
+
+
+# Async search views (see papersearchengine/async_search.py, needs Django >= 3.1)
+# The search views are async: the searches run in a per-process thread pool with at most
+# SEARCH_MAX_CONCURRENCY searches (Solr requests) in flight, so that it should not be higher
+# than SOLR_POOL_SIZE. Serve the app with asgi.py to handle more concurrent requests than
+# there are workers.
+
+ASGI_APPLICATION = 'scientificpaperoperations.asgi.application'
+
+SEARCH_MAX_CONCURRENCY = SOLR_POOL_SIZE
+
+
+# Universal search (all the searches at once, see views.universal_search)
+# Each search gets UNIVERSAL_SEARCH_TIMEOUT seconds; the ones which take longer are left
+# out of the results page. UNIVERSAL_SEARCH_TOP_HITS results are shown per search by default.
+
+UNIVERSAL_SEARCH_TIMEOUT = 5
+
+UNIVERSAL_SEARCH_TOP_HITS = 5
+
+
+# Search API (see papersearchengine/api.py)
+# API_DEFAULT_ROWS results are returned per page in json format if numrows isn't given. In
+# ndjson format, the results are fetched from Solr API_STREAM_PAGE_SIZE at a time.
+
+API_DEFAULT_ROWS = 100
+
+API_STREAM_PAGE_SIZE = 500
+
+# Batch searches (api/v1/batch/<search>/): at most API_BATCH_MAX_QUERIES queries per request.
+# They are sent to Solr BATCH_QUERY_CHUNK_SIZE at a time (1 group.query each), with up to
+# BATCH_MAX_PARALLEL_REQUESTS requests at the same time.
+
+API_BATCH_DEFAULT_ROWS = 10
+
+API_BATCH_MAX_QUERIES = 1000
+
+BATCH_QUERY_CHUNK_SIZE = 50
+
+BATCH_MAX_PARALLEL_REQUESTS = 4
+
+
+# Bibliography search (see papersearchengine/bibliography.py)
+# At most BIBLIOGRAPHY_MAX_ENTRIES titles are resolved per reference list, with
+# BIBLIOGRAPHY_CONTEXTS_PER_ENTRY citation contexts per title by default.
+
+BIBLIOGRAPHY_MAX_ENTRIES = 500
+
+BIBLIOGRAPHY_CONTEXTS_PER_ENTRY = 5
+
+
+# Export jobs (see papersearchengine/exports.py)
+# The export worker (python manage.py run_export_worker) writes the files into EXPORT_DIR,
+# fetching the results from Solr EXPORT_PAGE_SIZE at a time, and checks for new jobs every
+# EXPORT_POLL_INTERVAL seconds. A running job without progress for EXPORT_STALE_TIMEOUT seconds
+# (its worker died) is requeued, and failed once it has been claimed EXPORT_MAX_ATTEMPTS times.
+
+EXPORT_DIR = os.path.join(BASE_DIR, 'exports')
+
+EXPORT_PAGE_SIZE = 1000
+
+EXPORT_POLL_INTERVAL = 5
+
+EXPORT_STALE_TIMEOUT = 600
+
+EXPORT_MAX_ATTEMPTS = 3
+
+
+# Prediction cache (see papersearchengine/prediction_cache.py)
+# Caches the citation polarity predicted for each sentence, keyed by the model version (hash
+# of the artifact), so that a new model invalidates it. At most MAX_ENTRIES predictions are
+# kept per process; if SQLITE_PATH is set, they are also stored in that SQLite database,
+# which is shared by the processes and survives restarts (None: in-process only). The SQLite
+# database keeps the predictions of every model version: remove the old ones with
+# manage.py prune_prediction_cache --old-versions (after a deploy) or --max-age DAYS.
+
+PREDICTION_CACHE = {
+    'ENABLED': True,
+    'MAX_ENTRIES': 100000,
+    'SQLITE_PATH': os.path.join(BASE_DIR, 'prediction_cache.sqlite3'),
+}
+
+
+# Instrumentation (see papersearchengine/instrumentation.py and middleware.py)
+# The stage timings of each search (Solr round trip, Solr's QTime, json parsing, grouping,
+# sentiment, model, rendering) are sent in a Server-Timing header (SERVER_TIMING), logged as
+# json on the papersearchengine.performance logger (LOG) and added to the latency histograms
+# of /searchengine/metrics/, which only answers the addresses in METRICS_ALLOWED_IPS.
+# Streaming responses (NDJSON API, bibliography) are timed until their last chunk has been
+# sent, and have no Server-Timing header.
+
+INSTRUMENTATION = {
+    'ENABLED': True,
+    'SERVER_TIMING': True,
+    'LOG': True,
+    'METRICS_ALLOWED_IPS': ['127.0.0.1', '::1'],
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'papersearchengine.performance': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
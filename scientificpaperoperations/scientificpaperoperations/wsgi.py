@@ -14,3 +14,13 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "scientificpaperoperations.settings")
 
 application = get_wsgi_application()
+
+# With CITATION_MODEL_PRELOAD=1, import the heavy dependencies and load the citation model now,
+# so that the workers of a pre-forking server which loads the app in the master (e.g. gunicorn
+# --preload) don't each pay for them on their first search (see papersearchengine/preload.py).
+# By default, the model is loaded on the first search which needs it.
+from django.conf import settings
+
+if settings.CITATION_MODEL_PRELOAD:
+    from papersearchengine.preload import preload
+    preload()